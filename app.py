@@ -1,7 +1,9 @@
-from flask import Flask, send_from_directory
+import click
+from flask import Flask, send_from_directory, request, g
 from config import config
 from extensions import jwt
-from utils.excel_db import ExcelDatabase
+from utils.database import create_database
+from utils.excel_db import enable_copy_on_write
 import os
 
 # 创建全局excel_db对象
@@ -23,14 +25,39 @@ def create_app(config_name='development'):
     # 初始化扩展
     jwt.init_app(app)
 
-    # 初始化Excel数据库
+    # pandas写时复制是进程级的选项，在应用启动时设置一次: 开启后读取的表为缓存的浅拷贝，修改时才复制
+    if app.config.get('PANDAS_COPY_ON_WRITE'):
+        enable_copy_on_write()
+
+    # 初始化数据库(根据DB_BACKEND选择Excel或SQLite存储引擎)
     global excel_db
-    excel_db = ExcelDatabase(app.config['EXCEL_DB_PATH'])
+    excel_db = create_database(app.config)
 
     # 导入路由模块并传递excel_db
     from routes import register_blueprints
     register_blueprints(app, excel_db)
 
+    # GET请求在整个请求期间读取同一个数据版本，不等待进行中的写入
+    @app.before_request
+    def pin_db_version():
+        if request.method == 'GET':
+            g.db_pin = excel_db.pin()
+
+    @app.teardown_request
+    def release_db_version(exc):
+        db_pin = g.pop('db_pin', None)
+        if db_pin is not None:
+            db_pin.close()
+
+    # 在线备份: flask backup [--output 备份文件路径]
+    @app.cli.command('backup')
+    @click.option('--output', default=None, help='备份文件路径，默认保存在DB_BACKUP_DIR中')
+    def backup_command(output):
+        """把数据库的当前版本备份为zip压缩包，不需要停止服务"""
+        from utils.db_backup import backup_database
+        result = backup_database(excel_db, output, app.config['DB_BACKUP_DIR'])
+        click.echo(f"已备份版本 {result['version']} 到 {result['path']}: {result['tables']}")
+
     # 添加静态文件访问路由
     @app.route('/static/avatars/<filename>')
     def serve_avatar(filename):
@@ -14,9 +14,53 @@ class Config:
     WECHAT_APPID = os.environ.get('WECHAT_APPID') or 'wx5b8e829cfe54a728'
     WECHAT_SECRET = os.environ.get('WECHAT_SECRET') or 'b3a446fe4b088bea12ff549b4dcccd38'
     
+    # 数据库存储引擎: excel 或 sqlite
+    DB_BACKEND = os.environ.get('DB_BACKEND') or 'excel'
+    
     # Excel数据库路径
     EXCEL_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data/database.xlsx')
     
+    # Excel数据库操作日志: 开启后写入只追加到 <EXCEL_DB_PATH>.journal，由后台线程合并到Excel
+    EXCEL_DB_JOURNAL = (os.environ.get('EXCEL_DB_JOURNAL') or '').lower() in ('1', 'true', 'yes')
+    # 日志合并间隔(秒)和触发立即合并的日志大小(字节)
+    EXCEL_DB_COMPACT_INTERVAL = int(os.environ.get('EXCEL_DB_COMPACT_INTERVAL') or 60)
+    EXCEL_DB_COMPACT_MAX_BYTES = int(os.environ.get('EXCEL_DB_COMPACT_MAX_BYTES') or 1024 * 1024)
+    # 在 <EXCEL_DB_PATH>.snapshots 中保存各sheet的二进制快照，加快启动和缓存失效后的加载
+    EXCEL_DB_SNAPSHOTS = (os.environ.get('EXCEL_DB_SNAPSHOTS') or '1').lower() in ('1', 'true', 'yes')
+    # 以Arrow格式保存快照、内存映射加载的表(逗号分隔，需要pyarrow)，gunicorn的多个worker共享同一份数据，
+    # 数值、日期和没有空值的文本列都不再各自复制，有空值或混合类型的列仍由每个worker各自保存，例如:
+    # EXCEL_DB_SHARED_TABLES=recipes,ingredients,recipe_ingredients
+    EXCEL_DB_SHARED_TABLES = [name.strip() for name in (os.environ.get('EXCEL_DB_SHARED_TABLES') or '').split(',')
+                              if name.strip()]
+    
+    # SQLite数据库路径(DB_BACKEND为sqlite时使用)，可通过 python -m utils.sqlite_db 从Excel迁移
+    SQLITE_DB_PATH = os.environ.get('SQLITE_DB_PATH') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data/database.db')
+    
+    # 每个worker进程一次预留的自增ID数量，序列保存在 <数据库文件>.seq.json
+    # 大于1时可减少多worker插入时的锁竞争，但ID不再严格按创建顺序递增
+    DB_ID_BLOCK_SIZE = int(os.environ.get('DB_ID_BLOCK_SIZE') or 1)
+    
+    # user_ingredients的分区数，大于1时按user_id的哈希值分散保存在 <数据库文件>.partitions/ 下的多个文件中，
+    # 单个用户的读写只涉及一个分区。开启或修改分区数后第一次启动时自动迁移已有数据
+    DB_USER_PARTITIONS = int(os.environ.get('DB_USER_PARTITIONS') or 0)
+    
+    # 写入合并窗口(毫秒)，大于0时由单独的写入线程提交写入，窗口内的多个写入合并为一次保存，
+    # 写入方法在修改写入日志或文件后返回
+    DB_WRITE_COALESCE_MS = int(os.environ.get('DB_WRITE_COALESCE_MS') or 0)
+    
+    # 开启pandas写时复制模式(pandas 1.5+)，read_table等返回缓存表的浅拷贝，修改时才复制数据；
+    # 关闭时返回深拷贝。该选项对整个进程中的pandas生效(包括不使用数据库的代码)，在create_app中设置一次
+    PANDAS_COPY_ON_WRITE = (os.environ.get('PANDAS_COPY_ON_WRITE') or '0').lower() in ('1', 'true', 'yes')
+    
+    # 距过期不超过该天数(且未过期)的食材视为临期食材
+    INGREDIENT_EXPIRING_DAYS = int(os.environ.get('INGREDIENT_EXPIRING_DAYS') or 3)
+    
+    # 在线备份(flask backup和备份接口)的默认目录
+    DB_BACKUP_DIR = os.environ.get('DB_BACKUP_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data/backups')
+    # 管理员的JWT用户标识(users表中的user_id，逗号分隔)，可以调用 /api/v1/admin 下的接口(在线备份等)
+    ADMIN_USER_IDS = [user_id.strip() for user_id in (os.environ.get('ADMIN_USER_IDS') or '').split(',')
+                      if user_id.strip()]
+    
     # 豆包视觉模型API配置
     DOUBAO_API_KEY = os.environ.get('DOUBAO_API_KEY') or 'a5e37fec-4801-4f9b-bb04-fe12621f3cb7'
     DOUBAO_API_URL = 'https://ark.cn-beijing.volces.com/api/v3/chat/completions'
@@ -0,0 +1,88 @@
+from functools import wraps
+from flask import jsonify, current_app
+from flask_jwt_extended import jwt_required
+from services.backup_service import BackupService
+from utils.jwt_utils import get_request_identity
+
+def admin_required(view):
+    """
+    只允许管理员访问的接口，需要放在@jwt_required()之后
+    
+    管理员为配置ADMIN_USER_IDS中的JWT用户标识，其他用户返回403
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        identity = get_request_identity()
+        if identity is None or identity.jwt_user_id not in current_app.config.get('ADMIN_USER_IDS', []):
+            current_app.logger.warning(f"用户 {identity} 没有管理员权限")
+            return jsonify({
+                'code': 403,
+                'message': '没有管理员权限',
+                'data': None
+            }), 403
+        return view(*args, **kwargs)
+    return wrapper
+
+class AdminController:
+    """管理控制器"""
+    
+    def __init__(self, excel_db):
+        self.backup_service = BackupService(excel_db)
+    
+    def init_routes(self, blueprint):
+        """初始化路由"""
+        blueprint.route('/backup', methods=['POST'])(self.start_backup)
+        blueprint.route('/backup/<job_id>', methods=['GET'])(self.get_backup_status)
+    
+    @jwt_required()
+    @admin_required
+    def start_backup(self):
+        """在后台开始在线备份，返回备份任务ID"""
+        try:
+            identity = get_request_identity()
+            job_id = self.backup_service.start(current_app.config['DB_BACKUP_DIR'])
+            current_app.logger.info(f"管理员 {identity.jwt_user_id} 开始备份数据库，任务ID: {job_id}")
+            
+            return jsonify({
+                'code': 202,
+                'message': '已开始备份',
+                'data': {
+                    'job_id': job_id,
+                    'status': 'running'
+                }
+            }), 202
+        
+        except Exception as e:
+            current_app.logger.error(f"开始备份失败: {str(e)}")
+            return jsonify({
+                'code': 500,
+                'message': f"开始备份失败: {str(e)}",
+                'data': None
+            }), 500
+    
+    @jwt_required()
+    @admin_required
+    def get_backup_status(self, job_id):
+        """查询备份任务的状态，完成时返回备份文件路径"""
+        try:
+            status = self.backup_service.status(job_id)
+            if status is None:
+                return jsonify({
+                    'code': 404,
+                    'message': '备份任务不存在',
+                    'data': None
+                }), 404
+            
+            return jsonify({
+                'code': 200,
+                'message': '获取备份状态成功',
+                'data': status
+            })
+        
+        except Exception as e:
+            current_app.logger.error(f"获取备份状态失败: {str(e)}")
+            return jsonify({
+                'code': 500,
+                'message': f"获取备份状态失败: {str(e)}",
+                'data': None
+            }), 500
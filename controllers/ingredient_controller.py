@@ -1,6 +1,7 @@
 from flask import jsonify, Blueprint, current_app, request
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required
 from services.ingredient_service import IngredientService
+from utils.jwt_utils import get_request_identity
 from datetime import datetime
 
 class IngredientController:
@@ -22,12 +23,13 @@ class IngredientController:
     def get_ingredient_stats(self):
         """获取用户食材库存统计"""
         try:
-            # 获取当前用户ID (从JWT获取的身份标识)
-            jwt_identity = get_jwt_identity()
+            # 获取当前请求的用户身份 (@jwt_required已验证并解码令牌)
+            identity = get_request_identity()
+            jwt_identity = identity.jwt_user_id
             current_app.logger.info(f"用户JWT标识: {jwt_identity} 请求食材库存统计")
             
             # 获取食材库存统计
-            stats = self.ingredient_service.get_ingredient_stats(jwt_identity)
+            stats = self.ingredient_service.get_ingredient_stats(identity)
             
             # 日志输出统计结果
             current_app.logger.info(f"用户 {jwt_identity} 的食材统计: 新鲜食材 {stats['fresh_count']} 种, 临期食材 {stats['expiring_count']} 种, 过期食材 {stats['expired_count']} 种")
@@ -56,12 +58,13 @@ class IngredientController:
     def get_most_expiring_ingredient(self):
         """获取用户最快过期的食材"""
         try:
-            # 获取当前用户ID (从JWT获取的身份标识)
-            jwt_identity = get_jwt_identity()
+            # 获取当前请求的用户身份 (@jwt_required已验证并解码令牌)
+            identity = get_request_identity()
+            jwt_identity = identity.jwt_user_id
             current_app.logger.info(f"用户JWT标识: {jwt_identity} 请求最快过期的食材信息")
             
             # 获取最快过期的食材
-            ingredient = self.ingredient_service.get_most_expiring_ingredient(jwt_identity)
+            ingredient = self.ingredient_service.get_most_expiring_ingredient(identity)
             
             # 如果没有找到食材
             if ingredient is None:
@@ -100,12 +103,13 @@ class IngredientController:
     def get_top_expiring_ingredients(self):
         """获取用户最快过期的最多5个食材"""
         try:
-            # 获取当前用户ID (从JWT获取的身份标识)
-            jwt_identity = get_jwt_identity()
+            # 获取当前请求的用户身份 (@jwt_required已验证并解码令牌)
+            identity = get_request_identity()
+            jwt_identity = identity.jwt_user_id
             current_app.logger.info(f"用户JWT标识: {jwt_identity} 请求最快过期的多个食材信息")
             
             # 获取最快过期的最多5个食材
-            ingredients = self.ingredient_service.get_top_expiring_ingredients(jwt_identity)
+            ingredients = self.ingredient_service.get_top_expiring_ingredients(identity)
             
             # 如果没有找到食材
             if not ingredients:
@@ -141,12 +145,13 @@ class IngredientController:
     def get_all_ingredients(self):
         """获取用户的所有食材"""
         try:
-            # 获取当前用户ID (从JWT获取的身份标识)
-            jwt_identity = get_jwt_identity()
+            # 获取当前请求的用户身份 (@jwt_required已验证并解码令牌)
+            identity = get_request_identity()
+            jwt_identity = identity.jwt_user_id
             current_app.logger.info(f"用户JWT标识: {jwt_identity} 请求所有食材信息")
             
             # 获取所有食材
-            ingredients = self.ingredient_service.get_all_ingredients(jwt_identity)
+            ingredients = self.ingredient_service.get_all_ingredients(identity)
             
             # 如果没有找到食材
             if not ingredients:
@@ -182,12 +187,13 @@ class IngredientController:
     def delete_ingredient(self, ingredient_id):
         """删除用户的指定食材"""
         try:
-            # 获取当前用户ID (从JWT获取的身份标识)
-            jwt_identity = get_jwt_identity()
+            # 获取当前请求的用户身份 (@jwt_required已验证并解码令牌)
+            identity = get_request_identity()
+            jwt_identity = identity.jwt_user_id
             current_app.logger.info(f"用户JWT标识: {jwt_identity} 请求删除食材(ID: {ingredient_id})")
             
             # 删除食材
-            result = self.ingredient_service.delete_ingredient(jwt_identity, ingredient_id)
+            result = self.ingredient_service.delete_ingredient(identity, ingredient_id)
             
             # 如果删除失败
             if not result:
@@ -220,8 +226,9 @@ class IngredientController:
     def update_ingredient(self, ingredient_id):
         """更新用户的指定食材信息"""
         try:
-            # 获取当前用户ID (从JWT获取的身份标识)
-            jwt_identity = get_jwt_identity()
+            # 获取当前请求的用户身份 (@jwt_required已验证并解码令牌)
+            identity = get_request_identity()
+            jwt_identity = identity.jwt_user_id
             current_app.logger.info(f"用户JWT标识: {jwt_identity} 请求更新食材(ID: {ingredient_id})信息")
             
             # 获取请求体数据
@@ -270,7 +277,7 @@ class IngredientController:
                     }), 400
             
             # 更新食材信息
-            result = self.ingredient_service.update_ingredient(jwt_identity, ingredient_id, quantity, expiry_date)
+            result = self.ingredient_service.update_ingredient(identity, ingredient_id, quantity, expiry_date)
             
             # 如果更新失败
             if result is None:
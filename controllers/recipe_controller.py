@@ -1,8 +1,9 @@
 from flask import jsonify, current_app
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required
 from services.recipe_service import RecipeService
 from repositories.recipe_repository import RecipeRepository
 from services.recipe_detail_service import RecipeDetailService
+from utils.jwt_utils import get_request_identity
 
 class RecipeController:
     """菜谱控制器类"""
@@ -91,15 +92,15 @@ class RecipeController:
         try:
             current_app.logger.info(f"请求菜谱ID: {recipe_id} 的详情(带用户库存)")
             
-            # 从JWT中获取用户身份标识
-            jwt_user_id = get_jwt_identity()
-            if jwt_user_id:
-                current_app.logger.info(f"当前用户JWT标识: {jwt_user_id}，将检查食材库存状态")
+            # 获取当前请求的用户身份 (@jwt_required已验证并解码令牌)
+            identity = get_request_identity()
+            if identity:
+                current_app.logger.info(f"当前用户JWT标识: {identity.jwt_user_id}，将检查食材库存状态")
             else:
                 current_app.logger.warning("未获取到有效的用户JWT标识，不检查库存状态")
             
-            # 获取菜谱详情，传入JWT用户ID
-            recipe = self.recipe_detail_service.get_recipe_detail(recipe_id, jwt_user_id)
+            # 获取菜谱详情，传入用户身份
+            recipe = self.recipe_detail_service.get_recipe_detail(recipe_id, identity)
             
             if recipe is None:
                 current_app.logger.warning(f"未找到ID为 {recipe_id} 的菜谱")
@@ -1,5 +1,7 @@
 from flask import request, jsonify, current_app
+from flask_jwt_extended import jwt_required
 from services.recipe_matching_service import RecipeMatchingService
+from utils.jwt_utils import get_request_identity
 
 class RecipeMatchingController:
     """基于过期食材匹配菜谱的控制器"""
@@ -23,17 +25,12 @@ class RecipeMatchingController:
         """
         blueprint.route('/match-expiring', methods=['GET'])(self.match_recipes_by_expiring_ingredients)
     
+    @jwt_required()
     def match_recipes_by_expiring_ingredients(self):
         """处理基于过期食材匹配菜谱的请求"""
         try:
-            token = request.headers.get('Authorization', '')
-            if not token:
-                current_app.logger.warning("请求中缺少Authorization令牌")
-                return jsonify({
-                    "code": 401,
-                    "message": "未授权的请求",
-                    "data": None
-                }), 401
+            # 获取当前请求的用户身份 (@jwt_required已验证并解码令牌)
+            identity = get_request_identity()
             
             # 从查询参数获取可选配置
             top_n = request.args.get('top_n', default=5, type=int)
@@ -49,7 +46,7 @@ class RecipeMatchingController:
             
             # 调用服务进行菜谱匹配
             matched_recipes = self.recipe_matching_service.match_recipes_by_expiring_ingredients(
-                token, top_n=top_n, recipe_count=recipe_count
+                identity, top_n=top_n, recipe_count=recipe_count
             )
             
             if not matched_recipes:
@@ -1,6 +1,7 @@
 from flask import jsonify, request, Blueprint, current_app
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required
 from services.recommendation_service import RecommendationService
+from utils.jwt_utils import get_request_identity
 
 class RecommendationController:
     """菜谱推荐控制器"""
@@ -16,16 +17,17 @@ class RecommendationController:
     def get_recipe_recommendations(self):
         """获取菜谱推荐"""
         try:
-            # 获取当前用户ID (从JWT获取的身份标识)
-            jwt_identity = get_jwt_identity()
+            # 获取当前请求的用户身份 (@jwt_required已验证并解码令牌)
+            identity = get_request_identity()
+            jwt_identity = identity.jwt_user_id
             current_app.logger.info(f"用户JWT标识: {jwt_identity} 请求菜谱推荐")
             
             # 获取推荐数量参数，默认为10
             limit = request.args.get('limit', 10, type=int)
             current_app.logger.info(f"推荐数量设置为: {limit}")
             
-            # 获取推荐菜谱，将JWT身份标识传递给服务层处理
-            recommendations = self.recommendation_service.recommend_recipes(jwt_identity, limit)
+            # 获取推荐菜谱，将用户身份传递给服务层处理
+            recommendations = self.recommendation_service.recommend_recipes(identity, limit)
             
             # 日志输出推荐结果
             if recommendations:
@@ -1,5 +1,5 @@
 from flask_jwt_extended import JWTManager
-from utils.excel_db import ExcelDatabase
+from utils.database import create_database
 
 # 初始化扩展
 jwt = JWTManager()
@@ -8,5 +8,5 @@ excel_db = None  # 将在应用初始化时设置
 def init_excel_db(app):
     """初始化Excel数据库"""
     global excel_db
-    excel_db = ExcelDatabase(app.config['EXCEL_DB_PATH'])
+    excel_db = create_database(app.config)
     return excel_db 
\ No newline at end of file
@@ -0,0 +1,28 @@
+import os
+
+# gunicorn配置: gunicorn -c gunicorn.conf.py "app:create_app()"
+bind = os.environ.get('GUNICORN_BIND') or '0.0.0.0:5000'
+workers = int(os.environ.get('GUNICORN_WORKERS') or 4)
+
+
+def on_starting(server):
+    """master进程启动时发布共享表(EXCEL_DB_SHARED_TABLES)的Arrow快照，worker直接映射，不再各自解析Excel"""
+    from config import config
+    from utils.database import create_database
+    
+    config_class = config[os.environ.get('FLASK_CONFIG') or 'default']
+    settings = {key: getattr(config_class, key) for key in dir(config_class) if key.isupper()}
+    if not settings.get('EXCEL_DB_SHARED_TABLES'):
+        return
+    
+    # master进程只发布快照: 不合并日志(由worker负责)、不启动写入线程，也不打开分区(分区迁移由worker完成)，
+    # 发布后关闭，fork出的worker不继承后台线程和打开的数据库
+    settings['EXCEL_DB_COMPACT_INTERVAL'] = None
+    settings['DB_WRITE_COALESCE_MS'] = 0
+    settings['DB_USER_PARTITIONS'] = 0
+    db = create_database(settings)
+    try:
+        published = db.publish_shared_tables()
+    finally:
+        db.close()
+    server.log.info("已发布共享表快照: %s", ', '.join(published) or '无')
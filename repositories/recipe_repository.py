@@ -18,11 +18,7 @@ class RecipeRepository:
     
     def find_by_id(self, recipe_id):
         """根据ID获取菜谱"""
-        recipes_df = self.excel_db.read_table('recipes')
-        if recipes_df.empty:
-            return None
-        
-        recipe = recipes_df[recipes_df['id'] == recipe_id]
+        recipe = self.excel_db.get_by('recipes', 'id', recipe_id)
         if recipe.empty:
             return None
         
@@ -30,18 +26,11 @@ class RecipeRepository:
     
     def create(self, recipe):
         """创建新菜谱"""
-        recipes_df = self.excel_db.read_table('recipes')
-        
         # 准备菜谱数据
         recipe_dict = recipe.to_dict()
         
         # 生成ID
-        if recipes_df.empty:
-            new_id = 1
-        else:
-            new_id = recipes_df['id'].max() + 1
-        
-        recipe_dict['id'] = new_id
+        recipe_dict['id'] = self.excel_db.next_id('recipes')
         
         # 添加时间戳
         now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
@@ -50,54 +39,25 @@ class RecipeRepository:
         if not recipe_dict.get('updated_at'):
             recipe_dict['updated_at'] = now
         
-        # 添加到DataFrame
-        new_row = pd.DataFrame([recipe_dict])
-        recipes_df = pd.concat([recipes_df, new_row], ignore_index=True)
-        
-        # 保存到Excel
-        self.excel_db.write_table('recipes', recipes_df)
+        # 只追加新行
+        self.excel_db.add_row('recipes', recipe_dict)
         
         return Recipe.from_dict(recipe_dict)
     
     def update(self, recipe_id, update_data):
         """更新菜谱信息"""
-        recipes_df = self.excel_db.read_table('recipes')
-        if recipes_df.empty:
-            return None
-        
-        # 查找菜谱
-        recipe_idx = recipes_df[recipes_df['id'] == recipe_id].index
-        if len(recipe_idx) == 0:
-            return None
-        
         # 更新时间戳
         update_data['updated_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         
-        # 更新菜谱数据
-        for key, value in update_data.items():
-            recipes_df.loc[recipe_idx[0], key] = value
-        
-        # 保存到Excel
-        self.excel_db.write_table('recipes', recipes_df)
+        # 只更新该菜谱所在的行
+        updated = self.excel_db.update_rows('recipes', {'id': recipe_id}, update_data, limit=1)
+        if updated is None or updated.empty:
+            return None
         
         # 返回更新后的菜谱信息
-        return Recipe.from_dict(recipes_df.loc[recipe_idx[0]].to_dict())
+        return Recipe.from_dict(updated.iloc[0].to_dict())
     
     def delete(self, recipe_id):
         """删除菜谱"""
-        recipes_df = self.excel_db.read_table('recipes')
-        if recipes_df.empty:
-            return False
-        
-        # 查找菜谱
-        recipe_idx = recipes_df[recipes_df['id'] == recipe_id].index
-        if len(recipe_idx) == 0:
-            return False
-        
-        # 删除菜谱
-        recipes_df = recipes_df.drop(recipe_idx)
-        
-        # 保存到Excel
-        self.excel_db.write_table('recipes', recipes_df)
-        
-        return True 
\ No newline at end of file
+        # 删除菜谱，没有找到时返回False
+        return bool(self.excel_db.delete_rows('recipes', {'id': recipe_id})) 
\ No newline at end of file
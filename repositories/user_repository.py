@@ -11,11 +11,7 @@ class UserRepository:
     
     def find_by_openid(self, openid):
         """根据openid查找用户"""
-        users_df = self.excel_db.read_table('users')
-        if users_df.empty:
-            return None
-            
-        user = users_df[users_df['openid'] == openid]
+        user = self.excel_db.get_by('users', 'openid', openid)
         if user.empty:
             return None
             
@@ -23,11 +19,7 @@ class UserRepository:
     
     def find_by_user_id(self, user_id):
         """根据user_id查找用户"""
-        users_df = self.excel_db.read_table('users')
-        if users_df.empty:
-            return None
-        
-        user_row = users_df[users_df['user_id'] == user_id]
+        user_row = self.excel_db.get_by('users', 'user_id', user_id)
         if user_row.empty:
             return None
         
@@ -35,18 +27,11 @@ class UserRepository:
     
     def create(self, user):
         """创建新用户"""
-        users_df = self.excel_db.read_table('users')
-        
         # 准备用户数据
         user_dict = user.to_dict()
         
         # 生成ID
-        if users_df.empty:
-            new_id = 1
-        else:
-            new_id = users_df['id'].max() + 1
-        
-        user_dict['id'] = new_id
+        user_dict['id'] = self.excel_db.next_id('users')
         
         # 添加时间戳
         now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
@@ -55,35 +40,20 @@ class UserRepository:
         if not user_dict.get('updated_at'):
             user_dict['updated_at'] = now
         
-        # 添加到DataFrame
-        new_row = pd.DataFrame([user_dict])
-        users_df = pd.concat([users_df, new_row], ignore_index=True)
-        
-        # 保存到Excel
-        self.excel_db.write_table('users', users_df)
+        # 只追加新行
+        self.excel_db.add_row('users', user_dict)
         
         return User.from_dict(user_dict)
     
     def update(self, openid, update_data):
         """更新用户信息"""
-        users_df = self.excel_db.read_table('users')
-        if users_df.empty:
-            return None
-        
-        # 查找用户
-        user_idx = users_df[users_df['openid'] == openid].index
-        if len(user_idx) == 0:
-            return None
-        
         # 更新时间戳
         update_data['updated_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         
-        # 更新用户数据
-        for key, value in update_data.items():
-            users_df.loc[user_idx[0], key] = value
-        
-        # 保存到Excel
-        self.excel_db.write_table('users', users_df)
+        # 只更新该用户所在的行
+        updated = self.excel_db.update_rows('users', {'openid': openid}, update_data, limit=1)
+        if updated is None or updated.empty:
+            return None
         
         # 返回更新后的用户信息
-        return User.from_dict(users_df.loc[user_idx[0]].to_dict()) 
\ No newline at end of file
+        return User.from_dict(updated.iloc[0].to_dict()) 
\ No newline at end of file
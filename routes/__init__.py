@@ -3,6 +3,7 @@ from routes.recipe import create_recipe_blueprint
 from routes.recommendation import create_recommendation_blueprint
 from routes.ingredient import create_ingredient_blueprint
 from routes.food_vision import create_food_vision_blueprint
+from routes.admin import create_admin_blueprint
 
 def register_blueprints(app, excel_db):
     """注册所有蓝图"""
@@ -24,4 +25,8 @@ def register_blueprints(app, excel_db):
     
     # 创建食物视觉识别蓝图并传入excel_db
     food_vision_bp = create_food_vision_blueprint(excel_db)
-    app.register_blueprint(food_vision_bp, url_prefix='/api/v1/food-vision') 
\ No newline at end of file
+    app.register_blueprint(food_vision_bp, url_prefix='/api/v1/food-vision') 
+    
+    # 创建管理蓝图并传入excel_db
+    admin_bp = create_admin_blueprint(excel_db)
+    app.register_blueprint(admin_bp, url_prefix='/api/v1/admin')
\ No newline at end of file
@@ -0,0 +1,20 @@
+from flask import Blueprint
+from controllers.admin_controller import AdminController
+
+def create_admin_blueprint(excel_db):
+    """
+    创建管理蓝图
+    
+    Args:
+        excel_db: Excel数据库实例
+    
+    Returns:
+        Blueprint: Flask蓝图对象
+    """
+    admin_bp = Blueprint('admin', __name__)
+    
+    # 初始化管理控制器
+    admin_controller = AdminController(excel_db)
+    admin_controller.init_routes(admin_bp)
+    
+    return admin_bp
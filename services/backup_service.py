@@ -0,0 +1,66 @@
+import uuid
+import threading
+from utils.db_backup import start_backup
+
+class BackupService:
+    """在线备份服务"""
+    
+    def __init__(self, excel_db, backup_dir=None):
+        """
+        Args:
+            excel_db: 数据库实例
+            backup_dir: 备份目录，默认使用配置中的DB_BACKUP_DIR
+        """
+        self.excel_db = excel_db
+        self.backup_dir = backup_dir
+        # 备份任务 {任务ID: Future}，只保存在当前worker进程中
+        self._jobs = {}
+        self._lock = threading.Lock()
+    
+    def start(self, backup_dir=None):
+        """
+        在后台线程中开始备份
+        
+        Args:
+            backup_dir: 备份目录，不传时使用创建服务时的目录
+        
+        Returns:
+            str: 备份任务ID，用于查询备份结果
+        """
+        future = start_backup(self.excel_db, backup_dir=backup_dir or self.backup_dir)
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._jobs[job_id] = future
+        return job_id
+    
+    def status(self, job_id):
+        """
+        查询备份任务的状态
+        
+        任务只记录在开始备份的worker进程中，多worker部署时其他worker查询不到
+        
+        Args:
+            job_id: 备份任务ID
+        
+        Returns:
+            dict: 任务状态(running/done/failed)，完成时包含备份文件路径、版本号和各表行数；
+                  任务不存在时返回None
+        """
+        with self._lock:
+            future = self._jobs.get(job_id)
+        if future is None:
+            return None
+        
+        if not future.done():
+            return {'job_id': job_id, 'status': 'running'}
+        error = future.exception()
+        if error is not None:
+            return {'job_id': job_id, 'status': 'failed', 'error': str(error)}
+        result = future.result()
+        return {
+            'job_id': job_id,
+            'status': 'done',
+            'path': result['path'],
+            'version': result['version'],
+            'tables': result['tables']
+        }
@@ -0,0 +1,209 @@
+import bisect
+import threading
+import weakref
+import numpy as np
+import pandas as pd
+
+
+class ExpiryIndex:
+    """
+    按用户维护的食材过期日期有序索引
+    
+    每个用户的已设置过期日期的食材按(过期日期, 行id, 食材id)排序保存，第一次查询该用户时
+    从user_ingredients表建立。之后通过表修改事件增量维护：insert/update/delete事件只重新
+    读取涉及的行(按id)并在各用户的有序列表中删除、插入对应条目，不再扫描和排序整个库存；
+    整表替换和其他worker的修改(replace事件)使所有索引失效，下次查询时重建。查询时还会比较
+    索引对应的表版本和当前的表版本，没有收到事件的修改同样会使索引重建。
+    """
+    
+    def __init__(self, excel_db):
+        """
+        初始化索引并订阅user_ingredients表的修改事件
+        
+        Args:
+            excel_db: 数据库实例
+        """
+        self.excel_db = excel_db
+        # {用户id: [(过期时间(纳秒), 行id, 食材id, 数量), ...]}，按元组顺序排列
+        self._entries = {}
+        # {行id: 包含该行的已建立索引的用户id集合}，user_ingredients的id并不唯一
+        self._users_by_row = {}
+        self._lock = threading.RLock()
+        # 每次收到修改事件时递增，建立索引期间表被修改时不保存建立的结果
+        self._generation = 0
+        # {用户id: 建立该用户的索引时的表版本}，分区存储时只是用户所在分区的版本(见table_version)
+        self._versions = {}
+        excel_db.subscribe(self._on_change, 'user_ingredients')
+    
+    def top(self, db_user_id, limit=None, offset=0):
+        """
+        获取用户最快过期的食材，只复制需要的条目
+        
+        Args:
+            db_user_id: users表中的用户id(主键)
+            limit: 返回的数量上限，为None时返回全部
+            offset: 跳过最快过期的前offset个食材
+        
+        Returns:
+            list: [(过期日期(Timestamp), 行id, 食材id, 数量)]，按过期日期从近到远排列，
+                不包含没有设置过期日期的食材
+        """
+        end = None if limit is None else offset + max(int(limit), 0)
+        entries = self._user_entries(db_user_id)
+        with self._lock:
+            entries = entries[offset:end]
+        return [(pd.Timestamp(expiry_ns), row_id, ingredient_id, quantity)
+                for expiry_ns, row_id, ingredient_id, quantity in entries]
+    
+    def _user_entries(self, db_user_id):
+        """用户的有序条目列表，不存在时建立；返回的列表在持有锁时才能读取"""
+        # 与用户的索引对应的表版本比较，其他worker修改过库存等原因导致版本不一致时重新建立该用户的
+        # 索引，不只依赖修改事件；分区存储时只比较用户所在分区的版本，其他分区的修改没有影响
+        table_version = self.excel_db.table_version('user_ingredients', user_id=db_user_id)
+        with self._lock:
+            if db_user_id in self._versions and self._versions[db_user_id] != table_version:
+                self._discard_user(db_user_id)
+            entries = self._entries.get(db_user_id)
+            if entries is not None:
+                return entries
+            generation = self._generation
+        
+        with self.excel_db.unpinned():
+            rows = self.excel_db.get_by('user_ingredients', 'user_id', db_user_id)
+        entries = sorted(_entries_from_rows(rows))
+        
+        with self._lock:
+            if generation == self._generation:
+                self._entries[db_user_id] = entries
+                self._versions[db_user_id] = table_version
+                for entry in entries:
+                    self._users_by_row.setdefault(entry[1], set()).add(db_user_id)
+        return entries
+    
+    def invalidate(self):
+        """清空所有用户的索引"""
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._users_by_row.clear()
+            self._versions.clear()
+    
+    def _discard_user(self, db_user_id):
+        """删除一个用户的索引，下次查询时重新建立"""
+        with self._lock:
+            self._generation += 1
+            self._versions.pop(db_user_id, None)
+            for entry in self._entries.pop(db_user_id, ()):
+                users = self._users_by_row.get(entry[1])
+                if users is not None:
+                    users.discard(db_user_id)
+                    if not users:
+                        del self._users_by_row[entry[1]]
+    
+    def _on_change(self, event):
+        """user_ingredients表修改事件: 按行id增量更新，无法确定涉及的行时清空索引"""
+        if event.keys is None:
+            self.invalidate()
+            return
+        
+        with self._lock:
+            self._generation += 1
+            if not self._entries:
+                return
+            row_ids = set(event.keys)
+            changed_users = set()
+            # 先删除这些行在各用户索引中的旧条目
+            for row_id in row_ids:
+                for user_id in self._users_by_row.pop(row_id, ()):
+                    changed_users.add(user_id)
+                    entries = self._entries.get(user_id)
+                    if entries is not None:
+                        entries[:] = [entry for entry in entries if entry[1] != row_id]
+            
+            # 再按这些行的当前数据插入已建立索引的用户中
+            with self.excel_db.unpinned():
+                rows = self.excel_db.select('user_ingredients', where={'id': list(row_ids)})
+            if not rows.empty and 'user_id' in rows.columns:
+                for user_id, entry in zip(rows['user_id'].tolist(), _entries_from_rows(rows, keep_position=True)):
+                    entries = self._entries.get(user_id)
+                    if entries is None or entry is None:
+                        continue
+                    bisect.insort(entries, entry)
+                    self._users_by_row.setdefault(entry[1], set()).add(user_id)
+                    changed_users.add(user_id)
+            # 索引已包含本次修改
+            _update_versions(self.excel_db, self._versions, changed_users)
+
+
+def _update_versions(excel_db, versions, user_ids):
+    """
+    修改事件已应用到派生数据后更新记录的表版本
+    
+    涉及的用户更新为当前版本，记录的版本与它们相同的其他用户(不分区时为所有用户，分区时为
+    同一分区的用户)一起更新；无法确定的用户保留原版本，下次查询时重新建立
+    
+    Args:
+        excel_db: 数据库实例
+        versions: {用户id: 表版本}，原地修改
+        user_ids: 修改涉及的已建立派生数据的用户id
+    """
+    current = {}
+    for user_id in user_ids:
+        old = versions.get(user_id)
+        if old is not None and old not in current:
+            current[old] = excel_db.table_version('user_ingredients', user_id=user_id)
+    if current:
+        for user_id, version in list(versions.items()):
+            if version in current:
+                versions[user_id] = current[version]
+
+
+def _entries_from_rows(rows, keep_position=False):
+    """
+    把user_ingredients的行转换为索引条目
+    
+    Args:
+        rows: user_ingredients表的行
+        keep_position: 为True时每行返回一个结果，没有过期日期的行为None；否则只返回有过期日期的条目
+    
+    Returns:
+        list: 索引条目
+    """
+    if rows.empty or 'expiry_date' not in rows.columns:
+        return [None] * len(rows) if keep_position else []
+    expiry = pd.to_datetime(rows['expiry_date'], errors='coerce').to_numpy(dtype='datetime64[ns]')
+    has_date = ~np.isnat(expiry)
+    expiry_ns = expiry.astype(np.int64).tolist()
+    row_ids = rows['id'].tolist() if 'id' in rows.columns else [None] * len(rows)
+    ingredient_ids = rows['ingredient_id'].tolist() if 'ingredient_id' in rows.columns else [None] * len(rows)
+    quantities = rows['quantity'].tolist() if 'quantity' in rows.columns else [None] * len(rows)
+    entries = []
+    for position in range(len(rows)):
+        if has_date[position]:
+            entries.append((expiry_ns[position], row_ids[position], ingredient_ids[position], quantities[position]))
+        elif keep_position:
+            entries.append(None)
+    return entries
+
+
+# 每个数据库实例共用一个索引: {数据库实例: ExpiryIndex}
+_indexes = weakref.WeakKeyDictionary()
+_indexes_lock = threading.Lock()
+
+
+def get_expiry_index(excel_db):
+    """
+    获取数据库实例对应的过期日期索引，不存在时创建
+    
+    Args:
+        excel_db: 数据库实例
+    
+    Returns:
+        ExpiryIndex: 过期日期索引
+    """
+    with _indexes_lock:
+        index = _indexes.get(excel_db)
+        if index is None:
+            index = ExpiryIndex(excel_db)
+            _indexes[excel_db] = index
+        return index
@@ -0,0 +1,246 @@
+import threading
+import weakref
+from collections import Counter
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from utils.expiry_utils import DEFAULT_EXPIRING_DAYS, FRESH, EXPIRING, EXPIRED, classify_expiry
+from services.expiry_index import _update_versions
+
+
+class InventorySummary:
+    """
+    按用户物化的食材库存汇总: 食材数量、新鲜/临期/过期数量和最早的过期日期
+    
+    每个用户的汇总在第一次查询时从user_ingredients表建立，保存各过期日期的食材数量和按
+    汇总日期划分的各状态数量。之后通过表修改事件增量维护：insert/update/delete事件只重新
+    读取涉及的行(按id)，从汇总中减去旧行、加上新行；整表替换和其他worker的修改(replace事件)
+    使所有汇总失效，下次查询时重建；查询时还会比较汇总对应的表版本和当前的表版本，没有收到
+    事件的修改同样会使汇总重建。保质期状态取决于当天的日期，查询时日期或临期天数与汇总
+    时不同的，按各过期日期的数量重新划分状态，不需要重新读取库存。
+    """
+    
+    def __init__(self, excel_db):
+        """
+        初始化汇总并订阅user_ingredients表的修改事件
+        
+        Args:
+            excel_db: 数据库实例
+        """
+        self.excel_db = excel_db
+        # {用户id: 汇总状态}，见_new_state
+        self._users = {}
+        # {行id: [(用户id, 过期日期(自1970-01-01的天数，没有过期日期为None)), ...]}，
+        # 只记录已建立汇总的用户的行，user_ingredients的id并不唯一
+        self._rows = {}
+        self._lock = threading.RLock()
+        # 每次收到修改事件时递增，建立汇总期间表被修改时不保存建立的结果
+        self._generation = 0
+        # {用户id: 建立该用户的汇总时的表版本}，分区存储时只是用户所在分区的版本(见table_version)
+        self._versions = {}
+        excel_db.subscribe(self._on_change, 'user_ingredients')
+    
+    def summary(self, db_user_id, expiring_days=DEFAULT_EXPIRING_DAYS, today=None):
+        """
+        获取用户的食材库存汇总
+        
+        Args:
+            db_user_id: users表中的用户id(主键)
+            expiring_days: 临期天数
+            today: 今天的日期，为None时使用当前日期
+        
+        Returns:
+            dict: {'item_count': 食材数量, 'fresh_count': 新鲜数量, 'expiring_count': 临期数量,
+                'expired_count': 过期数量, 'earliest_expiry': 最早的过期日期(Timestamp)，没有设置
+                过期日期的食材时为None}
+        """
+        today = np.datetime64(today or datetime.now().date(), 'D')
+        state = self._user_state(db_user_id)
+        with self._lock:
+            if state['today'] != today or state['expiring_days'] != expiring_days:
+                # 跨天或临期天数改变后第一次查询，重新划分状态
+                _rebucket(state, today, expiring_days)
+            counts = state['counts']
+            earliest = state['earliest']
+            return {
+                'item_count': state['item_count'],
+                'fresh_count': counts[FRESH],
+                'expiring_count': counts[EXPIRING],
+                'expired_count': counts[EXPIRED],
+                'earliest_expiry': None if earliest is None else pd.Timestamp(np.datetime64(earliest, 'D'))
+            }
+    
+    def _user_state(self, db_user_id):
+        """用户的汇总状态，不存在时建立；返回的状态在持有锁时才能读取"""
+        # 与用户的汇总对应的表版本比较，其他worker修改过库存等原因导致版本不一致时重新建立该用户的
+        # 汇总，不只依赖修改事件；分区存储时只比较用户所在分区的版本，其他分区的修改没有影响
+        table_version = self.excel_db.table_version('user_ingredients', user_id=db_user_id)
+        with self._lock:
+            if db_user_id in self._versions and self._versions[db_user_id] != table_version:
+                self._discard_user(db_user_id)
+            state = self._users.get(db_user_id)
+            if state is not None:
+                return state
+            generation = self._generation
+        
+        with self.excel_db.unpinned():
+            rows = self.excel_db.get_by('user_ingredients', 'user_id', db_user_id)
+        state = _new_state()
+        row_days = _days_from_rows(rows)
+        for day in row_days:
+            _add(state, day, 1)
+        
+        with self._lock:
+            if generation == self._generation:
+                self._users[db_user_id] = state
+                self._versions[db_user_id] = table_version
+                row_ids = rows['id'].tolist() if 'id' in rows.columns else []
+                for row_id, day in zip(row_ids, row_days):
+                    self._rows.setdefault(row_id, []).append((db_user_id, day))
+        return state
+    
+    def invalidate(self):
+        """清空所有用户的汇总"""
+        with self._lock:
+            self._generation += 1
+            self._users.clear()
+            self._rows.clear()
+            self._versions.clear()
+    
+    def _discard_user(self, db_user_id):
+        """删除一个用户的汇总，下次查询时重新建立"""
+        with self._lock:
+            self._generation += 1
+            self._versions.pop(db_user_id, None)
+            if self._users.pop(db_user_id, None) is None:
+                return
+            for row_id in list(self._rows):
+                entries = [entry for entry in self._rows[row_id] if entry[0] != db_user_id]
+                if entries:
+                    self._rows[row_id] = entries
+                else:
+                    del self._rows[row_id]
+    
+    def _on_change(self, event):
+        """user_ingredients表修改事件: 按行id增量更新，无法确定涉及的行时清空汇总"""
+        if event.keys is None:
+            self.invalidate()
+            return
+        
+        with self._lock:
+            self._generation += 1
+            if not self._users:
+                return
+            row_ids = set(event.keys)
+            changed_users = set()
+            # 先从各用户的汇总中减去这些行的旧数据
+            for row_id in row_ids:
+                for user_id, day in self._rows.pop(row_id, ()):
+                    changed_users.add(user_id)
+                    state = self._users.get(user_id)
+                    if state is not None:
+                        _add(state, day, -1)
+            
+            # 再按这些行的当前数据加到已建立汇总的用户中
+            with self.excel_db.unpinned():
+                rows = self.excel_db.select('user_ingredients', where={'id': list(row_ids)})
+            if not rows.empty and 'user_id' in rows.columns:
+                for user_id, row_id, day in zip(rows['user_id'].tolist(), rows['id'].tolist(), _days_from_rows(rows)):
+                    state = self._users.get(user_id)
+                    if state is None:
+                        continue
+                    _add(state, day, 1)
+                    self._rows.setdefault(row_id, []).append((user_id, day))
+                    changed_users.add(user_id)
+            # 汇总已包含本次修改
+            _update_versions(self.excel_db, self._versions, changed_users)
+
+
+def _new_state():
+    """空的汇总状态"""
+    return {
+        # 食材数量(包括没有设置过期日期的食材)
+        'item_count': 0,
+        # {过期日期(天数): 食材数量}
+        'days': Counter(),
+        # 最早的过期日期(天数)，没有时为None
+        'earliest': None,
+        # counts按today和expiring_days划分，today为None时尚未划分
+        'today': None,
+        'expiring_days': None,
+        'counts': [0, 0, 0]
+    }
+
+
+def _add(state, day, sign):
+    """
+    在汇总中加上(sign为1)或减去(sign为-1)一个食材
+    
+    Args:
+        state: 汇总状态
+        day: 食材的过期日期(天数)，没有设置过期日期时为None
+        sign: 1或-1
+    """
+    state['item_count'] += sign
+    if day is None:
+        status = FRESH
+    else:
+        days = state['days']
+        days[day] += sign
+        if days[day] <= 0:
+            del days[day]
+        if sign > 0 and (state['earliest'] is None or day < state['earliest']):
+            state['earliest'] = day
+        elif sign < 0 and day == state['earliest'] and day not in days:
+            state['earliest'] = min(days) if days else None
+        if state['today'] is None:
+            return
+        status = classify_expiry(np.array([day], dtype='datetime64[D]'), state['expiring_days'], state['today'])[0]
+    state['counts'][status] += sign
+
+
+def _rebucket(state, today, expiring_days):
+    """按各过期日期的食材数量重新划分状态，计算量只与不同过期日期的数量有关"""
+    days = state['days']
+    dated_count = sum(days.values())
+    counts = [0, 0, 0]
+    if days:
+        status = classify_expiry(np.array(list(days), dtype='datetime64[D]'), expiring_days, today)
+        counts = np.bincount(status, weights=list(days.values()), minlength=3).astype(int).tolist()
+    # 没有设置过期日期的食材都是新鲜食材
+    counts[FRESH] += state['item_count'] - dated_count
+    state['counts'] = counts
+    state['today'] = today
+    state['expiring_days'] = expiring_days
+
+
+def _days_from_rows(rows):
+    """user_ingredients各行的过期日期(自1970-01-01的天数)，没有过期日期的为None"""
+    if rows.empty or 'expiry_date' not in rows.columns:
+        return [None] * len(rows)
+    expiry = pd.to_datetime(rows['expiry_date'], errors='coerce').to_numpy(dtype='datetime64[ns]')
+    days = expiry.astype('datetime64[D]').astype(np.int64).tolist()
+    return [day if has_date else None for day, has_date in zip(days, ~np.isnat(expiry))]
+
+
+# 每个数据库实例共用一个汇总: {数据库实例: InventorySummary}
+_summaries = weakref.WeakKeyDictionary()
+_summaries_lock = threading.Lock()
+
+
+def get_inventory_summary(excel_db):
+    """
+    获取数据库实例对应的食材库存汇总，不存在时创建
+    
+    Args:
+        excel_db: 数据库实例
+    
+    Returns:
+        InventorySummary: 食材库存汇总
+    """
+    with _summaries_lock:
+        summary = _summaries.get(excel_db)
+        if summary is None:
+            summary = InventorySummary(excel_db)
+            _summaries[excel_db] = summary
+        return summary
@@ -2,20 +2,24 @@ import pandas as pd
 import json
 from flask import current_app
 from models.recipe import Recipe
+from utils.jwt_utils import get_jwt_user_id
+from utils.value_utils import to_number
+from services.user_resolver import get_user_resolver
 
 class RecipeDetailService:
     """菜谱详情服务类"""
     
     def __init__(self, excel_db):
         self.excel_db = excel_db
+        self.user_resolver = get_user_resolver(excel_db)
     
-    def get_recipe_detail(self, recipe_id, jwt_user_id=None):
+    def get_recipe_detail(self, recipe_id, identity=None):
         """
         获取菜谱详情
         
         Args:
             recipe_id: 菜谱ID
-            jwt_user_id: JWT中的用户标识，对应users表中的user_id列，用于检查用户食材库存状态
+            identity: 当前请求的用户身份(RequestIdentity)或JWT用户标识，用于检查用户食材库存状态
             
         Returns:
             Recipe: 菜谱对象，包含详细信息
@@ -23,13 +27,8 @@ class RecipeDetailService:
         print(f"\n===== 获取菜谱ID: {recipe_id} 的详情 =====")
         
         # 1. 获取基本菜谱信息
-        recipes_df = self.excel_db.read_table('recipes')
-        if recipes_df.empty:
-            print("菜谱表为空")
-            return None
-        
         # 查找指定ID的菜谱
-        recipe_data = recipes_df[recipes_df['id'] == recipe_id]
+        recipe_data = self.excel_db.get_by('recipes', 'id', recipe_id)
         if recipe_data.empty:
             print(f"未找到ID为 {recipe_id} 的菜谱")
             return None
@@ -43,9 +42,9 @@ class RecipeDetailService:
         
         # 2. 获取菜谱食材信息
         # 如果提供了用户ID，则检查用户的食材库存状态
-        if jwt_user_id:
-            print(f"检查用户(JWT标识: {jwt_user_id})的食材库存状态")
-            ingredients = self._get_recipe_ingredients_with_stock_status(recipe_id, jwt_user_id)
+        if identity:
+            print(f"检查用户(JWT标识: {get_jwt_user_id(identity)})的食材库存状态")
+            ingredients = self._get_recipe_ingredients_with_stock_status(recipe_id, identity)
         else:
             ingredients = self._get_recipe_ingredients(recipe_id)
             
@@ -184,22 +183,14 @@ class RecipeDetailService:
         """获取菜谱所需食材"""
         ingredients = []
         
-        # 获取菜谱食材关联表
-        recipe_ingredients_df = self.excel_db.read_table('recipe_ingredients')
-        if recipe_ingredients_df.empty:
-            return ingredients
-        
-        # 筛选当前菜谱的食材关联记录
-        recipe_ingredients = recipe_ingredients_df[recipe_ingredients_df['recipe_id'] == recipe_id]
+        # 通过索引筛选当前菜谱的食材关联记录
+        recipe_ingredients = self.excel_db.get_by('recipe_ingredients', 'recipe_id', recipe_id)
         
-        # 获取食材表
-        ingredients_df = self.excel_db.read_table('ingredients')
-        
-        # 如果有食材记录，添加到列表中
-        if not ingredients_df.empty and not recipe_ingredients.empty:
+        # 如果有食材记录，添加到列表中(食材信息同样通过索引按ID查找)
+        if not recipe_ingredients.empty:
             for _, row in recipe_ingredients.iterrows():
                 ingredient_id = row['ingredient_id']
-                ingredient_data = ingredients_df[ingredients_df['id'] == ingredient_id]
+                ingredient_data = self.excel_db.get_by('ingredients', 'id', ingredient_id)
                 
                 if not ingredient_data.empty:
                     # 从ingredients表获取食材基本信息
@@ -207,11 +198,6 @@ class RecipeDetailService:
                     
                     # 尝试从recipe_ingredients表获取特定菜谱的数量信息
                     quantity = row.get('quantity', 0)
-                    # 确保数量是数值类型
-                    try:
-                        quantity = float(quantity) if isinstance(quantity, str) else quantity
-                    except (ValueError, TypeError):
-                        quantity = 0
                     
                     # 处理单位信息
                     # 首先尝试从recipe_ingredients表获取特定菜谱的单位
@@ -272,39 +258,31 @@ class RecipeDetailService:
         difficulty = recipe_dict.get('difficulty')
         
         # 根据卡路里生成标签
-        if calories is not None and pd.notna(calories):
-            # 确保卡路里是数值类型
-            try:
-                calories = float(calories) if isinstance(calories, str) else calories
-                if calories < 300:
-                    tags.append('低卡')
-                elif calories < 600:
-                    tags.append('中卡')
-                else:
-                    tags.append('高卡')
-            except (ValueError, TypeError):
-                print(f"卡路里格式错误: {calories}")
+        # 列中有无法转换的值(如"15分钟")时整列保持原类型，逐个转换为数值，无法转换的不生成标签
+        calories = to_number(calories)
+        if calories is not None:
+            if calories < 300:
+                tags.append('低卡')
+            elif calories < 600:
+                tags.append('中卡')
+            else:
+                tags.append('高卡')
         
         # 根据烹饪时长生成标签
-        if cook_time is not None and pd.notna(cook_time):
-            # 确保cook_time是数字
-            try:
-                cook_time = float(cook_time) if isinstance(cook_time, str) else cook_time
-                cook_time = int(cook_time)
-                if cook_time < 15:
-                    tags.append('快速料理')
-                elif cook_time < 30:
-                    tags.append('半小时内')
-                else:
-                    tags.append('耗时较长')
-            except (ValueError, TypeError):
-                print(f"烹饪时长格式错误: {cook_time}")
+        cook_time = to_number(cook_time)
+        if cook_time is not None:
+            if cook_time < 15:
+                tags.append('快速料理')
+            elif cook_time < 30:
+                tags.append('半小时内')
+            else:
+                tags.append('耗时较长')
         
         # 根据难度生成标签
         if difficulty is not None and pd.notna(difficulty):
             try:
                 # 尝试将难度转为整数（如果是数字表示）
-                if isinstance(difficulty, (int, float)) or (isinstance(difficulty, str) and difficulty.isdigit()):
+                if pd.api.types.is_number(difficulty) or (isinstance(difficulty, str) and difficulty.isdigit()):
                     difficulty_val = int(difficulty)
                     if difficulty_val <= 1:
                         tags.append('新手友好')
@@ -351,13 +329,13 @@ class RecipeDetailService:
             
         return ingredients
     
-    def _get_recipe_ingredients_with_stock_status(self, recipe_id, jwt_user_id):
+    def _get_recipe_ingredients_with_stock_status(self, recipe_id, identity):
         """
         获取菜谱所需食材并检查用户库存状态
         
         Args:
             recipe_id: 菜谱ID
-            jwt_user_id: JWT中的用户标识，对应users表中的user_id列
+            identity: 当前请求的用户身份(RequestIdentity)或JWT用户标识
             
         Returns:
             list: 食材列表，每个食材包含库存状态
@@ -369,51 +347,17 @@ class RecipeDetailService:
         if not ingredients:
             return []
             
-        # 1. 根据JWT中获取的user_id找到users表中对应的id
-        users_df = self.excel_db.read_table('users')
-        if users_df.empty:
-            print("用户表为空，无法获取用户信息")
-            # 返回原始食材列表，不添加库存状态
+        # 1. 根据JWT中获取的user_id找到users表中对应的id(主键)
+        jwt_user_id = get_jwt_user_id(identity)
+        db_user_id = self.user_resolver.resolve(identity)
+        if db_user_id is None:
+            print(f"在users表中未找到与JWT标识{jwt_user_id}匹配的用户记录，不添加库存状态")
             return ingredients
-        
-        # 确认users表中是否存在user_id列
-        if 'user_id' not in users_df.columns:
-            print(f"警告: users表中不存在'user_id'列！可用列: {users_df.columns.tolist()}")
-            return ingredients
-        
-        # 根据JWT中的user_id查找用户记录
-        user_record = users_df[users_df['user_id'] == jwt_user_id]
-        
-        if user_record.empty:
-            print(f"在users表中未找到user_id={jwt_user_id}的记录")
-            # 尝试其他可能的格式转换
-            if isinstance(jwt_user_id, str) and jwt_user_id.startswith('u_'):
-                # 尝试去掉前缀
-                user_id_without_prefix = jwt_user_id[2:]
-                user_record = users_df[users_df['user_id'] == user_id_without_prefix]
-                if not user_record.empty:
-                    print(f"通过去掉'u_'前缀找到用户记录")
-            
-            # 如果仍未找到记录，返回原始食材列表
-            if user_record.empty:
-                print(f"在users表中未找到与JWT标识匹配的用户记录，不添加库存状态")
-                return ingredients
-        
-        # 获取用户在数据库中的id (主键)
-        db_user_id = user_record.iloc[0]['id']
         print(f"找到用户(JWT标识={jwt_user_id})的数据库ID(主键): {db_user_id}")
         
         # 2. 获取用户食材库
-        user_ingredients_df = self.excel_db.read_table('user_ingredients')
-        if user_ingredients_df.empty:
-            print("用户食材库表为空，所有食材标记为库存不足")
-            # 所有食材标记为库存不足
-            for ingredient in ingredients:
-                ingredient['stock_status'] = 'insufficient'
-            return ingredients
-        
         # 使用数据库id(主键)筛选当前用户的食材
-        user_ingredients_df = user_ingredients_df[user_ingredients_df['user_id'] == db_user_id]
+        user_ingredients_df = self.excel_db.get_by('user_ingredients', 'user_id', db_user_id)
         if user_ingredients_df.empty:
             print(f"用户(JWT标识={jwt_user_id}, 数据库ID={db_user_id})没有食材，所有食材标记为库存不足")
             # 所有食材标记为库存不足
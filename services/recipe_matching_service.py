@@ -2,7 +2,7 @@ from flask import current_app
 from services.ingredient_service import IngredientService
 from services.recipe_service import RecipeService
 from repositories.recipe_repository import RecipeRepository
-from utils.jwt_utils import get_user_id_from_token
+from utils.jwt_utils import get_jwt_user_id
 import pandas as pd
 import numpy as np
 
@@ -22,12 +22,12 @@ class RecipeMatchingService:
         recipe_repository = RecipeRepository(excel_db)
         self.recipe_service = RecipeService(recipe_repository)
     
-    def match_recipes_by_expiring_ingredients(self, token, top_n=5, recipe_count=3):
+    def match_recipes_by_expiring_ingredients(self, identity, top_n=5, recipe_count=3):
         """
         基于用户最快过期的食材匹配菜谱
         
         Args:
-            token: JWT令牌
+            identity: 当前请求的用户身份(RequestIdentity)或JWT用户标识
             top_n: 考虑的最快过期食材数量，默认为5
             recipe_count: 返回的菜谱数量，默认为3
             
@@ -36,13 +36,10 @@ class RecipeMatchingService:
         """
         try:
             # 获取用户ID
-            user_id = get_user_id_from_token(token)
-            if not user_id:
-                current_app.logger.error("无法从令牌中获取用户ID")
-                return []
+            user_id = get_jwt_user_id(identity)
                 
             # 获取用户最快过期的食材
-            expiring_ingredients = self.ingredient_service.get_top_expiring_ingredients(token, limit=top_n)
+            expiring_ingredients = self.ingredient_service.get_top_expiring_ingredients(identity, limit=top_n)
             if not expiring_ingredients:
                 current_app.logger.info(f"用户 {user_id} 没有设置过期日期的食材")
                 return []
@@ -135,11 +132,8 @@ class RecipeMatchingService:
         """获取菜谱所需的食材列表"""
         try:
             current_app.logger.debug(f"获取菜谱ID={recipe_id}的食材列表")
-            recipe_ingredients_df = self.excel_db.read_table('recipe_ingredients')
-            ingredients_df = self.excel_db.read_table('ingredients')
-            
-            # 筛选指定菜谱的食材
-            recipe_ingredients = recipe_ingredients_df[recipe_ingredients_df['recipe_id'] == recipe_id]
+            # 通过索引筛选指定菜谱的食材
+            recipe_ingredients = self.excel_db.get_by('recipe_ingredients', 'recipe_id', recipe_id)
             
             if recipe_ingredients.empty:
                 current_app.logger.warning(f"菜谱ID={recipe_id}没有关联的食材")
@@ -149,7 +143,7 @@ class RecipeMatchingService:
             result = []
             for _, row in recipe_ingredients.iterrows():
                 ingredient_id = row['ingredient_id']
-                ingredient = ingredients_df[ingredients_df['id'] == ingredient_id]
+                ingredient = self.excel_db.get_by('ingredients', 'id', ingredient_id)
                 if not ingredient.empty:
                     result.append({
                         'id': ingredient_id,
@@ -2,69 +2,41 @@ import random
 import pandas as pd
 from flask import current_app
 from models.recipe import Recipe
+from utils.jwt_utils import get_jwt_user_id
+from utils.value_utils import to_number
+from services.user_resolver import get_user_resolver
 
 class RecommendationService:
     """菜谱推荐服务类"""
     
     def __init__(self, excel_db):
         self.excel_db = excel_db
+        self.user_resolver = get_user_resolver(excel_db)
     
-    def recommend_recipes(self, jwt_user_id, limit=10):
+    def recommend_recipes(self, identity, limit=10):
         """
         根据用户食材库为用户推荐菜谱
         
         Args:
-            jwt_user_id: JWT中的用户标识，对应users表中的user_id列
+            identity: 当前请求的用户身份(RequestIdentity)或JWT用户标识
             limit: 返回的菜谱数量上限
             
         Returns:
             list: 推荐的菜谱列表，每个菜谱包含匹配度信息
         """
+        jwt_user_id = get_jwt_user_id(identity)
         print(f"\n===== 开始为用户(JWT标识) {jwt_user_id} 推荐菜谱 =====")
         
-        # 0. 根据JWT中获取的user_id找到users表中对应的id
-        users_df = self.excel_db.read_table('users')
-        if users_df.empty:
-            print("用户表为空，无法获取用户信息")
+        # 0. 根据JWT中获取的user_id找到users表中对应的id(主键)
+        db_user_id = self.user_resolver.resolve(identity)
+        if db_user_id is None:
+            print(f"在users表中未找到与JWT标识{jwt_user_id}匹配的用户记录，返回随机推荐")
             return self._get_random_recipes(limit)
-        
-        print(f"用户表列名: {users_df.columns.tolist()}")
-        
-        # 确认users表中是否存在user_id列
-        if 'user_id' not in users_df.columns:
-            print(f"警告: users表中不存在'user_id'列！可用列: {users_df.columns.tolist()}")
-            return self._get_random_recipes(limit)
-        
-        # 根据JWT中的user_id查找用户记录
-        user_record = users_df[users_df['user_id'] == jwt_user_id]
-        
-        if user_record.empty:
-            print(f"在users表中未找到user_id={jwt_user_id}的记录")
-            # 尝试其他可能的格式转换
-            if isinstance(jwt_user_id, str) and jwt_user_id.startswith('u_'):
-                # 尝试去掉前缀
-                user_id_without_prefix = jwt_user_id[2:]
-                user_record = users_df[users_df['user_id'] == user_id_without_prefix]
-                if not user_record.empty:
-                    print(f"通过去掉'u_'前缀找到用户记录")
-            
-            # 如果仍未找到记录，返回随机推荐
-            if user_record.empty:
-                print(f"在users表中未找到与JWT标识匹配的用户记录，返回随机推荐")
-                return self._get_random_recipes(limit)
-        
-        # 获取用户在数据库中的id (主键)
-        db_user_id = user_record.iloc[0]['id']
         print(f"找到用户(JWT标识={jwt_user_id})的数据库ID(主键): {db_user_id}")
         
         # 1. 获取用户食材库
-        user_ingredients_df = self.excel_db.read_table('user_ingredients')
-        if user_ingredients_df.empty:
-            print("用户食材库表为空，返回随机推荐")
-            return self._get_random_recipes(limit)
-        
         # 使用数据库id(主键)筛选当前用户的食材
-        user_ingredients_df = user_ingredients_df[user_ingredients_df['user_id'] == db_user_id]
+        user_ingredients_df = self.excel_db.get_by('user_ingredients', 'user_id', db_user_id)
         if user_ingredients_df.empty:
             print(f"用户(JWT标识={jwt_user_id}, 数据库ID={db_user_id})没有食材，返回随机推荐")
             return self._get_random_recipes(limit)
@@ -182,7 +154,7 @@ class RecommendationService:
         # 7. 获取前N个菜谱详情
         result = []
         for recipe_id, match_info in sorted_recipes[:limit]:
-            recipe_data = recipes_df[recipes_df['id'] == recipe_id].iloc[0].to_dict()
+            recipe_data = self.excel_db.get_by('recipes', 'id', recipe_id).iloc[0].to_dict()
             
             # 创建Recipe对象
             recipe = Recipe.from_dict(recipe_data)
@@ -193,9 +165,10 @@ class RecommendationService:
             recipe_dict['matching_ingredients'] = match_info['matching_ingredients']
             recipe_dict['total_ingredients'] = match_info['total_ingredients']
 
-            # 确保cook_time是纯数字，不包含单位
-            if 'cook_time' in recipe_dict and recipe_dict['cook_time'] is not None:
-                recipe_dict['cook_time'] = int(recipe_dict['cook_time'])
+            # 确保cook_time是纯数字，不包含单位(列中有无法转换的值时整列保持原类型)
+            cook_time = to_number(recipe_dict.get('cook_time'))
+            if cook_time is not None:
+                recipe_dict['cook_time'] = int(cook_time)
             
             result.append(recipe_dict)
         
@@ -226,7 +199,7 @@ class RecommendationService:
         # 获取选中的菜谱详情
         result = []
         for recipe_id in selected_ids:
-            recipe_data = recipes_df[recipes_df['id'] == recipe_id].iloc[0].to_dict()
+            recipe_data = self.excel_db.get_by('recipes', 'id', recipe_id).iloc[0].to_dict()
             
             # 创建Recipe对象
             recipe = Recipe.from_dict(recipe_data)
@@ -240,8 +213,9 @@ class RecommendationService:
             recipe_dict['total_ingredients'] = 0
             
             # 确保cook_time是纯数字，不包含单位
-            if 'cook_time' in recipe_dict and recipe_dict['cook_time'] is not None:
-                recipe_dict['cook_time'] = int(recipe_dict['cook_time'])
+            cook_time = to_number(recipe_dict.get('cook_time'))
+            if cook_time is not None:
+                recipe_dict['cook_time'] = int(cook_time)
             
             result.append(recipe_dict)
         
@@ -0,0 +1,139 @@
+import time
+import threading
+import weakref
+from collections import OrderedDict
+from utils.jwt_utils import RequestIdentity
+
+
+class UserResolver:
+    """
+    JWT中的用户标识到users表主键id的解析服务
+    
+    解析结果保存在LRU缓存中，超过ttl秒后重新查询。本进程修改users表时通过修改事件
+    使相关的缓存失效；其他worker的修改在本进程重新加载users表时以replace事件通知，
+    最迟在ttl秒后生效。
+    """
+    
+    def __init__(self, excel_db, max_size=1024, ttl=300):
+        """
+        初始化解析服务并订阅users表的修改事件
+        
+        Args:
+            excel_db: 数据库实例
+            max_size: 缓存的最大条目数，超出时淘汰最久未使用的条目
+            ttl: 缓存条目的有效期(秒)
+        """
+        self.excel_db = excel_db
+        self.max_size = max_size
+        self.ttl = ttl
+        # {JWT用户标识: (users表主键id, 过期时间)}，按最近使用顺序排列
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        # 每次收到users表修改事件时递增，查询期间表被修改时不缓存查询结果
+        self._generation = 0
+        excel_db.subscribe(self._on_users_changed, 'users')
+    
+    def resolve(self, identity):
+        """
+        根据JWT中的用户标识获取users表的主键id
+        
+        先按users表的user_id列查找，找不到且标识以'u_'开头时去掉前缀再查找一次
+        
+        Args:
+            identity: 当前请求的用户身份(RequestIdentity)或JWT中的用户标识。传入RequestIdentity时
+                解析结果保存在其中，同一请求中的后续解析直接使用
+        
+        Returns:
+            users表中的id，找不到用户时返回None
+        """
+        if isinstance(identity, RequestIdentity):
+            if identity.db_user_id is None:
+                identity.db_user_id = self._resolve(identity.jwt_user_id)
+            return identity.db_user_id
+        return self._resolve(identity)
+    
+    def _resolve(self, jwt_user_id):
+        """通过缓存解析JWT用户标识，参数和返回值见resolve"""
+        now = time.monotonic()
+        with self._lock:
+            cached = self._cache.get(jwt_user_id)
+            if cached is not None and cached[1] > now:
+                self._cache.move_to_end(jwt_user_id)
+                return cached[0]
+            generation = self._generation
+        
+        db_user_id = self._lookup(jwt_user_id)
+        if db_user_id is None:
+            # 找不到的用户不缓存，注册后可以立即解析
+            return None
+        
+        with self._lock:
+            if generation != self._generation:
+                return db_user_id
+            self._cache[jwt_user_id] = (db_user_id, now + self.ttl)
+            self._cache.move_to_end(jwt_user_id)
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+        return db_user_id
+    
+    def _lookup(self, jwt_user_id):
+        """在users表中查找用户标识对应的主键id，找不到时返回None"""
+        user_record = self.excel_db.get_by('users', 'user_id', jwt_user_id)
+        if user_record.empty and isinstance(jwt_user_id, str) and jwt_user_id.startswith('u_'):
+            # 尝试去掉前缀
+            user_record = self.excel_db.get_by('users', 'user_id', jwt_user_id[2:])
+        if user_record.empty or 'id' not in user_record.columns:
+            return None
+        return user_record.iloc[0]['id']
+    
+    def invalidate(self, jwt_user_id=None):
+        """
+        使缓存失效
+        
+        Args:
+            jwt_user_id: JWT用户标识，为None时清空整个缓存
+        """
+        with self._lock:
+            if jwt_user_id is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(jwt_user_id, None)
+    
+    def _on_users_changed(self, event):
+        """
+        users表修改事件: 修改或删除用户时丢弃解析到这些用户的条目；
+        新增用户(可能改变去掉前缀后的匹配结果)或无法确定修改的行时清空缓存
+        """
+        with self._lock:
+            self._generation += 1
+        if event.op in ('update', 'delete') and event.keys is not None:
+            keys = set(event.keys)
+            with self._lock:
+                for jwt_user_id, (db_user_id, _) in list(self._cache.items()):
+                    if db_user_id in keys:
+                        del self._cache[jwt_user_id]
+        else:
+            self.invalidate()
+
+
+# 每个数据库实例共用一个解析服务: {数据库实例: UserResolver}
+_resolvers = weakref.WeakKeyDictionary()
+_resolvers_lock = threading.Lock()
+
+
+def get_user_resolver(excel_db):
+    """
+    获取数据库实例对应的用户解析服务，不存在时创建
+    
+    Args:
+        excel_db: 数据库实例
+    
+    Returns:
+        UserResolver: 用户解析服务
+    """
+    with _resolvers_lock:
+        resolver = _resolvers.get(excel_db)
+        if resolver is None:
+            resolver = UserResolver(excel_db)
+            _resolvers[excel_db] = resolver
+        return resolver
@@ -0,0 +1,54 @@
+import os
+import time
+import zipfile
+from unittest import mock
+from flask_jwt_extended import create_access_token
+from config import config
+from tests.test_excel_db import ExcelDatabaseTestCase
+
+
+class AdminBackupTest(ExcelDatabaseTestCase):
+    """管理员的在线备份接口"""
+    
+    def setUp(self):
+        super().setUp()
+        self.backup_dir = os.path.join(self.tmp_dir, 'backups')
+        patcher = mock.patch.multiple(config['testing'], EXCEL_DB_PATH=self.path, DB_BACKUP_DIR=self.backup_dir,
+                                      ADMIN_USER_IDS=['admin'], DB_USER_PARTITIONS=0, EXCEL_DB_JOURNAL=False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        
+        from app import create_app
+        self.app = create_app('testing')
+        self.client = self.app.test_client()
+    
+    def headers(self, user_id):
+        with self.app.app_context():
+            return {'Authorization': 'Bearer ' + create_access_token(identity=user_id)}
+    
+    def test_requires_admin(self):
+        """没有令牌返回401，不是管理员返回403"""
+        self.assertEqual(self.client.post('/api/v1/admin/backup').status_code, 401)
+        self.assertEqual(self.client.post('/api/v1/admin/backup', headers=self.headers('u1')).status_code, 403)
+        self.assertEqual(self.client.get('/api/v1/admin/backup/x', headers=self.headers('u1')).status_code, 403)
+        self.assertFalse(os.path.exists(self.backup_dir))
+    
+    def test_backup(self):
+        """开始备份返回任务ID，完成后可以查询到备份文件路径"""
+        headers = self.headers('admin')
+        response = self.client.post('/api/v1/admin/backup', headers=headers)
+        self.assertEqual(response.status_code, 202)
+        job_id = response.get_json()['data']['job_id']
+        
+        deadline = time.time() + 30
+        while True:
+            data = self.client.get(f'/api/v1/admin/backup/{job_id}', headers=headers).get_json()['data']
+            if data['status'] != 'running' or time.time() > deadline:
+                break
+            time.sleep(0.05)
+        
+        self.assertEqual(data['status'], 'done')
+        self.assertEqual(os.path.dirname(data['path']), self.backup_dir)
+        with zipfile.ZipFile(data['path']) as archive:
+            self.assertIn('manifest.json', archive.namelist())
+        self.assertEqual(self.client.get('/api/v1/admin/backup/x', headers=headers).status_code, 404)
@@ -0,0 +1,163 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+from utils.excel_db import ExcelDatabase
+from utils.table_journal import apply_table_ops
+from utils.table_schema import apply_schema
+
+
+# 测试用的表: 默认表之外加上用户食材库存相关的表
+TABLES = dict(ExcelDatabase.DEFAULT_TABLES, **{
+    'ingredients': ['id', 'name', 'unit'],
+    'user_ingredients': ['id', 'user_id', 'ingredient_id', 'quantity', 'expiry_date']
+})
+
+
+class ExcelDatabaseTestCase(unittest.TestCase):
+    """在临时目录中创建数据库文件的测试基类"""
+    
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir, True)
+        self.path = os.path.join(self.tmp_dir, 'database.xlsx')
+    
+    def open_db(self, **kwargs):
+        """打开同一个数据库文件的一个实例，多个实例相当于多个worker进程"""
+        kwargs.setdefault('compact_interval', None)
+        return ExcelDatabase(self.path, default_tables=TABLES, **kwargs)
+
+
+class ReadTableTest(ExcelDatabaseTestCase):
+    """read_table返回的缓存表副本"""
+    
+    def test_copy_on_write_view(self):
+        """开启写时复制时返回不复制数据的浅拷贝，修改读出的表不影响缓存"""
+        db = self.open_db()
+        db.add_rows('user_ingredients', [{'id': 1, 'user_id': 1, 'ingredient_id': 1, 'quantity': 2},
+                                         {'id': 2, 'user_id': 1, 'ingredient_id': 2, 'quantity': 3}])
+        for copy_on_write in (True, False):
+            with self.subTest(copy_on_write=copy_on_write), pd.option_context('mode.copy_on_write', copy_on_write):
+                df = db.read_table('user_ingredients')
+                cached = db._get_table('user_ingredients')
+                self.assertEqual(np.shares_memory(df['quantity'].to_numpy(), cached['quantity'].to_numpy()),
+                                 copy_on_write)
+                
+                df.loc[df['id'] == 1, 'quantity'] = 9
+                df['user_id'] = 5
+                self.assertEqual(db.read_table('user_ingredients')['quantity'].tolist(), [2, 3])
+                self.assertEqual(db.read_table('user_ingredients')['user_id'].tolist(), [1, 1])
+
+
+class CrossProcessChangeTest(ExcelDatabaseTestCase):
+    """其他进程(另一个实例)的修改"""
+    
+    def test_replace_event_after_local_write_to_other_table(self):
+        """本进程写入其他表丢弃了过期的缓存后，重新加载仍能发现其他进程的修改"""
+        for journal in (False, True):
+            with self.subTest(journal=journal):
+                self.path = os.path.join(tempfile.mkdtemp(dir=self.tmp_dir), 'database.xlsx')
+                a = self.open_db(journal=journal)
+                b = self.open_db(journal=journal)
+                a.add_row('users', {'id': 1, 'user_id': 'u1', 'openid': 'o1'})
+                a.add_row('user_ingredients', {'id': 1, 'user_id': 1, 'ingredient_id': 1, 'quantity': 1})
+                self.assertEqual(len(a.read_table('user_ingredients')), 1)
+                events = []
+                a.subscribe(events.append, 'user_ingredients')
+                
+                b.add_row('user_ingredients', {'id': 2, 'user_id': 1, 'ingredient_id': 2, 'quantity': 1})
+                a.update_user('o1', {'nickname': 'n'})
+                
+                self.assertEqual(len(a.get_by('user_ingredients', 'user_id', 1)), 2)
+                self.assertEqual([event.op for event in events], ['replace'])
+    
+    def test_table_version(self):
+        """表版本在本进程写入该表、其他进程修改后改变，写入其他表时不变"""
+        a = self.open_db()
+        b = self.open_db()
+        a.add_row('users', {'id': 1, 'user_id': 'u1', 'openid': 'o1'})
+        version = a.table_version('user_ingredients')
+        
+        a.update_user('o1', {'nickname': 'n'})
+        self.assertEqual(a.table_version('user_ingredients'), version)
+        
+        a.add_row('user_ingredients', {'id': 1, 'user_id': 1, 'ingredient_id': 1, 'quantity': 1})
+        self.assertNotEqual(a.table_version('user_ingredients'), version)
+        version = a.table_version('user_ingredients')
+        
+        b.add_row('user_ingredients', {'id': 2, 'user_id': 1, 'ingredient_id': 2, 'quantity': 1})
+        a.update_user('o1', {'nickname': 'm'})
+        self.assertNotEqual(a.table_version('user_ingredients'), version)
+
+
+
+class TransactionTest(ExcelDatabaseTestCase):
+    """多表事务"""
+    
+    def test_create_table(self):
+        """事务中写入不存在的表时在提交时创建"""
+        db = self.open_db()
+        with db.transaction():
+            self.assertTrue(db.add_row('things', {'id': 1, 'name': 'a'}))
+            self.assertTrue(db.add_row('things', {'id': 2, 'name': 'b'}))
+            self.assertTrue(db.ensure_table_exists('others', ['id', 'name']))
+            db.add_row('users', {'id': 1, 'user_id': 'u1', 'openid': 'o1'})
+        
+        reopened = self.open_db()
+        self.assertEqual(reopened.read_table('things')['name'].tolist(), ['a', 'b'])
+        self.assertEqual(list(reopened.read_table('others').columns), ['id', 'name'])
+        self.assertEqual(len(reopened.read_table('users')), 1)
+    
+    def test_create_table_with_journal(self):
+        """启用操作日志时事务中不能新建表，整个事务被放弃"""
+        db = self.open_db(journal=True)
+        with self.assertRaises(RuntimeError):
+            with db.transaction():
+                db.add_row('users', {'id': 1, 'user_id': 'u1', 'openid': 'o1'})
+                db.add_row('things', {'id': 1, 'name': 'a'})
+        
+        self.assertNotIn('things', db.list_tables())
+        self.assertTrue(db.read_table('users').empty)
+
+
+class ApplyTableOpsTest(unittest.TestCase):
+    """提交时把行级操作应用到缓存的表"""
+    
+    def test_untouched_columns_are_shared(self):
+        """只复制被更新的列，原表不变，未涉及的列与原表共用数据"""
+        df = apply_schema('user_ingredients', pd.DataFrame({
+            'id': [1, 2, 3], 'user_id': [1, 1, 2], 'quantity': [1.0, 2.0, 3.0],
+            'expiry_date': ['2030-01-01', None, '2030-01-03']
+        }))
+        with pd.option_context('mode.copy_on_write', False):
+            result = apply_table_ops(df, [
+                {'op': 'update', 'pos': 1, 'values': {'quantity': 5, 'expiry_date': '2030-02-01'}},
+                {'op': 'update', 'pos': 2, 'values': {'quantity': 6}}
+            ], 'user_ingredients')
+        
+        self.assertEqual(df['quantity'].tolist(), [1.0, 2.0, 3.0])
+        self.assertEqual(result['quantity'].tolist(), [1.0, 5.0, 6.0])
+        self.assertEqual(result['expiry_date'].iloc[1], pd.Timestamp('2030-02-01'))
+        self.assertTrue(np.shares_memory(result['user_id'].to_numpy(), df['user_id'].to_numpy()))
+        self.assertFalse(np.shares_memory(result['quantity'].to_numpy(), df['quantity'].to_numpy()))
+    
+    def test_delete_and_insert(self):
+        """删除和插入后行号重新编为0..n-1，插入的行按表结构转换，分类列保持分类类型"""
+        df = apply_schema('ingredients', pd.DataFrame({'id': [1, 2, 3], 'name': ['a', 'b', 'c'], 'unit': ['克', '个', '克']}))
+        df.index = pd.Index([10, 11, 12])
+        result = apply_table_ops(df, [
+            {'op': 'delete', 'pos': 11},
+            {'op': 'insert', 'row': {'id': '4', 'name': 'd', 'unit': '瓶'}}
+        ], 'ingredients')
+        
+        self.assertEqual(list(result.index), [0, 1, 2])
+        self.assertEqual(result['id'].tolist(), [1, 3, 4])
+        self.assertEqual(result['id'].dtype, np.int64)
+        self.assertIsInstance(result['unit'].dtype, pd.CategoricalDtype)
+        self.assertEqual(result['unit'].tolist(), ['克', '克', '瓶'])
+
+
+if __name__ == '__main__':
+    unittest.main()
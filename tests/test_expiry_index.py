@@ -0,0 +1,87 @@
+import unittest
+from unittest import mock
+from services.expiry_index import ExpiryIndex
+from tests.test_excel_db import ExcelDatabaseTestCase
+from tests.test_partitioned_db import PartitionedDatabaseTestCase
+
+
+class ExpiryIndexTest(ExcelDatabaseTestCase):
+    """按用户的过期日期索引"""
+    
+    def setUp(self):
+        super().setUp()
+        self.db = self.open_db()
+        self.db.add_row('users', {'id': 1, 'user_id': 'u1', 'openid': 'o1'})
+        self.db.add_rows('user_ingredients', [
+            {'id': 1, 'user_id': 1, 'ingredient_id': 1, 'quantity': 1, 'expiry_date': '2030-01-03'},
+            {'id': 2, 'user_id': 1, 'ingredient_id': 2, 'quantity': 2, 'expiry_date': '2030-01-01'},
+            {'id': 3, 'user_id': 1, 'ingredient_id': 3, 'quantity': 3, 'expiry_date': None}
+        ])
+    
+    def row_ids(self, index):
+        return [entry[1] for entry in index.top(1)]
+    
+    def test_incremental_updates(self):
+        """本进程的写入按行更新索引，不重新建立"""
+        index = ExpiryIndex(self.db)
+        self.assertEqual(self.row_ids(index), [2, 1])
+        
+        self.db.add_row('user_ingredients', {'id': 4, 'user_id': 1, 'ingredient_id': 4, 'quantity': 1,
+                                             'expiry_date': '2029-12-31'})
+        self.db.update_rows('user_ingredients', {'id': 1}, {'expiry_date': '2029-01-01'})
+        self.db.delete_rows('user_ingredients', {'id': 2})
+        self.assertEqual(self.row_ids(index), [1, 4])
+        self.assertEqual(index.top(1, 1, 1)[0][0].strftime('%Y-%m-%d'), '2029-12-31')
+    
+    def test_other_process_write(self):
+        """其他进程修改库存、本进程再写入其他表后，索引包含其他进程的修改"""
+        other = self.open_db()
+        index = ExpiryIndex(self.db)
+        self.assertEqual(self.row_ids(index), [2, 1])
+        
+        other.add_row('user_ingredients', {'id': 4, 'user_id': 1, 'ingredient_id': 4, 'quantity': 1,
+                                           'expiry_date': '2029-12-31'})
+        self.db.update_user('o1', {'nickname': 'n'})
+        self.assertEqual(self.row_ids(index), [4, 2, 1])
+    
+    def test_rebuilds_without_change_events(self):
+        """收不到修改事件时，按表版本发现修改并重新建立索引"""
+        other = self.open_db()
+        index = ExpiryIndex(self.db)
+        self.assertEqual(self.row_ids(index), [2, 1])
+        self.db.changes.publish = lambda events: None
+        
+        other.add_row('user_ingredients', {'id': 4, 'user_id': 1, 'ingredient_id': 4, 'quantity': 1,
+                                           'expiry_date': '2029-12-31'})
+        self.assertEqual(self.row_ids(index), [4, 2, 1])
+        self.db.delete_rows('user_ingredients', {'id': 2})
+        self.assertEqual(self.row_ids(index), [4, 1])
+
+
+class PartitionedExpiryIndexTest(PartitionedDatabaseTestCase):
+    """分区存储时的过期日期索引"""
+    
+    def test_other_partition_write(self):
+        """其他分区的修改不会使用户的索引重新建立"""
+        db = self.open_db()
+        db.add_rows('user_ingredients', [
+            {'id': 1, 'user_id': 1, 'ingredient_id': 1, 'quantity': 1, 'expiry_date': '2030-01-03'},
+            {'id': 2, 'user_id': 1, 'ingredient_id': 2, 'quantity': 2, 'expiry_date': '2030-01-01'}
+        ])
+        index = ExpiryIndex(db)
+        self.assertEqual([entry[1] for entry in index.top(1)], [2, 1])
+        
+        db.changes.publish = lambda events: None
+        other = self.open_db()
+        other.add_row('user_ingredients', {'id': 3, 'user_id': 2, 'ingredient_id': 1, 'expiry_date': '2030-01-02'})
+        db.add_row('user_ingredients', {'id': 4, 'user_id': 2, 'ingredient_id': 2, 'expiry_date': '2030-01-02'})
+        with mock.patch.object(db, 'get_by', side_effect=AssertionError('索引被重新建立')):
+            self.assertEqual([entry[1] for entry in index.top(1)], [2, 1])
+        
+        other.add_row('user_ingredients', {'id': 5, 'user_id': 1, 'ingredient_id': 3, 'expiry_date': '2029-01-01'})
+        self.assertEqual([entry[1] for entry in index.top(1)], [5, 2, 1])
+        self.assertEqual([entry[1] for entry in index.top(2)], [3, 4])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+from datetime import date
+from services.inventory_summary import InventorySummary
+from tests.test_excel_db import ExcelDatabaseTestCase
+
+
+TODAY = date(2030, 1, 1)
+
+
+class InventorySummaryTest(ExcelDatabaseTestCase):
+    """按用户物化的库存汇总"""
+    
+    def setUp(self):
+        super().setUp()
+        self.db = self.open_db()
+        self.db.add_row('users', {'id': 1, 'user_id': 'u1', 'openid': 'o1'})
+        self.db.add_rows('user_ingredients', [
+            {'id': 1, 'user_id': 1, 'ingredient_id': 1, 'quantity': 1, 'expiry_date': '2029-12-31'},
+            {'id': 2, 'user_id': 1, 'ingredient_id': 2, 'quantity': 1, 'expiry_date': '2030-01-03'},
+            {'id': 3, 'user_id': 1, 'ingredient_id': 3, 'quantity': 1, 'expiry_date': None}
+        ])
+    
+    def counts(self, summary, today=TODAY):
+        result = summary.summary(1, 3, today)
+        return (result['item_count'], result['fresh_count'], result['expiring_count'], result['expired_count'])
+    
+    def test_incremental_updates_and_day_rollover(self):
+        """本进程的写入增量更新汇总，跨天后重新划分状态"""
+        summary = InventorySummary(self.db)
+        self.assertEqual(self.counts(summary), (3, 1, 1, 1))
+        self.assertEqual(summary.summary(1, 3, TODAY)['earliest_expiry'].strftime('%Y-%m-%d'), '2029-12-31')
+        
+        self.db.add_row('user_ingredients', {'id': 4, 'user_id': 1, 'ingredient_id': 4, 'quantity': 1,
+                                             'expiry_date': '2030-02-01'})
+        self.db.delete_rows('user_ingredients', {'id': 1})
+        self.assertEqual(self.counts(summary), (3, 2, 1, 0))
+        self.assertEqual(summary.summary(1, 3, TODAY)['earliest_expiry'].strftime('%Y-%m-%d'), '2030-01-03')
+        self.assertEqual(self.counts(summary, date(2030, 1, 3)), (3, 2, 0, 1))
+    
+    def test_other_process_write(self):
+        """其他进程修改库存、本进程再写入其他表后，汇总包含其他进程的修改"""
+        other = self.open_db()
+        summary = InventorySummary(self.db)
+        self.assertEqual(self.counts(summary), (3, 1, 1, 1))
+        
+        other.add_row('user_ingredients', {'id': 4, 'user_id': 1, 'ingredient_id': 4, 'quantity': 1,
+                                           'expiry_date': '2030-01-02'})
+        self.db.update_user('o1', {'nickname': 'n'})
+        self.assertEqual(self.counts(summary), (4, 1, 2, 1))
+    
+    def test_rebuilds_without_change_events(self):
+        """收不到修改事件时，按表版本发现修改并重新建立汇总"""
+        other = self.open_db()
+        summary = InventorySummary(self.db)
+        self.assertEqual(self.counts(summary), (3, 1, 1, 1))
+        self.db.changes.publish = lambda events: None
+        
+        other.add_row('user_ingredients', {'id': 4, 'user_id': 1, 'ingredient_id': 4, 'quantity': 1,
+                                           'expiry_date': '2030-01-02'})
+        self.assertEqual(self.counts(summary), (4, 1, 2, 1))
+        self.db.delete_rows('user_ingredients', {'id': 1})
+        self.assertEqual(self.counts(summary), (3, 1, 2, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+from utils.excel_db import ExcelDatabase
+from utils.partitioned_db import PartitionedDatabase, partition_of
+from tests.test_excel_db import ExcelDatabaseTestCase, TABLES
+
+
+class PartitionedDatabaseTestCase(ExcelDatabaseTestCase):
+    """user_ingredients分为4个分区的数据库"""
+    
+    def open_db(self, **kwargs):
+        main = super().open_db(**kwargs)
+        
+        def open_partition(path, default_tables=None):
+            return ExcelDatabase(path, default_tables=default_tables, compact_interval=None, **kwargs)
+        
+        return PartitionedDatabase(main, 4, open_partition, '.xlsx')
+
+
+class PinTest(PartitionedDatabaseTestCase):
+    """分区的固定读取版本"""
+    
+    def test_pin_only_routed_partitions(self):
+        """只固定请求读写过的分区，with块结束后全部释放"""
+        db = self.open_db()
+        db.add_rows('user_ingredients', [{'id': 1, 'user_id': 1, 'quantity': 1}, {'id': 2, 'user_id': 2, 'quantity': 2}])
+        partition = db._partition('user_ingredients', partition_of(1, 4))
+        other = db._partition('user_ingredients', partition_of(2, 4))
+        
+        with db.pin():
+            self.assertEqual(db.get_by('user_ingredients', 'user_id', 1)['id'].tolist(), [1])
+            self.assertIsNotNone(partition._pin_local.state)
+            self.assertIsNone(getattr(other._pin_local, 'state', None))
+            
+            # 其他线程(相当于其他请求)的修改在固定期间不可见，unpinned中可见
+            writer = self.open_db()
+            writer.update_rows('user_ingredients', {'id': 1}, {'quantity': 5})
+            self.assertEqual(db.get_by('user_ingredients', 'user_id', 1)['quantity'].tolist(), [1])
+            with db.unpinned():
+                self.assertEqual(db.get_by('user_ingredients', 'user_id', 1)['quantity'].tolist(), [5])
+                self.assertEqual(db.get_by('user_ingredients', 'user_id', 2)['id'].tolist(), [2])
+            self.assertIsNone(getattr(other._pin_local, 'state', None))
+        
+        self.assertIsNone(partition._pin_local.state)
+        self.assertEqual(db.get_by('user_ingredients', 'user_id', 1)['quantity'].tolist(), [5])
+
+
+class TableVersionTest(PartitionedDatabaseTestCase):
+    """按分区的表版本"""
+    
+    def test_version_of_user_partition(self):
+        """传入user_id时只有该用户所在分区的修改改变版本"""
+        db = self.open_db()
+        db.add_rows('user_ingredients', [{'id': 1, 'user_id': 1, 'quantity': 1}, {'id': 2, 'user_id': 2, 'quantity': 2}])
+        version = db.table_version('user_ingredients', user_id=1)
+        whole = db.table_version('user_ingredients')
+        
+        db.update_rows('user_ingredients', {'user_id': 2}, {'quantity': 3})
+        self.assertEqual(db.table_version('user_ingredients', user_id=1), version)
+        self.assertNotEqual(db.table_version('user_ingredients'), whole)
+        
+        self.open_db().update_rows('user_ingredients', {'user_id': 1}, {'quantity': 4})
+        self.assertNotEqual(db.table_version('user_ingredients', user_id=1), version)
+
+
+if __name__ == '__main__':
+    unittest.main()
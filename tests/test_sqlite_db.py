@@ -0,0 +1,108 @@
+import os
+import shutil
+import tempfile
+import sqlite3
+import unittest
+from unittest import mock
+import pandas as pd
+from utils.sqlite_db import SQLiteDatabase, migrate_excel_to_sqlite
+from tests.test_excel_db import TABLES
+
+
+class KeyedWriteTest(unittest.TestCase):
+    """SQLite按条件读写的行级写入"""
+    
+    def setUp(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir, True)
+        self.tmp_dir = tmp_dir
+        self.db = SQLiteDatabase(os.path.join(tmp_dir, 'database.db'), default_tables=TABLES)
+        self.db.add_rows('user_ingredients', [
+            {'id': 1, 'user_id': 1, 'ingredient_id': 1, 'quantity': 1},
+            {'id': 2, 'user_id': 2, 'ingredient_id': 1, 'quantity': 2},
+            {'id': 3, 'user_id': 1, 'ingredient_id': 2, 'quantity': 3}
+        ])
+        self.db.add_row('users', {'id': 1, 'openid': 'a', 'user_id': 'u1'})
+        self.db.add_row('users', {'id': 2, 'openid': 'b', 'user_id': 'u2'})
+    
+    def test_writes_do_not_load_table(self):
+        """更新、删除、插入只读写涉及的行，不加载整张表"""
+        with mock.patch.object(self.db, '_load_table', side_effect=AssertionError('整张表被加载')):
+            updated = self.db.update_rows('user_ingredients', {'user_id': 1}, {'quantity': 9}, limit=1)
+            self.assertEqual(updated['id'].tolist(), [1])
+            self.assertEqual(self.db.delete_rows('user_ingredients', {'id': 2}), 1)
+            self.assertTrue(self.db.add_row('user_ingredients', {'id': 4, 'user_id': 2, 'ingredient_id': 3}))
+            row = self.db.upsert('user_ingredients', {'id': 3}, {'quantity': 5})
+            self.assertEqual(row['quantity'], 5)
+            row = self.db.upsert('user_ingredients', {'id': 5}, {'user_id': 3, 'quantity': 6})
+            self.assertEqual((row['id'], row['quantity']), (5, 6))
+        
+        df = self.db.read_table('user_ingredients')
+        self.assertEqual(df['id'].tolist(), [1, 3, 4, 5])
+        self.assertEqual(df['quantity'].fillna(0).astype(int).tolist(), [9, 5, 0, 6])
+    
+    def test_unique_index(self):
+        """写入与其他行重复的唯一列时不修改数据"""
+        self.assertIsNone(self.db.update_rows('users', {'id': 2}, {'openid': 'a'}))
+        self.assertFalse(self.db.add_row('users', {'id': 3, 'openid': 'b'}))
+        self.assertIsNotNone(self.db.update_rows('users', {'id': 2}, {'openid': 'b', 'user_id': 'u3'}))
+        self.assertEqual(self.db.read_table('users')['openid'].tolist(), ['a', 'b'])
+        self.assertEqual(self.db.read_table('users')['user_id'].tolist(), ['u1', 'u3'])
+    
+    def test_unique_index_in_database(self):
+        """users的id、openid、user_id由SQLite唯一索引保证，user_ingredients的id可以重复"""
+        conn = self.db._connect()
+        with self.assertRaises(sqlite3.IntegrityError):
+            with conn:
+                conn.execute('INSERT INTO users (id, openid, user_id) VALUES (3, ?, ?)', ('a', 'u9'))
+        self.assertTrue(self.db.add_row('user_ingredients', {'id': 1, 'user_id': 3, 'ingredient_id': 1}))
+    
+    def test_upgrade_indexes(self):
+        """旧数据库的普通索引在没有重复值时升级为唯一索引，有重复值时保留普通索引"""
+        conn = self.db._connect()
+        with conn:
+            for column in ('openid', 'user_id'):
+                conn.execute(f'DROP INDEX idx_users_{column}')
+                conn.execute(f'CREATE INDEX idx_users_{column} ON users ({column})')
+            conn.execute("UPDATE users SET user_id = 'u1'")
+        
+        with mock.patch('builtins.print') as print_mock:
+            SQLiteDatabase(self.db.sqlite_path, default_tables=TABLES)
+        unique = {row[1]: row[2] for row in conn.execute('PRAGMA index_list(users)')}
+        self.assertEqual((unique['idx_users_openid'], unique['idx_users_user_id']), (1, 0))
+        self.assertIn("['u1']", print_mock.call_args[0][0])
+    
+    def test_migration_reports_duplicates(self):
+        """Excel中唯一列有重复值时迁移前报告并停止，不写入任何表"""
+        excel_path = os.path.join(self.tmp_dir, 'database.xlsx')
+        # 直接编辑的Excel文件不经过唯一索引的检查
+        pd.DataFrame({'id': [1, 2], 'openid': ['a', 'b'], 'user_id': ['u1', 'u1']}).to_excel(
+            excel_path, sheet_name='users', index=False)
+        
+        sqlite_path = os.path.join(self.tmp_dir, 'migrated.db')
+        with mock.patch('builtins.print') as print_mock, self.assertRaises(ValueError):
+            migrate_excel_to_sqlite(excel_path, sqlite_path)
+        self.assertIn("['u1']", print_mock.call_args[0][0])
+        self.assertFalse(os.path.exists(sqlite_path))
+    
+    def test_transaction_positions(self):
+        """事务中的操作仍按行号对应到rowid"""
+        self.db.delete_rows('user_ingredients', {'id': 1})
+        with self.db.transaction():
+            self.db.update_rows('user_ingredients', {'id': 3}, {'quantity': 7})
+            self.db.delete_rows('user_ingredients', {'id': 2})
+            self.db.add_row('user_ingredients', {'id': 6, 'user_id': 1, 'ingredient_id': 4})
+        
+        df = self.db.read_table('user_ingredients')
+        self.assertEqual(df['id'].tolist(), [3, 6])
+        self.assertEqual(df.loc[df['id'] == 3, 'quantity'].tolist(), [7])
+    
+    def test_transaction_create_table(self):
+        """事务中写入不存在的表时在提交时创建"""
+        with self.db.transaction():
+            self.assertTrue(self.db.add_row('things', {'id': 1, 'name': 'a'}))
+            self.assertTrue(self.db.add_row('things', {'id': 2, 'name': 'b'}))
+            self.db.delete_rows('user_ingredients', {'id': 1})
+        
+        self.assertEqual(self.db.read_table('things')['name'].tolist(), ['a', 'b'])
+        self.assertEqual(self.db.read_table('user_ingredients')['id'].tolist(), [2, 3])
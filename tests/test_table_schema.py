@@ -0,0 +1,46 @@
+import unittest
+from unittest import mock
+import pandas as pd
+import numpy as np
+from utils.table_schema import apply_schema
+from utils.value_utils import to_number
+from services.recipe_detail_service import RecipeDetailService
+
+
+class ApplySchemaTest(unittest.TestCase):
+    """加载表时的列类型转换"""
+    
+    def test_date_column(self):
+        """日期列转换为datetime64，空值和空白字符串为NaT"""
+        df = pd.DataFrame({'id': [1, 2, 3], 'expiry_date': ['2030-01-01', None, ' ']})
+        result = apply_schema('user_ingredients', df)
+        self.assertTrue(pd.api.types.is_datetime64_dtype(result['expiry_date'].dtype))
+        self.assertEqual(result['expiry_date'].isna().tolist(), [False, True, True])
+    
+    def test_unparseable_date_keeps_values(self):
+        """日期列中有无法解析的值时保持原类型，写回时不丢失数据"""
+        df = pd.DataFrame({'id': [1, 2], 'expiry_date': ['2030-01-01', '下周']})
+        result = apply_schema('user_ingredients', df)
+        self.assertEqual(result['expiry_date'].tolist(), ['2030-01-01', '下周'])
+    
+    def test_unparseable_number_keeps_values(self):
+        """数值列中有无法转换的值时保持原类型"""
+        df = pd.DataFrame({'id': [1], 'cook_time': ['20分钟']})
+        result = apply_schema('recipes', df)
+        self.assertEqual(result['cook_time'].tolist(), ['20分钟'])
+    
+    def test_mixed_number_column(self):
+        """保持原类型的数值列中，可以转换的值仍按数值生成标签"""
+        df = apply_schema('recipes', pd.DataFrame({'id': [1, 2], 'calories': ['250', 700],
+                                                   'cook_time': ['15分钟', '40']}))
+        self.assertEqual([to_number(value) for value in df['cook_time']], [None, 40.0])
+        self.assertEqual([to_number(value) for value in (np.int64(3), np.nan, None, True)], [3, None, None, None])
+        
+        service = RecipeDetailService(mock.Mock())
+        records = df.to_dict('records')
+        self.assertEqual(service._generate_tags(records[0]), ['低卡'])
+        self.assertEqual(service._generate_tags(records[1]), ['高卡', '耗时较长'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+from utils import table_snapshot
+from utils.table_snapshot import SnapshotStore
+from tests.test_excel_db import ExcelDatabaseTestCase
+
+
+@unittest.skipIf(table_snapshot.pa is None, '没有安装pyarrow')
+class SharedSnapshotTest(unittest.TestCase):
+    """共享表的Arrow快照"""
+    
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir, True)
+        self.store = SnapshotStore(self.tmp_dir, ['recipes'])
+    
+    def test_round_trip(self):
+        """加载的快照与保存的表一致，空值和混合类型的列保持原值"""
+        df = pd.DataFrame({
+            'id': [1, 2, 3],
+            'calories': [1.5, np.nan, 2.0],
+            'created_at': pd.to_datetime(['2024-01-01', None, '2024-01-03']),
+            'name': ['a', 'b', 'c'],
+            'cook_time': [15, '25分钟', None],
+            'tips': ['t', None, 'u']
+        })
+        self.store.save('recipes', (1, 2, 3), df)
+        loaded = self.store.load('recipes', (1, 2, 3))
+        
+        self.assertEqual(list(loaded.columns), list(df.columns))
+        self.assertIsInstance(loaded['name'].dtype, pd.StringDtype)
+        pd.testing.assert_frame_equal(loaded.astype({'name': object}), df)
+        self.assertIsNone(self.store.load('recipes', (1, 2, 4)))
+    
+    def test_columns_are_mapped(self):
+        """数值、日期和字符串列直接映射快照文件，不复制数据"""
+        df = pd.DataFrame({'id': np.arange(1000), 'calories': np.arange(1000) / 2,
+                           'created_at': pd.date_range('2024-01-01', periods=1000),
+                           'name': [f'菜谱{i}' for i in range(1000)]})
+        self.store.save('recipes', (1, 2, 3), df)
+        loaded = self.store.load('recipes', (1, 2, 3))
+        
+        for column in ('id', 'calories', 'created_at'):
+            self.assertFalse(loaded[column].to_numpy().flags.writeable, column)
+        chunks = loaded['name'].array._data.chunks
+        self.assertEqual(len(chunks), 1)
+        self.assertEqual(chunks[0].to_pylist()[:2], ['菜谱0', '菜谱1'])
+
+
+@unittest.skipIf(table_snapshot.pa is None, '没有安装pyarrow')
+class SharedTableWriteTest(ExcelDatabaseTestCase):
+    """共享表的读写"""
+    
+    def test_update_shared_table(self):
+        """共享表中的字符串列可以写入空值和其他类型的值"""
+        db = self.open_db(shared_tables=['recipes'])
+        db.add_rows('recipes', [{'id': 1, 'name': 'a', 'tips': 'x'}, {'id': 2, 'name': 'b', 'tips': 'y'}])
+        self.assertIsInstance(db.read_table('recipes')['name'].dtype, pd.StringDtype)
+        self.assertTrue(any(name.endswith('.arrow') for name in os.listdir(self.path + '.snapshots')))
+        
+        db.update_rows('recipes', {'id': 1}, {'tips': None, 'name': 3})
+        db.add_row('recipes', {'id': 3, 'name': 'c'})
+        
+        reopened = self.open_db(shared_tables=['recipes'])
+        records = reopened.read_table('recipes')[['id', 'name', 'tips']].to_dict('records')
+        self.assertEqual([record['name'] for record in records], [3, 'b', 'c'])
+        self.assertEqual([record['tips'] for record in records][1], 'y')
+        self.assertTrue(all(pd.isna(record['tips']) for record in (records[0], records[2])))
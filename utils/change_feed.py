@@ -0,0 +1,92 @@
+import threading
+from collections import namedtuple
+
+
+# 表修改事件
+#   table: 表名
+#   op: insert / update / delete / replace(整表替换或其他进程的修改，keys为None)
+#   keys: 涉及行的id列表，无法确定时为None
+#   version: 提交后该表在本进程中的版本号
+ChangeEvent = namedtuple('ChangeEvent', ['table', 'op', 'keys', 'version'])
+
+
+class ChangeFeed:
+    """
+    表修改事件的订阅与分发
+    
+    事件在写入提交、释放锁之后由提交写入的线程同步分发，
+    回调中可以读取数据库。回调抛出的异常只打印，不影响写入和其他订阅者。
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        # [(回调, 关注的表名集合或None)]，修改时整体替换，分发时无需加锁
+        self._subscribers = []
+    
+    def subscribe(self, callback, tables=None):
+        """
+        订阅表修改事件
+        
+        Args:
+            callback: 接收ChangeEvent的函数
+            tables: 关注的表名(字符串或列表)，为None时接收所有表的事件
+        
+        Returns:
+            function: 调用后取消订阅
+        """
+        if isinstance(tables, str):
+            tables = [tables]
+        entry = (callback, frozenset(tables) if tables is not None else None)
+        with self._lock:
+            self._subscribers = self._subscribers + [entry]
+        
+        def unsubscribe():
+            with self._lock:
+                self._subscribers = [subscriber for subscriber in self._subscribers if subscriber is not entry]
+        
+        return unsubscribe
+    
+    def publish(self, events):
+        """
+        把事件分发给订阅者
+        
+        Args:
+            events: ChangeEvent列表
+        """
+        subscribers = self._subscribers
+        if not subscribers:
+            return
+        for event in events:
+            for callback, tables in subscribers:
+                if tables is not None and event.table not in tables:
+                    continue
+                try:
+                    callback(event)
+                except Exception as e:
+                    print(f"处理表修改事件失败: {event}: {str(e)}")
+
+
+def events_from_ops(ops, versions):
+    """
+    把一次提交的操作汇总为事件，同一张表的同类操作合并为一个事件
+    
+    Args:
+        ops: 带table字段的操作列表(格式见TableJournal)
+        versions: {表名: 提交后的版本号}
+    
+    Returns:
+        list: ChangeEvent列表，按操作首次出现的顺序排列
+    """
+    grouped = {}
+    for op in ops:
+        kind = op['op']
+        keys = grouped.setdefault((op['table'], kind), [])
+        if kind == 'insert':
+            keys.append(op['row'].get('id'))
+        elif kind in ('update', 'delete'):
+            keys.append(op.get('key'))
+    
+    return [
+        ChangeEvent(table_name, kind, None if kind == 'replace' else keys, versions.get(table_name, 0))
+        for (table_name, kind), keys in grouped.items()
+    ]
@@ -0,0 +1,98 @@
+import time
+import queue
+import threading
+from concurrent.futures import Future
+
+
+class CommitQueue:
+    """
+    单写入线程的提交队列
+    
+    写入请求进入队列后由写入线程处理：取到第一个请求后再等待window秒，把这段时间内
+    到达的请求合并为一批，交给flush函数一次提交(一次日志追加或一次文件保存)。
+    每个请求对应一个Future，提交完成后得到结果，提交失败时得到异常。
+    """
+    
+    def __init__(self, flush, window, name='db-writer'):
+        """
+        初始化提交队列并启动写入线程
+        
+        Args:
+            flush: 提交一批请求的函数，参数为[(表名, make_ops, Future)]，
+                需要为每个Future设置结果或异常
+            window: 合并请求的时间窗口(秒)
+            name: 写入线程名
+        """
+        self._flush = flush
+        self.window = window
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+    
+    def in_writer_thread(self):
+        """当前线程是否为写入线程"""
+        return threading.current_thread() is self._thread
+    
+    def submit(self, table_name, make_ops):
+        """
+        提交一个写入请求
+        
+        Args:
+            table_name: 表名
+            make_ops: 根据表的当前数据生成操作列表的函数
+        
+        Returns:
+            Future: 提交完成后结果为提交后的表
+        
+        Raises:
+            RuntimeError: 队列已关闭
+        """
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("写入队列已关闭")
+            self._queue.put((table_name, make_ops, future))
+        return future
+    
+    def _run(self):
+        """写入线程: 收集一个时间窗口内的请求并提交，直到收到关闭标记"""
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                break
+            
+            batch = [item]
+            deadline = time.monotonic() + self.window
+            while True:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            
+            try:
+                self._flush(batch)
+            except Exception as e:
+                print(f"提交 {len(batch)} 个写入请求失败: {str(e)}")
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+    
+    def close(self):
+        """停止接收新请求，等待已排队的请求提交完成"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        if not self.in_writer_thread():
+            self._thread.join()
@@ -0,0 +1,50 @@
+from utils.excel_db import ExcelDatabase
+
+
+def create_database(config):
+    """
+    根据配置创建数据库实例
+    
+    Args:
+        config: 应用配置(app.config或包含相同键的字典)
+    
+    Returns:
+        ExcelDatabase: Excel数据库或接口相同的SQLite数据库实例，
+            开启分区(DB_USER_PARTITIONS)时为包装主库的PartitionedDatabase
+    """
+    backend = (config.get('DB_BACKEND') or 'excel').lower()
+    coalesce_window = (config.get('DB_WRITE_COALESCE_MS') or 0) / 1000 or None
+    
+    if backend == 'sqlite':
+        from utils.sqlite_db import SQLiteDatabase
+        
+        def open_db(path, default_tables=None):
+            return SQLiteDatabase(path, id_block_size=config.get('DB_ID_BLOCK_SIZE', 1), default_tables=default_tables,
+                                  coalesce_window=coalesce_window)
+        
+        path, extension = config['SQLITE_DB_PATH'], '.db'
+    elif backend == 'excel':
+        def open_db(path, default_tables=None):
+            return ExcelDatabase(
+                path,
+                journal=config.get('EXCEL_DB_JOURNAL', False),
+                compact_interval=config.get('EXCEL_DB_COMPACT_INTERVAL', 60),
+                compact_max_bytes=config.get('EXCEL_DB_COMPACT_MAX_BYTES', 1024 * 1024),
+                id_block_size=config.get('DB_ID_BLOCK_SIZE', 1),
+                snapshots=config.get('EXCEL_DB_SNAPSHOTS', True),
+                shared_tables=config.get('EXCEL_DB_SHARED_TABLES') or (),
+                default_tables=default_tables,
+                coalesce_window=coalesce_window
+            )
+        
+        path, extension = config['EXCEL_DB_PATH'], '.xlsx'
+    else:
+        raise ValueError(f"不支持的数据库存储引擎: {backend}")
+    
+    db = open_db(path)
+    partitions = int(config.get('DB_USER_PARTITIONS') or 0)
+    if partitions > 1:
+        # user_ingredients按用户分散到多个文件，单个用户的读写只涉及一个分区
+        from utils.partitioned_db import PartitionedDatabase
+        db = PartitionedDatabase(db, partitions, open_db, extension)
+    return db
@@ -0,0 +1,110 @@
+import os
+import json
+import zipfile
+import threading
+from datetime import datetime
+from concurrent.futures import Future
+from openpyxl import Workbook
+from utils.excel_db import _fill_sheet
+
+
+# 备份压缩包中的数据文件和说明文件
+BACKUP_DATA_NAME = 'database.xlsx'
+BACKUP_MANIFEST_NAME = 'manifest.json'
+
+
+def default_backup_path(backup_dir, version):
+    """
+    生成备份文件路径: <backup_dir>/database-v<版本号>-<时间>.zip
+    
+    Args:
+        backup_dir: 备份目录
+        version: 备份的数据版本号
+    """
+    timestamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+    return os.path.join(backup_dir, f'database-v{version}-{timestamp}.zip')
+
+
+def write_backup(archive_path, version, tables):
+    """
+    把一份数据快照写入zip压缩包
+    
+    压缩包中的database.xlsx每张表一个sheet，与Excel存储的文件格式相同，也可以用
+    sqlite_db的迁移命令导入SQLite；manifest.json记录版本号、时间和各表行数。
+    工作簿以只写模式逐行写入压缩包，先写临时文件再改名，中途失败不会留下不完整的备份
+    
+    Args:
+        archive_path: 压缩包路径
+        version: 快照的版本号
+        tables: {表名: DataFrame}
+    
+    Returns:
+        dict: 备份说明(即manifest.json的内容)
+    """
+    manifest = {
+        'version': version,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'tables': {table_name: len(df) for table_name, df in tables.items()}
+    }
+    
+    directory = os.path.dirname(os.path.abspath(archive_path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f'{archive_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        with zipfile.ZipFile(tmp_path, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            # xlsx本身已经压缩，在压缩包中原样存储
+            with archive.open(zipfile.ZipInfo(BACKUP_DATA_NAME, date_time=datetime.now().timetuple()[:6]), 'w',
+                              force_zip64=True) as f:
+                wb = Workbook(write_only=True)
+                for table_name, df in tables.items():
+                    _fill_sheet(wb.create_sheet(table_name), df)
+                wb.save(f)
+            archive.writestr(BACKUP_MANIFEST_NAME, json.dumps(manifest, ensure_ascii=False, indent=2))
+        os.replace(tmp_path, archive_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    
+    manifest['path'] = archive_path
+    return manifest
+
+
+def backup_database(db, archive_path=None, backup_dir=None):
+    """
+    在线备份数据库，不需要停止服务
+    
+    先通过db.snapshot()取得所有表在同一次提交后的数据(只在此期间持有共享锁)，
+    再在锁外写入压缩包，备份期间的写入不受影响，也不会进入本次备份
+    
+    Args:
+        db: 数据库实例(ExcelDatabase、SQLiteDatabase或PartitionedDatabase)
+        archive_path: 压缩包路径，为None时在backup_dir中按版本号和时间生成
+        backup_dir: 备份目录，archive_path为None时使用
+    
+    Returns:
+        dict: 备份说明，包括path、version、created_at和各表行数tables
+    """
+    version, tables = db.snapshot()
+    if archive_path is None:
+        archive_path = default_backup_path(backup_dir, version)
+    return write_backup(archive_path, version, tables)
+
+
+def start_backup(db, archive_path=None, backup_dir=None):
+    """
+    在后台线程中备份数据库，参数见backup_database
+    
+    Returns:
+        Future: 备份完成后结果为备份说明，失败时为异常
+    """
+    future = Future()
+    
+    def run():
+        try:
+            future.set_result(backup_database(db, archive_path, backup_dir))
+        except Exception as e:
+            print(f"备份数据库失败: {str(e)}")
+            future.set_exception(e)
+    
+    threading.Thread(target=run, name='db-backup', daemon=True).start()
+    return future
@@ -1,139 +1,1683 @@
 import os
+import json
+import threading
+import numpy as np
 import pandas as pd
-from datetime import datetime
+from pandas.io.parsers import TextParser
+from openpyxl import Workbook, load_workbook
+from datetime import datetime, date
 import uuid
+import atexit
+from contextlib import contextmanager
+from utils.file_lock import FileLock
+from utils.id_allocator import IdAllocator
+from utils.table_snapshot import SnapshotStore
+from utils.table_schema import apply_schema
+from utils.change_feed import ChangeFeed, ChangeEvent, events_from_ops
+from utils.commit_queue import CommitQueue
+from utils.value_utils import to_storage_value
+from utils.table_journal import TableJournal, diff_table_ops, apply_table_ops
+
+
+# 记录已合并日志序号的隐藏sheet
+META_SHEET = '_meta'
+
+
+def _copy_on_write_enabled():
+    """pandas是否开启了写时复制(copy_on_write)模式"""
+    try:
+        return bool(pd.get_option('mode.copy_on_write'))
+    except (KeyError, AttributeError):
+        # 旧版本pandas没有该选项
+        return False
+
+
+def enable_copy_on_write():
+    """
+    开启pandas写时复制(copy_on_write)模式，之后read_table等返回缓存表的浅拷贝
+    
+    这是pandas的全局选项，对整个进程生效，由应用启动时按配置(PANDAS_COPY_ON_WRITE)调用一次
+    
+    Returns:
+        bool: 是否已开启，旧版本pandas没有该选项时返回False
+    """
+    try:
+        pd.set_option('mode.copy_on_write', True)
+    except (KeyError, AttributeError, pd.errors.OptionError):
+        return False
+    return True
+
+
+def _to_cell_value(value):
+    """
+    把DataFrame中的单元格值转换为openpyxl可写入的值
+    
+    Args:
+        value: 单元格值
+    
+    Returns:
+        转换后的值，空值返回None
+    """
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, ensure_ascii=False)
+    if value is None or pd.isna(value):
+        return None
+    if isinstance(value, np.datetime64):
+        value = pd.Timestamp(value)
+    if isinstance(value, pd.Timestamp):
+        return value.to_pydatetime()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _build_index(series):
+    """
+    为一列建立哈希索引，空值不进入索引
+    
+    Args:
+        series: 列数据
+    
+    Returns:
+        dict: {列值: 行位置数组}
+    """
+    index = {}
+    for position, value in enumerate(series.tolist()):
+        if value is None or (isinstance(value, float) and value != value):
+            continue
+        index.setdefault(value, []).append(position)
+    return {value: np.array(positions, dtype=np.intp) for value, positions in index.items()}
+
+
+def _parse_order_by(order_by):
+    """把排序参数解析为(列名列表, 是否升序列表)，列名前的'-'表示降序"""
+    if isinstance(order_by, str):
+        order_by = [order_by]
+    columns = []
+    ascending = []
+    for column in order_by:
+        descending = isinstance(column, str) and column.startswith('-')
+        columns.append(column[1:] if descending else column)
+        ascending.append(not descending)
+    return columns, ascending
+
+
+def _column_positions(df, columns):
+    """获取列名对应的列位置，有不存在的列时抛出KeyError"""
+    positions = df.columns.get_indexer(columns)
+    if (positions < 0).any():
+        missing = [column for column, position in zip(columns, positions) if position < 0]
+        raise KeyError(f"列不存在: {missing}")
+    return positions
+
+
+def _fill_sheet(ws, df):
+    """
+    把DataFrame写入空的工作表，第一行为列名
+    
+    Args:
+        ws: openpyxl工作表
+        df: 要写入的DataFrame
+    """
+    ws.append([str(column) for column in df.columns])
+    for row in df.itertuples(index=False, name=None):
+        ws.append([_to_cell_value(value) for value in row])
+
+
+def _open_workbook(excel_path):
+    """以只读模式打开Excel文件，单元格按行流式读取，不加载整个工作簿"""
+    return load_workbook(excel_path, read_only=True, data_only=True, keep_links=False)
+
+
+def _parse_rows(rows, columns=None):
+    """
+    把一批单元格值解析为DataFrame
+    
+    与pandas.read_excel使用同一个解析器(TextParser)，列类型推断规则相同
+    
+    Args:
+        rows: 行列表，每行为单元格值列表
+        columns: 列名列表，为None时rows的第一行为列名
+    
+    Returns:
+        DataFrame: 解析结果
+    """
+    width = max(len(row) for row in rows)
+    if columns is not None:
+        width = max(width, len(columns))
+    for row in rows:
+        row.extend([''] * (width - len(row)))
+    if columns is None:
+        return TextParser(rows, header=0).read()
+    return TextParser(rows, header=None, names=list(columns)).read()
+
+
+def _iter_sheet_frames(wb, sheet_name, chunksize=None):
+    """
+    逐行读取工作表并按块解析为DataFrame，读取结束后关闭工作簿
+    
+    第一行为列名。单元格值的转换与pandas.read_excel一致(空单元格为空值，
+    整数值的浮点数转换为整数)，整表读取时结果与read_excel相同；分块读取时
+    每块单独推断列类型
+    
+    Args:
+        wb: 只读模式打开的工作簿
+        sheet_name: sheet名
+        chunksize: 每块的最大行数，为None时整表作为一块
+    
+    Yields:
+        DataFrame: 行块，行索引从0开始；整表读取时空表也返回一个DataFrame
+    
+    Raises:
+        ValueError: 工作簿中没有该sheet
+    """
+    try:
+        if sheet_name not in wb.sheetnames:
+            raise ValueError(f"Worksheet named '{sheet_name}' not found")
+        
+        rows = []
+        columns = None
+        for values in wb[sheet_name].iter_rows(values_only=True):
+            row = ['' if value is None
+                   else int(value) if isinstance(value, float) and value.is_integer()
+                   else value
+                   for value in values]
+            # 去掉行尾的空单元格，空行由解析器跳过
+            while row and row[-1] == '':
+                row.pop()
+            rows.append(row)
+            if chunksize is not None and len(rows) >= (chunksize if columns is not None else chunksize + 1):
+                df = _parse_rows(rows, columns)
+                columns = df.columns
+                rows = []
+                if len(df):
+                    yield df
+        
+        if columns is None and not rows:
+            # 空sheet
+            if chunksize is None:
+                yield pd.DataFrame()
+            return
+        if rows:
+            df = _parse_rows(rows, columns)
+            if chunksize is None or len(df):
+                yield df
+    finally:
+        wb.close()
+
+
+class ReadPin:
+    """
+    固定读取版本的句柄(见ExcelDatabase.pin)，调用close或离开with块时释放
+    """
+    
+    def __init__(self, release):
+        self._release = release
+    
+    def close(self):
+        """释放固定的版本，重复调用无效"""
+        release, self._release = self._release, None
+        if release is not None:
+            release()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
 
 class ExcelDatabase:
     """Excel数据库管理基类"""
     
-    def __init__(self, excel_path):
+    # 新建数据库时默认创建的表及其列
+    DEFAULT_TABLES = {
+        'users': [
+            'id', 'user_id', 'openid', 'session_key', 'nickname', 
+            'avatar_url', 'member_level', 'health_goal', 
+            'last_login_time', 'created_at', 'updated_at'
+        ],
+        'recipes': [
+            'id', 'name', 'cook_time', 'calories', 'image', 
+            'description', 'steps', 'difficulty', 
+            'created_at', 'updated_at'
+        ]
+    }
+    
+    # 默认的二级索引: {表名: {列名: 是否唯一}}
+    # recipe_ingredients、user_ingredients的id在现有数据中并不唯一，只建普通索引
+    DEFAULT_INDEXES = {
+        'users': {'id': True, 'user_id': True, 'openid': True},
+        'recipes': {'id': True},
+        'ingredients': {'id': True},
+        'recipe_ingredients': {'recipe_id': False, 'ingredient_id': False},
+        'user_ingredients': {'id': False, 'user_id': False}
+    }
+    
+    def __init__(self, excel_path, journal=False, compact_interval=60, compact_max_bytes=1024 * 1024,
+                 id_block_size=1, snapshots=True, shared_tables=(), default_tables=None, coalesce_window=None):
+        """
+        初始化Excel数据库
+        
+        Args:
+            excel_path: Excel文件路径
+            journal: 是否启用操作日志。启用后写入只追加到日志文件，
+                由后台线程定期合并到Excel文件
+            compact_interval: 日志合并的时间间隔(秒)，为None时不启动后台合并线程
+            compact_max_bytes: 日志文件超过该大小时立即触发合并
+            id_block_size: 每个进程一次预留的自增ID数量
+            snapshots: 是否在 <excel_path>.snapshots 目录中保存各sheet的二进制快照，
+                加载表时优先读取快照，避免解析xlsx
+            shared_tables: 以Arrow格式保存快照、内存映射加载的表名，多个worker进程共享同一份数据，
+                需要同时开启snapshots并安装pyarrow
+            default_tables: 新建数据库时创建的表及其列，为None时使用DEFAULT_TABLES
+            coalesce_window: 写入合并的时间窗口(秒)。设置后由单独的写入线程提交写入，
+                窗口内到达的多个写入合并为一次提交；为None时各写入各自提交
+        """
+        self.excel_path = excel_path
+        self.default_tables = self.DEFAULT_TABLES if default_tables is None else default_tables
+        # 已解析表的缓存: {表名: (文件戳, 表版本号, DataFrame)}
+        self._table_cache = {}
+        # 每个表的内部版本号，write_table成功后递增
+        self._table_versions = {}
+        # 每个表最近一次与存储一致时的(文件戳, 表版本号)，缓存被丢弃后仍然保留，
+        # 重新加载时据此判断其他进程是否修改过数据库(见_current_table)
+        self._seen_stamps = {}
+        # 每个表从存储加载到可能被其他进程修改过的内容的次数，与表版本号一起组成table_version
+        self._load_generations = {}
+        self._cache_lock = threading.RLock()
+        # 声明的二级索引和在缓存表上建立的索引: {表名: (DataFrame, {列名: 索引})}
+        self._index_specs = {table_name: dict(columns) for table_name, columns in self.DEFAULT_INDEXES.items()}
+        self._table_indexes = {}
+        # 串行化写入，保证日志中的提交顺序与缓存中的表版本一致
+        self._write_lock = threading.RLock()
+        # 当前线程进行中的事务(见transaction)
+        self._tx_local = threading.local()
+        # 当前线程持有排他锁的层数(见locked)
+        self._lock_local = threading.local()
+        # 当前线程固定的表版本(见pin)
+        self._pin_local = threading.local()
+        # 表修改事件的订阅者(见subscribe)
+        self.changes = ChangeFeed()
+        # 跨进程(gunicorn多worker)的读写锁，以及每次提交递增的版本号文件
+        self._file_lock = FileLock(excel_path + '.lock')
+        self.version_path = excel_path + '.version'
+        # 各表的自增ID序列
+        self.id_allocator = IdAllocator(excel_path + '.seq.json', self.locked, block_size=id_block_size)
+        # Excel文件中记录的已合并日志序号: (文件戳, 序号)
+        self._meta_cache = None
+        # Excel文件中的sheet名: (文件戳, 表名列表)
+        self._sheet_names_cache = None
+        self.snapshots = SnapshotStore(excel_path + '.snapshots', shared_tables) if snapshots else None
+        self.journal = None
+        self.compact_interval = compact_interval
+        self.compact_max_bytes = compact_max_bytes
+        self._compact_event = threading.Event()
+        self._closed = False
+        
+        if journal:
+            self.journal = TableJournal(excel_path + '.journal')
+        
+        self.ensure_db_exists()
+        
+        # 合并写入的提交队列(见_flush_writes)
+        self._writer = None
+        if coalesce_window:
+            self._writer = CommitQueue(self._flush_writes, coalesce_window, name='excel-db-writer')
+        
+        if (self.journal is not None and compact_interval is not None) or self._writer is not None:
+            if self.journal is not None and compact_interval is not None:
+                threading.Thread(target=self._compact_loop, name='excel-db-compactor', daemon=True).start()
+            # 进程退出前提交排队的写入并合并剩余日志，同时等待进行中的合并写完文件
+            atexit.register(self.close)
+    
+    def _file_stamp(self):
+        """
+        获取Excel文件的戳(修改时间、大小和版本号)，用于判断缓存是否失效
+        
+        任何进程提交写入都会递增版本号，因此其他worker的缓存也会失效。
+        启用操作日志时日志文件的戳也包含在内
+        
+        Returns:
+            tuple: (mtime_ns, size, 版本号, 日志戳)，文件不存在时返回None
+        """
+        try:
+            stat = os.stat(self.excel_path)
+        except OSError:
+            return None
+        journal = None
+        if self.journal is not None:
+            try:
+                journal_stat = os.stat(self.journal.journal_path)
+                journal = (journal_stat.st_mtime_ns, journal_stat.st_size)
+            except OSError:
+                pass
+        return (stat.st_mtime_ns, stat.st_size, self._read_version(), journal)
+    
+    def _workbook_stamp(self):
+        """
+        获取Excel文件本身的戳，用于匹配二进制快照和元数据
+        
+        保存工作簿时通过原子替换生成新文件，因此包含inode
+        
+        Returns:
+            tuple: (mtime_ns, size, inode)，文件不存在时返回None
+        """
+        try:
+            stat = os.stat(self.excel_path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+    
+    def _read_version(self):
+        """读取版本号文件，不存在时返回0"""
+        try:
+            with open(self.version_path, 'r') as f:
+                return int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+    
+    def _bump_version(self):
+        """递增版本号，需要在持有排他锁时调用"""
+        tmp_path = f'{self.version_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(str(self._read_version() + 1))
+        os.replace(tmp_path, self.version_path)
+    
+    @contextmanager
+    def locked(self):
+        """
+        获取数据库的排他锁(同时对其他线程和其他进程生效)
+        
+        "读取-修改-写回"的过程需要在锁内完成，否则并发写入时会丢失其他进程的修改::
+            
+            with excel_db.locked():
+                df = excel_db.read_table('users')
+                ...
+                excel_db.write_table('users', df)
+        """
+        with self._write_lock:
+            with self._file_lock.exclusive():
+                self._lock_local.depth = getattr(self._lock_local, 'depth', 0) + 1
+                try:
+                    yield
+                finally:
+                    self._lock_local.depth -= 1
+    
+    def _save_workbook(self, wb):
+        """先保存到临时文件再原子替换，其他进程不会读到写了一半的文件"""
+        tmp_path = f'{self.excel_path}.{os.getpid()}.tmp'
+        try:
+            wb.save(tmp_path)
+            os.replace(tmp_path, self.excel_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    
+    def _table_view(self, df):
+        """
+        返回缓存表的副本，避免调用方的修改污染缓存
+        
+        开启pandas写时复制模式时(见enable_copy_on_write，create_app按配置开启)返回浅拷贝，
+        不复制数据，调用方修改时pandas才复制被修改的列；否则返回深拷贝。pandas 1.5的写时复制
+        不保护通过.values/to_numpy()写入数组和replace(inplace=True)，调用方不能这样修改读出的表
+        """
+        return df.copy(deep=not _copy_on_write_enabled())
+    
+    def invalidate_cache(self, table_name=None):
+        """
+        使表缓存失效
+        
+        Args:
+            table_name: 表名，为None时清空所有表的缓存
+        """
+        with self._cache_lock:
+            if table_name is None:
+                self._table_cache.clear()
+                self._table_indexes.clear()
+            else:
+                self._table_cache.pop(table_name, None)
+                self._table_indexes.pop(table_name, None)
+    
+    def subscribe(self, callback, tables=None):
+        """
+        订阅表修改事件
+        
+        本进程通过write_table、add_row、update_rows等提交写入后，按表和操作类型
+        发出ChangeEvent(table, op, keys, version)，keys为涉及行的id列表。
+        其他进程提交的修改在本进程下一次读取该表时以replace事件通知(keys为None)。
+        
+        Args:
+            callback: 接收ChangeEvent的函数，在提交写入的线程中、释放锁之后调用
+            tables: 关注的表名(字符串或列表)，为None时接收所有表的事件
+        
+        Returns:
+            function: 调用后取消订阅
+        """
+        return self.changes.subscribe(callback, tables)
+    
+    def _after_write(self, table_name, stamp_before, df=None):
+        """
+        写入成功后更新缓存状态
+        
+        Args:
+            table_name: 被写入的表名
+            stamp_before: 写入前的文件戳
+            df: 写入后表的完整内容，提供时直接作为该表的新缓存
+        
+        Returns:
+            dict: {表名: 写入后的版本号}
+        """
+        return self._after_write_tables({table_name: df}, stamp_before)
+    
+    def _after_write_tables(self, frames, stamp_before):
+        """
+        一次提交写入一张或多张表后更新缓存状态
+        
+        被写入表的版本号递增并丢弃其缓存；其他表的内容未变，
+        如果其缓存与写入前的文件一致，则直接更新为新的文件戳继续使用
+        
+        Args:
+            frames: {被写入的表名: 写入后表的完整内容或None}，提供内容时直接作为该表的新缓存
+            stamp_before: 写入前的文件戳
+        
+        Returns:
+            dict: {表名: 写入后的版本号}
+        """
+        self._bump_version()
+        stamp_after = self._file_stamp()
+        with self._cache_lock:
+            versions = {}
+            for table_name in frames:
+                versions[table_name] = self._table_versions.get(table_name, 0) + 1
+                self._table_versions[table_name] = versions[table_name]
+                self._table_cache.pop(table_name, None)
+                self._table_indexes.pop(table_name, None)
+            self._restamp_cache(stamp_before, stamp_after)
+            if stamp_before is not None:
+                for table_name, df in frames.items():
+                    self._seen_stamps[table_name] = (stamp_after, versions[table_name])
+                    if df is not None:
+                        self._table_cache[table_name] = (stamp_after, versions[table_name], df)
+        return versions
+    
+    def ensure_db_exists(self):
+        """确保数据库文件及默认表存在，不存在则创建"""
+        if not os.path.exists(self.excel_path):
+            with self.locked():
+                # 其他进程可能已经抢先创建
+                if not os.path.exists(self.excel_path):
+                    # 创建Excel文件，每个表保存为一个sheet
+                    wb = Workbook()
+                    wb.remove(wb.active)
+                    for table_name, columns in self.default_tables.items():
+                        _fill_sheet(wb.create_sheet(table_name), pd.DataFrame(columns=columns))
+                    self._save_workbook(wb)
+                    if self.snapshots is not None:
+                        self.snapshots.commit(None, None, ())
+                    self._bump_version()
+            self.invalidate_cache()
+        else:
+            # 检查默认表是否存在，不存在则只追加缺少的sheet
+            existing_tables = set(self.list_tables())
+            for table_name, columns in self.default_tables.items():
+                if table_name not in existing_tables:
+                    self.ensure_table_exists(table_name, columns)
+    
+    def list_tables(self):
+        """
+        获取数据库中所有表名
+        
+        Returns:
+            list: 表名列表
+        """
+        stamp = self._workbook_stamp()
+        if stamp is None:
+            return []
+        # sheet名按Excel文件戳缓存，add_row等每次写入前的检查不再重新打开文件
+        cached = self._sheet_names_cache
+        if cached is not None and cached[0] == stamp:
+            return list(cached[1])
+        
+        wb = _open_workbook(self.excel_path)
+        try:
+            names = [name for name in wb.sheetnames if name != META_SHEET]
+        finally:
+            wb.close()
+        self._sheet_names_cache = (stamp, names)
+        return list(names)
+    
+    def read_table(self, table_name):
+        """
+        读取指定表的数据
+        
+        Args:
+            table_name: 表名(sheet名)
+        
+        Returns:
+            DataFrame: 表数据
+        """
+        try:
+            df = self._get_table(table_name)
+            if df is None:
+                print(f"数据库文件不存在: {self.excel_path}")
+                return pd.DataFrame()
+            return self._table_view(df)
+        except Exception as e:
+            print(f"读取表 {table_name} 失败: {str(e)}")
+            # 返回空DataFrame
+            return pd.DataFrame()
+    
+    def _get_table(self, table_name):
+        """
+        获取表的缓存DataFrame，缓存失效时重新加载
+        
+        返回的是缓存对象本身，调用方不能修改。当前线程固定了读取版本(见pin)时
+        返回固定的版本
+        
+        Args:
+            table_name: 表名(sheet名)
+        
+        Returns:
+            DataFrame: 表数据，数据库文件不存在时返回None
+        """
+        # 当前线程的事务中修改过的表，读取事务内的版本
+        tx = self._transaction_state()
+        if tx is not None and table_name in tx['tables']:
+            return tx['tables'][table_name]
+        
+        pinned = self._pinned_tables()
+        if pinned is None:
+            return self._current_table(table_name)
+        df = pinned.get(table_name)
+        if df is None:
+            df = self._current_table(table_name)
+            if df is not None:
+                pinned[table_name] = df
+        return df
+    
+    def _current_table(self, table_name):
+        """
+        获取表的最新已发布版本
+        
+        缓存中的表是不可变的版本: 写入提交时发布新版本，读取方持有的旧版本不受影响。
+        缓存失效需要重新加载时，如果有旧版本而存储正在被写入(锁被占用)，不等待写入
+        完成而是先返回旧版本；加载失败时同样继续使用旧版本
+        
+        Args:
+            table_name: 表名(sheet名)
+        
+        Returns:
+            DataFrame: 表数据，数据库文件不存在时返回None
+        """
+        # 先取文件戳再读取，读取期间文件被修改时下次读取会发现戳不一致
+        stamp = self._file_stamp()
+        if stamp is None:
+            return None
+        
+        with self._cache_lock:
+            version = self._table_versions.get(table_name, 0)
+            cached = self._cached_table(table_name, stamp)
+            if cached is not None:
+                return cached
+            # 缓存因文件戳变化而失效、本进程又没有写入该表，说明其他进程修改了数据库。
+            # 按最近一次一致时的文件戳判断，缓存已被丢弃(例如本进程写入其他表时)的表同样能发现
+            previous = self._table_cache.get(table_name)
+            seen = self._seen_stamps.get(table_name)
+            changed_elsewhere = seen is not None and seen[1] == version and seen[0] != stamp
+        
+        try:
+            # 加载时统一转换列类型，业务代码不再需要逐行转换
+            df = apply_schema(table_name, self._load_table(table_name, blocking=previous is None))
+        except BlockingIOError:
+            # 其他线程或进程正在写入，先返回上一个版本
+            return previous[2]
+        except Exception as e:
+            if previous is None:
+                raise
+            print(f"加载表 {table_name} 失败，继续使用上一个版本: {str(e)}")
+            return previous[2]
+        
+        with self._cache_lock:
+            # 读取期间没有发生写入才放入缓存
+            if self._table_versions.get(table_name, 0) == version:
+                self._table_cache[table_name] = (stamp, version, df)
+                if self._seen_stamps.get(table_name) != (stamp, version):
+                    self._load_generations[table_name] = self._load_generations.get(table_name, 0) + 1
+                    self._seen_stamps[table_name] = (stamp, version)
+        
+        if changed_elsewhere:
+            self.changes.publish([ChangeEvent(table_name, 'replace', None, version)])
+        return df
+    
+    def pin(self):
+        """
+        固定当前线程读取的表版本，直到返回的句柄被释放
+        
+        期间read_table、get_by、select等读取同一张表时总是得到同一个版本(可重复读)，
+        其他线程和进程提交的写入不可见，也不会让读取等待；本线程自己写入的表
+        在写入后读到新版本。固定时已在缓存中的表一起固定，保证这些表来自同一次提交。
+        嵌套调用时并入外层的固定::
+            
+            with excel_db.pin():
+                users = excel_db.read_table('users')
+                ...
+        
+        Returns:
+            ReadPin: 固定版本的句柄
+        """
+        state = getattr(self._pin_local, 'state', None)
+        if state is None:
+            stamp = self._file_stamp()
+            tables = {}
+            if stamp is not None:
+                with self._cache_lock:
+                    for table_name in list(self._table_cache):
+                        df = self._cached_table(table_name, stamp)
+                        if df is not None:
+                            tables[table_name] = df
+            state = {'tables': tables, 'depth': 0}
+            self._pin_local.state = state
+        state['depth'] += 1
+        return ReadPin(self._release_pin)
+    
+    def snapshot(self):
+        """
+        获取所有表在同一次提交后的数据，用于备份等需要一致视图的场景
+        
+        只在取得各表期间持有共享锁(已缓存的表不需要重新加载)，返回的是不可变的表版本，
+        之后的写入不会影响它
+        
+        Returns:
+            tuple: (版本号, {表名: DataFrame})，数据库文件不存在时表为空字典
+        """
+        with self._file_lock.shared():
+            version = self._read_version()
+            tables = {}
+            for table_name in self.list_tables():
+                df = self._current_table(table_name)
+                if df is not None:
+                    tables[table_name] = df
+        return version, tables
+    
+    @contextmanager
+    def unpinned(self):
+        """
+        在with块中忽略当前线程固定的版本(见pin)，读取最新版本
+        
+        用于在请求中维护派生数据(索引、汇总等)，避免把请求开始时的旧版本写入派生数据
+        """
+        state = getattr(self._pin_local, 'state', None)
+        self._pin_local.state = None
+        try:
+            yield
+        finally:
+            self._pin_local.state = state
+    
+    def refresh(self, table_name):
+        """
+        确保表的缓存是最新的: 其他进程修改过该表时重新加载，并以replace事件通知订阅者
+        
+        维护派生数据的订阅者在使用派生数据前调用，表未变化时只检查一次文件戳
+        
+        Args:
+            table_name: 表名
+        """
+        self._current_table(table_name)
+    
+    def table_version(self, table_name, user_id=None):
+        """
+        表内容的版本: 本进程写入该表或发现其他进程修改过数据库后改变，写入其他表时不变
+        
+        先确保缓存是最新的(见refresh)。维护派生数据的订阅者保存建立时的版本，使用前与
+        当前版本比较，不一致时重新建立，不只依赖修改事件
+        
+        Args:
+            table_name: 表名
+            user_id: 按用户维护的派生数据传入的用户id，分区数据库(见PartitionedDatabase)只返回
+                该用户所在分区的版本；这里不分区，忽略
+        
+        Returns:
+            tuple: (本进程的表版本号, 从存储加载的次数)
+        """
+        self._current_table(table_name)
+        with self._cache_lock:
+            return (self._table_versions.get(table_name, 0), self._load_generations.get(table_name, 0))
+    
+    def _release_pin(self):
+        state = self._pin_local.state
+        state['depth'] -= 1
+        if not state['depth']:
+            self._pin_local.state = None
+    
+    def _pinned_tables(self):
+        """
+        当前线程固定的表: {表名: DataFrame}，没有固定时返回None
+        
+        持有排他锁时(写入过程中)总是读取最新版本，否则会在旧版本上生成修改
+        """
+        state = getattr(self._pin_local, 'state', None)
+        if state is None or getattr(self._lock_local, 'depth', 0):
+            return None
+        return state['tables']
+    
+    def _unpin(self, table_names):
+        """本线程写入表后不再固定其旧版本"""
+        state = getattr(self._pin_local, 'state', None)
+        if state is not None:
+            for table_name in table_names:
+                state['tables'].pop(table_name, None)
+    
+    def _restamp_cache(self, stamp_before, stamp_after):
+        """
+        本进程提交后更新缓存的文件戳，需要在持有_cache_lock时调用
+        
+        与提交前的文件一致的缓存表内容未变，更新为新的文件戳继续使用；其他缓存表在提交前
+        就已过期(其他进程修改过数据库)，丢弃后由重新加载发现修改并通知订阅者
+        
+        Args:
+            stamp_before: 提交前的文件戳
+            stamp_after: 提交后的文件戳
+        """
+        for name, (stamp, version, df) in list(self._table_cache.items()):
+            if stamp_before is not None and stamp == stamp_before:
+                self._table_cache[name] = (stamp_after, version, df)
+                self._seen_stamps[name] = (stamp_after, version)
+            else:
+                del self._table_cache[name]
+    
+    def _cached_table(self, table_name, stamp):
+        """返回与文件戳一致的缓存表，没有时返回None"""
+        with self._cache_lock:
+            cached = self._table_cache.get(table_name)
+            if (cached is not None and cached[0] == stamp
+                    and cached[1] == self._table_versions.get(table_name, 0)):
+                return cached[2]
+        return None
+    
+    def declare_index(self, table_name, column, unique=False):
+        """
+        声明表上的二级索引
+        
+        索引在第一次按该列查询时根据缓存的表建立，表被写入后随新的缓存重新建立。
+        唯一索引会在写入时检查该列的非空值是否重复
+        
+        Args:
+            table_name: 表名
+            column: 列名
+            unique: 是否唯一
+        """
+        with self._cache_lock:
+            self._index_specs.setdefault(table_name, {})[column] = unique
+            self._table_indexes.pop(table_name, None)
+    
+    def get_by(self, table_name, column, value):
+        """
+        通过索引按列值查询表中的行
+        
+        Args:
+            table_name: 表名
+            column: 列名，未声明索引时按需建立普通索引
+            value: 要查找的值
+        
+        Returns:
+            DataFrame: 匹配的行(行号与read_table返回的表一致)，未找到时为空
+        """
+        try:
+            df = self._get_table(table_name)
+            if df is None:
+                print(f"数据库文件不存在: {self.excel_path}")
+                return pd.DataFrame()
+            if column not in df.columns:
+                return df.iloc[0:0].copy()
+            
+            positions = self._get_index(table_name, df, column).get(value)
+            if positions is None:
+                return df.iloc[0:0].copy()
+            return df.iloc[positions].copy()
+        except TypeError:
+            # 查找的值不可哈希(例如列表)
+            return pd.DataFrame()
+        except Exception as e:
+            print(f"按 {table_name}.{column} 查询失败: {str(e)}")
+            return pd.DataFrame()
+    
+    def select(self, table_name, where=None, columns=None, order_by=None, limit=None):
+        """
+        按条件查询表，只取出需要的行和列
+        
+        等值条件通过索引查找，排序只在匹配的行上进行，结果只包含columns中的列，
+        不会复制整张表
+        
+        Args:
+            table_name: 表名
+            where: {列名: 值}，值为list/tuple/set时匹配其中任意一个；
+                也可以是接收DataFrame、返回布尔序列的函数。为None时不过滤
+            columns: 需要返回的列名列表，为None时返回所有列
+            order_by: 排序的列名或列名列表，列名前加'-'表示降序，空值排在最后
+            limit: 最多返回的行数
+        
+        Returns:
+            DataFrame: 查询结果(行号重新编为0..n-1)，查询失败时返回空DataFrame
+        """
+        try:
+            df = self._get_table(table_name)
+            if df is None:
+                print(f"数据库文件不存在: {self.excel_path}")
+                return pd.DataFrame()
+            
+            positions = np.arange(len(df)) if where is None else \
+                df.index.get_indexer(self._match_labels(table_name, df, where))
+            
+            if order_by:
+                sort_columns, ascending = _parse_order_by(order_by)
+                keys = df[sort_columns].iloc[positions].reset_index(drop=True)
+                order = keys.sort_values(sort_columns, ascending=ascending, kind='mergesort', na_position='last').index
+                positions = positions[order.to_numpy()]
+            if limit is not None:
+                positions = positions[:max(int(limit), 0)]
+            
+            column_positions = slice(None) if columns is None else _column_positions(df, columns)
+            return df.iloc[positions, column_positions].reset_index(drop=True)
+        except Exception as e:
+            print(f"查询表 {table_name} 失败: {str(e)}")
+            return pd.DataFrame()
+    
+    def iter_table(self, table_name, chunksize=1000):
+        """
+        分块读取表数据，用于扫描大表
+        
+        表已在缓存中时按块切分缓存；否则从存储中流式读取，内存中只保留当前块，
+        读出的数据不放入缓存。各块的列类型单独推断，按表结构转换的列在各块中一致
+        
+        Args:
+            table_name: 表名
+            chunksize: 每块的最大行数
+        
+        Yields:
+            DataFrame: 连续的行块，行索引与read_table的结果一致，读取失败时停止
+        """
+        chunksize = max(int(chunksize), 1)
+        try:
+            df = self._resident_table(table_name)
+            chunks = self._stream_table(table_name, chunksize) if df is None else None
+            if chunks is None:
+                if df is None:
+                    df = self._get_table(table_name)
+                if df is None:
+                    print(f"数据库文件不存在: {self.excel_path}")
+                    return
+                for start in range(0, len(df), chunksize):
+                    yield self._table_view(df.iloc[start:start + chunksize])
+                return
+            
+            offset = 0
+            for chunk in chunks:
+                if chunk.empty:
+                    continue
+                chunk = apply_schema(table_name, chunk)
+                chunk.index = pd.RangeIndex(offset, offset + len(chunk))
+                offset += len(chunk)
+                yield chunk
+        except Exception as e:
+            print(f"分块读取表 {table_name} 失败: {str(e)}")
+    
+    def _resident_table(self, table_name):
+        """返回当前事务中、本线程固定的或缓存中的表，需要从存储加载时返回None"""
+        tx = self._transaction_state()
+        if tx is not None and table_name in tx['tables']:
+            return tx['tables'][table_name]
+        pinned = self._pinned_tables()
+        if pinned is not None and table_name in pinned:
+            return pinned[table_name]
+        stamp = self._file_stamp()
+        if stamp is None:
+            return None
+        return self._cached_table(table_name, stamp)
+    
+    def _stream_table(self, table_name, chunksize):
+        """
+        从存储中流式读取一张表
+        
+        Args:
+            table_name: 表名
+            chunksize: 每块的最大行数
+        
+        Returns:
+            iterator: 逐块返回DataFrame(行索引不连续，由调用方重新编号)；
+                需要加载整张表时返回None(共享表、有未合并的日志、数据库文件不存在)
+        """
+        if self.snapshots is not None and table_name in self.snapshots.shared_tables:
+            # 共享表以内存映射方式加载，不占用额外内存
+            return None
+        with self._file_lock.shared():
+            if not os.path.exists(self.excel_path):
+                return None
+            if self.journal is not None and any(
+                    op.get('table') == table_name
+                    for batch in self.journal.read_batches(after_seq=self._snapshot_journal_seq())
+                    for op in batch['ops']):
+                return None
+            # 工作簿保存时原子替换文件，已打开的工作簿在释放锁后仍读取当前版本
+            wb = _open_workbook(self.excel_path)
+        return _iter_sheet_frames(wb, table_name, chunksize)
+    
+    def _get_index(self, table_name, df, column):
+        """
+        获取缓存表上某一列的索引，不存在或表已变化时重新建立
+        
+        Args:
+            table_name: 表名
+            df: 当前缓存的表(_get_table的返回值)
+            column: 列名
+        
+        Returns:
+            dict: {列值: 行位置数组}
+        """
+        with self._cache_lock:
+            entry = self._table_indexes.get(table_name)
+            if entry is None or entry[0] is not df:
+                entry = (df, {})
+                self._table_indexes[table_name] = entry
+            index = entry[1].get(column)
+        
+        if index is None:
+            index = _build_index(df[column])
+            if self._index_specs.get(table_name, {}).get(column) and any(len(positions) > 1 for positions in index.values()):
+                print(f"唯一索引 {table_name}.{column} 中存在重复值")
+            with self._cache_lock:
+                entry[1][column] = index
+        return index
+    
+    def _check_unique(self, table_name, df):
+        """
+        检查写入的表是否违反唯一索引
+        
+        Args:
+            table_name: 表名
+            df: 要写入的DataFrame
+        
+        Raises:
+            ValueError: 唯一索引列中存在重复的非空值
+        """
+        for column, unique in self._index_specs.get(table_name, {}).items():
+            if unique and column in df.columns:
+                values = df[column].dropna()
+                if values.duplicated().any():
+                    raise ValueError(f"唯一索引 {table_name}.{column} 存在重复值: {values[values.duplicated()].iloc[0]}")
+    
+    def write_table(self, table_name, df):
+        """
+        写入数据到指定表
+        
+        启用操作日志或在事务中时只提交与当前数据的差异
+        
+        Args:
+            table_name: 表名(sheet名)
+            df: 要写入的DataFrame
+        
+        Returns:
+            bool: 是否成功
+        """
+        try:
+            self._check_unique(table_name, df)
+            if (self._transaction_state() is not None
+                    or ((self.journal is not None or self._queue_writes()) and table_name in self.list_tables())):
+                self._commit_ops(table_name, lambda old_df: diff_table_ops(old_df, df))
+                return True
+            
+            with self.locked():
+                stamp_before = self._file_stamp()
+                if not self._save_table(table_name, df):
+                    # 其他表没有被原样保留，缓存全部作废
+                    stamp_before = None
+                versions = self._after_write(table_name, stamp_before)
+            self._unpin([table_name])
+            self.changes.publish([ChangeEvent(table_name, 'replace', None, versions[table_name])])
+            return True
+        except Exception as e:
+            print(f"写入表 {table_name} 失败: {str(e)}")
+            return False
+    
+    def _commit_ops(self, table_name, make_ops, where=None):
+        """
+        在锁内根据表的最新数据生成行级操作并提交
+        
+        启用操作日志时操作作为一次提交追加到日志；否则由_write_transaction写入存储。
+        在事务中时只应用到事务内的表上，事务结束时统一提交
+        
+        Args:
+            table_name: 表名
+            make_ops: 根据表的当前数据生成操作列表(格式见TableJournal)的函数
+            where: make_ops只用到满足该条件({列名: 值})的行时传入，只插入、不用到任何行时为False，
+                支持按条件读写的存储引擎(SQLite)可以只读取这些行；Excel存储总是读取整张表
+        
+        Returns:
+            DataFrame: 提交后的表(缓存对象，调用方不能修改)
+        """
+        tx = self._transaction_state()
+        if tx is not None:
+            return self._buffer_ops(tx, table_name, make_ops)
+        if self._queue_writes():
+            # 交给写入线程，与同一时间窗口内的其他写入合并为一次提交
+            new_df = self._writer.submit(table_name, make_ops).result()
+            self._unpin([table_name])
+            return new_df
+        
+        with self.locked():
+            # 在锁内重新获取表的最新数据，包含其他进程已提交的修改
+            stamp_before = self._file_stamp()
+            old_df = self._get_table(table_name)
+            ops = make_ops(old_df)
+            if not ops:
+                return old_df
+            
+            for op in ops:
+                op['table'] = table_name
+            new_df = apply_table_ops(old_df, ops, table_name)
+            self._check_unique(table_name, new_df)
+            
+            versions = self._commit_steps({table_name: new_df}, [(table_name, ops, new_df)], stamp_before)
+        
+        self._unpin([table_name])
+        self._after_commit(ops, versions)
+        return new_df
+    
+    def _queue_writes(self):
+        """
+        写入是否交给写入线程
+        
+        写入线程本身(例如修改事件的回调中)和已持有排他锁的线程直接提交，
+        否则会等待需要同一把锁的写入线程而死锁
+        """
+        return (self._writer is not None and not self._writer.in_writer_thread()
+                and not getattr(self._lock_local, 'depth', 0))
+    
+    def _commit_steps(self, tables, steps, stamp_before):
+        """
+        把已应用到内存中的修改作为一次提交写入，需要在持有排他锁时调用
+        
+        启用操作日志时所有操作追加为日志中的一行，否则由_write_transaction一次写入存储
+        
+        Args:
+            tables: {表名: 修改后的表}
+            steps: [(表名, 操作列表, 操作后的表)]，按执行顺序排列
+            stamp_before: 修改前的文件戳
+        
+        Returns:
+            dict: {表名: 提交后的版本号}
+        """
+        if self.journal is not None:
+            # 日志可能已被其他进程合并并清空，序号需要接着Excel中记录的已合并序号
+            self.journal.last_seq = max(self.journal.last_seq, self._snapshot_journal_seq())
+            self.journal.append([op for _, ops, _ in steps for op in ops])
+            return self._after_write_tables(tables, stamp_before)
+        
+        if not self._write_transaction(steps):
+            # 其他表没有被原样保留，缓存全部作废
+            stamp_before = None
+        return self._after_write_tables(dict.fromkeys(tables), stamp_before)
+    
+    def _after_commit(self, ops, versions):
+        """提交并释放锁后: 日志过大时触发合并，并通知订阅者"""
+        if self.journal is not None and self.journal.size() >= self.compact_max_bytes:
+            self._compact_event.set()
+        self.changes.publish(events_from_ops(ops, versions))
+    
+    def _write_transaction(self, steps):
+        """
+        把一次提交中的所有修改写入存储(不使用操作日志时)，需要在持有排他锁时调用
+        
+        Excel存储把涉及的表在一次工作簿保存中写入
+        
+        Args:
+            steps: [(表名, 操作列表, 操作后的表)]，按执行顺序排列
+        
+        Returns:
+            bool: 其他表是否原样保留
+        """
+        frames = {}
+        for table_name, _, new_df in steps:
+            frames[table_name] = new_df
+        return self._save_tables(frames)
+    
+    def _transaction_state(self):
+        """当前线程进行中的事务，没有时返回None"""
+        return getattr(self._tx_local, 'state', None)
+    
+    @contextmanager
+    def transaction(self):
+        """
+        在一个事务中修改多张表
+        
+        事务内的write_table、add_row、update_rows、delete_rows等写入先在内存中生效
+        (本线程读取时可以看到)，离开with块时作为一次提交写入: 启用操作日志时追加为
+        日志中的一行，否则对Excel只保存一次工作簿、对SQLite只执行一个事务。
+        with块中抛出异常或有写入失败时放弃所有修改。事务期间持有排他锁，
+        其他线程和进程的写入需要等待；在事务中再次调用transaction()时并入外层事务。
+        
+        Raises:
+            RuntimeError: 事务中有写入失败，所有修改已放弃
+        """
+        if self._transaction_state() is not None:
+            yield
+            return
+        
+        with self.locked():
+            tx = {'tables': {}, 'steps': [], 'failed': False}
+            self._tx_local.state = tx
+            try:
+                yield
+            finally:
+                self._tx_local.state = None
+            
+            if tx['failed']:
+                raise RuntimeError("事务中有写入失败，已放弃本次事务的所有修改")
+            if not tx['steps']:
+                return
+            versions = self._commit_steps(tx['tables'], tx['steps'], self._file_stamp())
+        
+        self._unpin(tx['tables'])
+        self._after_commit([op for _, ops, _ in tx['steps'] for op in ops], versions)
+    
+    def _flush_writes(self, batch):
+        """
+        写入线程: 把一批排队的写入作为一次提交写入
+        
+        各写入依次应用在前一个写入之后的表上(与事务相同)，某个写入失败时只撤销它自己，
+        它的Future得到异常，同一批中的其他写入照常提交
+        
+        Args:
+            batch: [(表名, make_ops, Future)]
+        """
+        results = []
+        with self.locked():
+            stamp_before = self._file_stamp()
+            tx = {'tables': {}, 'steps': [], 'failed': False}
+            self._tx_local.state = tx
+            try:
+                for table_name, make_ops, future in batch:
+                    tables, step_count = dict(tx['tables']), len(tx['steps'])
+                    try:
+                        results.append((future, self._buffer_ops(tx, table_name, make_ops)))
+                    except Exception as e:
+                        tx['tables'] = tables
+                        del tx['steps'][step_count:]
+                        tx['failed'] = False
+                        future.set_exception(e)
+            finally:
+                self._tx_local.state = None
+            versions = self._commit_steps(tx['tables'], tx['steps'], stamp_before) if tx['steps'] else {}
+        
+        # 先通知订阅者再唤醒等待的请求，请求返回后读到的派生数据已经更新
+        self._after_commit([op for _, ops, _ in tx['steps'] for op in ops], versions)
+        for future, new_df in results:
+            future.set_result(new_df)
+    
+    def _buffer_ops(self, tx, table_name, make_ops):
+        """
+        在事务内的表上应用一次修改
+        
+        每次修改的操作带有相同的group编号，重放日志时按编号依次应用，
+        保证后一次修改中的行号对应前一次修改后的表。表还不存在时从空表开始，
+        提交时创建(启用操作日志时不支持，日志只能记录已有表上的操作)
+        """
+        try:
+            try:
+                old_df = self._get_table(table_name)
+                created = False
+            except Exception:
+                if self._has_table(table_name):
+                    raise
+                old_df = pd.DataFrame()
+                created = True
+            if old_df is None:
+                raise RuntimeError(f"数据库文件不存在: {self.excel_path}")
+            ops = make_ops(old_df)
+            if not ops:
+                return old_df
+            if created and self.journal is not None:
+                raise RuntimeError(f"启用操作日志时不能在事务中创建表 {table_name}，请先在事务外调用ensure_table_exists创建")
+            
+            group = len(tx['steps'])
+            for op in ops:
+                op['table'] = table_name
+                op['group'] = group
+            new_df = apply_table_ops(old_df, ops, table_name)
+            self._check_unique(table_name, new_df)
+        except Exception:
+            # 写入失败时整个事务回滚
+            tx['failed'] = True
+            raise
+        
+        tx['tables'][table_name] = new_df
+        tx['steps'].append((table_name, ops, new_df))
+        return new_df
+    
+    def _has_table(self, table_name):
+        """表是否存在，包括当前线程的事务中新建、尚未提交的表"""
+        tx = self._transaction_state()
+        if tx is not None and table_name in tx['tables']:
+            return True
+        return table_name in self.list_tables()
+    
+    def _match_labels(self, table_name, df, where):
+        """
+        查找满足条件的行
+        
+        Args:
+            table_name: 表名
+            df: 当前缓存的表
+            where: {列名: 值}(各列都相等，通过索引查找；值为list/tuple/set时匹配其中任意一个)，
+                或接收DataFrame、返回布尔序列的函数
+        
+        Returns:
+            Index: 满足条件的行号
+        """
+        if callable(where):
+            return df.index[np.asarray(where(df), dtype=bool)]
+        
+        positions = None
+        for column, value in where.items():
+            if column not in df.columns:
+                return df.index[:0]
+            index = self._get_index(table_name, df, column)
+            if isinstance(value, (list, tuple, set, frozenset)):
+                found = [index[item] for item in set(value) if item in index]
+                matched = np.unique(np.concatenate(found)) if found else None
+            else:
+                matched = index.get(value)
+            if matched is None:
+                return df.index[:0]
+            positions = matched if positions is None else np.intersect1d(positions, matched)
+        if positions is None:
+            return df.index
+        return df.index[np.sort(positions)]
+    
+    def _row_key(self, df, label):
+        """行的id，记录在操作中便于排查"""
+        return to_storage_value(df.at[label, 'id']) if 'id' in df.columns else None
+    
+    def next_id(self, table_name):
         """
-        初始化Excel数据库
+        为表分配一个新的自增ID，不需要读取整张表
         
         Args:
-            excel_path: Excel文件路径
+            table_name: 表名
+        
+        Returns:
+            int: 新ID
         """
-        self.excel_path = excel_path
-        self.ensure_db_exists()
+        return self.allocate_ids(table_name, 1)[0]
     
-    def ensure_db_exists(self):
-        """确保数据库文件存在，不存在则创建"""
-        if not os.path.exists(self.excel_path):
-            # 创建用户表
-            users_df = pd.DataFrame(columns=[
-                'id', 'user_id', 'openid', 'session_key', 'nickname', 
-                'avatar_url', 'member_level', 'health_goal', 
-                'last_login_time', 'created_at', 'updated_at'
-            ])
-            
-            # 创建菜谱表
-            recipes_df = pd.DataFrame(columns=[
-                'id', 'name', 'cook_time', 'calories', 'image', 
-                'description', 'steps', 'difficulty', 
-                'created_at', 'updated_at'
-            ])
+    def allocate_ids(self, table_name, count):
+        """
+        为表分配一批自增ID
+        
+        Args:
+            table_name: 表名
+            count: 数量
+        
+        Returns:
+            list: 新ID列表
+        """
+        return self.id_allocator.allocate(table_name, count, seed=lambda: self._seed_id(table_name))
+    
+    def _seed_id(self, table_name):
+        """表中现有最大ID加1，用于第一次分配时校正序列"""
+        try:
+            df = self._get_table(table_name)
+        except Exception:
+            # 表还不存在
+            return 1
+        if df is None or 'id' not in df.columns:
+            return 1
+        max_id = pd.to_numeric(df['id'], errors='coerce').max()
+        return 1 if pd.isna(max_id) else int(max_id) + 1
+    
+    def update_rows(self, table_name, key, values, limit=None):
+        """
+        更新满足条件的行中的指定列，只记录被修改的行
+        
+        Args:
+            table_name: 表名
+            key: 查找条件，{列名: 值}或接收DataFrame、返回布尔序列的函数
+            values: 要更新的数据字典
+            limit: 最多更新的行数，None表示不限制
+        
+        Returns:
+            DataFrame: 更新后的行，没有满足条件的行时为空，失败时返回None
+        """
+        matched = []
+        
+        def make_ops(df):
+            labels = self._match_labels(table_name, df, key)[:limit]
+            matched.extend(labels)
+            row_values = {str(column): to_storage_value(value) for column, value in values.items()}
+            return [{
+                'op': 'update',
+                'pos': int(label),
+                'key': self._row_key(df, label),
+                'values': dict(row_values)
+            } for label in labels]
+        
+        try:
+            new_df = self._commit_ops(table_name, make_ops, where=key if isinstance(key, dict) else None)
+            return new_df.loc[matched].copy()
+        except Exception as e:
+            print(f"更新表 {table_name} 失败: {str(e)}")
+            return None
+    
+    def delete_rows(self, table_name, predicate, limit=None):
+        """
+        删除满足条件的行
+        
+        Args:
+            table_name: 表名
+            predicate: 删除条件，{列名: 值}或接收DataFrame、返回布尔序列的函数
+            limit: 最多删除的行数，None表示不限制
+        
+        Returns:
+            int: 删除的行数，失败时返回None
+        """
+        matched = []
+        
+        def make_ops(df):
+            labels = self._match_labels(table_name, df, predicate)[:limit]
+            matched.extend(labels)
+            return [{'op': 'delete', 'pos': int(label), 'key': self._row_key(df, label)} for label in labels]
+        
+        try:
+            self._commit_ops(table_name, make_ops, where=predicate if isinstance(predicate, dict) else None)
+            return len(matched)
+        except Exception as e:
+            print(f"删除表 {table_name} 中的行失败: {str(e)}")
+            return None
+    
+    def upsert(self, table_name, key, row):
+        """
+        满足条件的行存在时更新，否则插入新行
+        
+        Args:
+            table_name: 表名
+            key: 查找条件，{列名: 值}，插入时也会写入新行
+            row: 要更新或插入的数据字典
+        
+        Returns:
+            dict: 更新或插入后的第一行数据，失败时返回None
+        """
+        matched = []
+        
+        def make_ops(df):
+            labels = self._match_labels(table_name, df, key)
+            matched.extend(labels)
+            row_values = {str(column): to_storage_value(value) for column, value in row.items()}
+            if len(labels):
+                return [{
+                    'op': 'update',
+                    'pos': int(label),
+                    'key': self._row_key(df, label),
+                    'values': dict(row_values)
+                } for label in labels]
             
-            # 创建Excel文件，每个表保存为一个sheet
-            with pd.ExcelWriter(self.excel_path, engine='openpyxl') as writer:
-                users_df.to_excel(writer, sheet_name='users', index=False)
-                recipes_df.to_excel(writer, sheet_name='recipes', index=False)
-        else:
-            # 检查是否存在recipes表，如果不存在则创建
-            try:
-                with pd.ExcelFile(self.excel_path, engine='openpyxl') as xls:
-                    sheet_names = xls.sheet_names
-                    
-                if 'recipes' not in sheet_names:
-                    # 创建菜谱表
-                    recipes_df = pd.DataFrame(columns=[
-                        'id', 'name', 'cook_time', 'calories', 'image', 
-                        'description', 'steps', 'difficulty', 
-                        'created_at', 'updated_at'
-                    ])
-                    
-                    # 读取所有现有表
-                    dfs = {}
-                    for sheet in sheet_names:
-                        dfs[sheet] = pd.read_excel(self.excel_path, sheet_name=sheet, engine='openpyxl')
-                    
-                    # 添加新表并写回Excel
-                    with pd.ExcelWriter(self.excel_path, engine='openpyxl') as writer:
-                        for sheet, df in dfs.items():
-                            df.to_excel(writer, sheet_name=sheet, index=False)
-                        recipes_df.to_excel(writer, sheet_name='recipes', index=False)
-            except Exception as e:
-                print(f"检查recipes表失败: {str(e)}")
+            new_row = {str(column): to_storage_value(value) for column, value in key.items()}
+            new_row.update(row_values)
+            return [{'op': 'insert', 'row': new_row}]
+        
+        try:
+            new_df = self._commit_ops(table_name, make_ops, where=key)
+            label = matched[0] if matched else new_df.index[-1]
+            return new_df.loc[label].to_dict()
+        except Exception as e:
+            print(f"更新或插入表 {table_name} 失败: {str(e)}")
+            return None
     
-    def read_table(self, table_name):
+    def _load_table(self, table_name, blocking=True):
         """
-        读取指定表的数据
+        从存储中加载一张表，不经过缓存
+        
+        启用操作日志时在Excel中的数据上重放尚未合并的日志
         
         Args:
             table_name: 表名(sheet名)
-            
+            blocking: 为False时不等待正在进行的写入
+        
         Returns:
             DataFrame: 表数据
+        
+        Raises:
+            BlockingIOError: blocking为False且其他线程或进程正在写入
         """
-        try:
-            if not os.path.exists(self.excel_path):
-                print(f"Excel文件不存在: {self.excel_path}")
-                return pd.DataFrame()
+        # 与写入和合并互斥，避免读到新的Excel文件和合并前的日志
+        with self._file_lock.shared(blocking=blocking):
+            df = self._read_sheet(table_name)
+            if self.journal is None:
+                return df
             
-            return pd.read_excel(self.excel_path, sheet_name=table_name, engine='openpyxl')
-        except Exception as e:
-            print(f"读取表 {table_name} 失败: {str(e)}")
-            # 返回空DataFrame
-            return pd.DataFrame()
+            for batch in self.journal.read_batches(after_seq=self._snapshot_journal_seq()):
+                ops = [op for op in batch['ops'] if op.get('table') == table_name]
+                if ops:
+                    df = apply_table_ops(df, ops)
+            return df
     
-    def write_table(self, table_name, df):
+    def _read_sheet(self, table_name):
         """
-        写入数据到指定表
+        读取Excel中的一个sheet，有与当前文件一致的二进制快照时直接加载快照
+        
+        需要在持有共享锁或排他锁时调用
+        
+        Args:
+            table_name: 表名(sheet名)
+        
+        Returns:
+            DataFrame: 表数据
+        """
+        if self.snapshots is None:
+            return next(_iter_sheet_frames(_open_workbook(self.excel_path), table_name))
+        
+        stamp = self._workbook_stamp()
+        df = self.snapshots.load(table_name, stamp)
+        if df is None:
+            df = next(_iter_sheet_frames(_open_workbook(self.excel_path), table_name))
+            # 保存快照，其他worker和下次启动时不再需要解析xlsx
+            self.snapshots.save(table_name, stamp, df)
+            if table_name in self.snapshots.shared_tables:
+                # 改为映射刚发布的快照，与其他worker共享同一份数据
+                mapped = self.snapshots.load(table_name, stamp)
+                if mapped is not None:
+                    df = mapped
+        return df
+    
+    def publish_shared_tables(self):
+        """
+        为共享表生成Arrow格式的快照
+        
+        在gunicorn master进程fork worker之前调用(见gunicorn.conf.py)，worker加载这些表时
+        直接映射已发布的快照。快照不放入本进程的表缓存。
+        
+        Returns:
+            list: 已发布快照的表名
+        """
+        if self.snapshots is None or not os.path.exists(self.excel_path):
+            return []
+        
+        published = []
+        with self._file_lock.shared():
+            for table_name in sorted(self.snapshots.shared_tables):
+                try:
+                    self._read_sheet(table_name)
+                    published.append(table_name)
+                except ValueError:
+                    # 工作簿中没有该sheet
+                    continue
+        return published
+    
+    def _snapshot_journal_seq(self):
+        """
+        获取Excel文件中已合并的日志序号
+        
+        Returns:
+            int: 已合并的最大日志序号，没有记录时返回0
+        """
+        stamp = self._workbook_stamp()
+        if stamp is None:
+            return 0
+        if self._meta_cache is not None and self._meta_cache[0] == stamp:
+            return self._meta_cache[1]
+        
+        meta = self.snapshots.load_meta(stamp) if self.snapshots is not None else None
+        if meta is not None:
+            seq = int(meta.get('journal_seq', 0))
+        else:
+            seq = 0
+            wb = _open_workbook(self.excel_path)
+            try:
+                if META_SHEET in wb.sheetnames:
+                    for row in wb[META_SHEET].iter_rows(min_row=2, values_only=True):
+                        if row and row[0] == 'journal_seq' and row[1] is not None:
+                            seq = int(row[1])
+            finally:
+                wb.close()
+            if self.snapshots is not None:
+                self.snapshots.save_meta(stamp, {'journal_seq': seq})
+        self._meta_cache = (stamp, seq)
+        return seq
+    
+    def _save_table(self, table_name, df):
+        """
+        把DataFrame保存到存储中的一张表，不处理缓存
         
         Args:
             table_name: 表名(sheet名)
             df: 要写入的DataFrame
-            
+        
+        Returns:
+            bool: 其他表是否原样保留
+        """
+        return self._save_tables({table_name: df})
+    
+    def _save_tables(self, frames, journal_seq=None):
+        """
+        把多张表一次性保存到Excel文件，不处理缓存
+        
+        只替换目标sheet(保持其在工作簿中的位置)，其他sheet不经过
+        DataFrame的解析和序列化
+        
+        Args:
+            frames: {表名: DataFrame}
+            journal_seq: 已合并的日志序号，提供时写入隐藏的元数据sheet
+        
+        Returns:
+            bool: 其他表是否原样保留
+        """
+        stamp_before = self._workbook_stamp()
+        wb = None
+        if stamp_before is not None:
+            try:
+                wb = load_workbook(self.excel_path)
+            except Exception as e:
+                # 如果读取现有文件失败，尝试创建新文件
+                print(f"读取现有Excel文件失败，创建新文件: {str(e)}")
+        
+        if wb is None:
+            # 文件不存在或无法读取，直接创建新文件
+            wb = Workbook()
+            wb.remove(wb.active)
+            for table_name, df in frames.items():
+                _fill_sheet(wb.create_sheet(table_name), df)
+            self._save_workbook(wb)
+            if self.snapshots is not None:
+                self.snapshots.commit(None, None, ())
+            return False
+        
+        # 原地替换目标sheet
+        for table_name, df in frames.items():
+            if table_name in wb.sheetnames:
+                index = wb.sheetnames.index(table_name)
+                wb.remove(wb[table_name])
+                ws = wb.create_sheet(table_name, index)
+            else:
+                ws = wb.create_sheet(table_name)
+            _fill_sheet(ws, df)
+        
+        if journal_seq is not None:
+            if META_SHEET in wb.sheetnames:
+                wb.remove(wb[META_SHEET])
+            ws = wb.create_sheet(META_SHEET)
+            ws.sheet_state = 'hidden'
+            ws.append(['key', 'value'])
+            ws.append(['journal_seq', journal_seq])
+        
+        self._save_workbook(wb)
+        
+        if self.snapshots is not None:
+            # 未修改的表沿用原有快照，被修改的表在下次读取时重新生成
+            stamp_after = self._workbook_stamp()
+            changed = set(frames)
+            if journal_seq is not None:
+                changed.add('_meta')
+            self.snapshots.commit(stamp_before, stamp_after, changed)
+            if journal_seq is not None:
+                self.snapshots.save_meta(stamp_after, {'journal_seq': journal_seq})
+        return True
+    
+    def compact_journal(self):
+        """
+        把操作日志合并到Excel文件，并删除已合并的日志
+        
+        所有涉及的表在一次工作簿保存中写入，合并的日志序号记录在同一个文件中，
+        因此合并中途失败时重新加载仍能得到正确的数据
+        
         Returns:
             bool: 是否成功
         """
-        try:
-            # 检查文件是否存在
-            if not os.path.exists(self.excel_path):
-                # 如果文件不存在，直接创建新文件
-                with pd.ExcelWriter(self.excel_path, engine='openpyxl') as writer:
-                    df.to_excel(writer, sheet_name=table_name, index=False)
-                return True
-            
-            # 读取所有sheet
+        if self.journal is None:
+            return True
+        
+        with self.locked():
             try:
-                # 读取所有现有的sheet
-                xls = pd.ExcelFile(self.excel_path, engine='openpyxl')
-                sheet_names = xls.sheet_names
+                batches = self.journal.read_batches(after_seq=self._snapshot_journal_seq())
+                if not batches:
+                    return True
+                
+                table_names = []
+                for batch in batches:
+                    for op in batch['ops']:
+                        if op['table'] not in table_names:
+                            table_names.append(op['table'])
+                frames = {table_name: self._get_table(table_name) for table_name in table_names}
+                upto_seq = batches[-1]['seq']
                 
-                # 读取所有sheet的数据
-                all_dfs = {}
-                for sheet in sheet_names:
-                    if sheet != table_name:  # 不读取要更新的表
-                        all_dfs[sheet] = pd.read_excel(self.excel_path, sheet_name=sheet, engine='openpyxl')
+                stamp_before = self._file_stamp()
+                self._save_tables(frames, journal_seq=upto_seq)
+                self.journal.truncate(upto_seq)
                 
-                # 添加或更新当前表
-                all_dfs[table_name] = df
+                # 合并不改变表的内容，缓存沿用并更新为新的文件戳
+                stamp_after = self._file_stamp()
+                with self._cache_lock:
+                    self._restamp_cache(stamp_before, stamp_after)
                 
-                # 写回所有表
-                with pd.ExcelWriter(self.excel_path, engine='openpyxl') as writer:
-                    for sheet, sheet_df in all_dfs.items():
-                        sheet_df.to_excel(writer, sheet_name=sheet, index=False)
-                    
+                print(f"已合并 {len(batches)} 条日志到 {self.excel_path}")
+                return True
             except Exception as e:
-                # 如果读取现有文件失败，尝试创建新文件
-                print(f"读取现有Excel文件失败，创建新文件: {str(e)}")
-                with pd.ExcelWriter(self.excel_path, engine='openpyxl') as writer:
-                    df.to_excel(writer, sheet_name=table_name, index=False)
-            
-            return True
-        except Exception as e:
-            print(f"写入表 {table_name} 失败: {str(e)}")
-            return False
+                print(f"合并日志失败: {str(e)}")
+                return False
+    
+    def _compact_loop(self):
+        """后台合并线程: 定期或日志过大时合并日志"""
+        while not self._closed:
+            self._compact_event.wait(self.compact_interval)
+            self._compact_event.clear()
+            if not self._closed:
+                self.compact_journal()
+    
+    def close(self):
+        """提交排队的写入，停止后台合并线程并合并剩余的日志"""
+        if self._writer is not None:
+            self._writer.close()
+        self._closed = True
+        self._compact_event.set()
+        self.compact_journal()
     
     def find_user_by_openid(self, openid):
         """
@@ -141,18 +1685,14 @@ class ExcelDatabase:
         
         Args:
             openid: 微信openid
-            
+        
         Returns:
             dict: 用户信息，未找到返回None
         """
-        users_df = self.read_table('users')
-        if users_df.empty:
-            return None
-            
-        user = users_df[users_df['openid'] == openid]
+        user = self.get_by('users', 'openid', openid)
         if user.empty:
             return None
-            
+        
         return user.iloc[0].to_dict()
     
     def create_user(self, user_data):
@@ -161,20 +1701,12 @@ class ExcelDatabase:
         
         Args:
             user_data: 用户数据字典
-            
+        
         Returns:
             dict: 创建的用户信息
         """
-        users_df = self.read_table('users')
-        
-        # 生成ID
-        if users_df.empty:
-            new_id = 1
-        else:
-            new_id = users_df['id'].max() + 1
-        
         # 准备用户数据
-        user_data['id'] = new_id
+        user_data['id'] = self.next_id('users')
         if 'user_id' not in user_data:
             user_data['user_id'] = f"u_{uuid.uuid4().hex[:8]}"
         
@@ -185,12 +1717,8 @@ class ExcelDatabase:
         if 'updated_at' not in user_data:
             user_data['updated_at'] = now
         
-        # 添加到DataFrame - 使用concat替代append
-        new_row = pd.DataFrame([user_data])
-        users_df = pd.concat([users_df, new_row], ignore_index=True)
-        
-        # 保存到Excel
-        self.write_table('users', users_df)
+        # 只追加新行
+        self.add_row('users', user_data)
         
         return user_data
     
@@ -201,31 +1729,20 @@ class ExcelDatabase:
         Args:
             openid: 微信openid
             update_data: 要更新的数据字典
-            
+        
         Returns:
             dict: 更新后的用户信息，未找到返回None
         """
-        users_df = self.read_table('users')
-        if users_df.empty:
-            return None
-        
-        # 查找用户
-        user_idx = users_df[users_df['openid'] == openid].index
-        if len(user_idx) == 0:
-            return None
-        
         # 更新时间戳
         update_data['updated_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         
-        # 更新用户数据
-        for key, value in update_data.items():
-            users_df.loc[user_idx[0], key] = value
-        
-        # 保存到Excel
-        self.write_table('users', users_df)
+        # 只更新该用户所在的行
+        updated = self.update_rows('users', {'openid': openid}, update_data, limit=1)
+        if updated is None or updated.empty:
+            return None
         
         # 返回更新后的用户信息
-        return users_df.loc[user_idx[0]].to_dict()
+        return updated.iloc[0].to_dict()
     
     def create_recipe(self, recipe_data):
         """
@@ -233,20 +1750,12 @@ class ExcelDatabase:
         
         Args:
             recipe_data: 菜谱数据字典
-            
+        
         Returns:
             dict: 创建的菜谱信息
         """
-        recipes_df = self.read_table('recipes')
-        
-        # 生成ID
-        if recipes_df.empty:
-            new_id = 1
-        else:
-            new_id = recipes_df['id'].max() + 1
-        
         # 准备菜谱数据
-        recipe_data['id'] = new_id
+        recipe_data['id'] = self.next_id('recipes')
         
         # 添加时间戳
         now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
@@ -255,12 +1764,8 @@ class ExcelDatabase:
         if 'updated_at' not in recipe_data:
             recipe_data['updated_at'] = now
         
-        # 添加到DataFrame
-        new_row = pd.DataFrame([recipe_data])
-        recipes_df = pd.concat([recipes_df, new_row], ignore_index=True)
-        
-        # 保存到Excel
-        self.write_table('recipes', recipes_df)
+        # 只追加新行
+        self.add_row('recipes', recipe_data)
         
         return recipe_data
     
@@ -283,15 +1788,11 @@ class ExcelDatabase:
         
         Args:
             recipe_id: 菜谱ID
-            
+        
         Returns:
             dict: 菜谱信息，未找到返回None
         """
-        recipes_df = self.read_table('recipes')
-        if recipes_df.empty:
-            return None
-        
-        recipe = recipes_df[recipes_df['id'] == recipe_id]
+        recipe = self.get_by('recipes', 'id', recipe_id)
         if recipe.empty:
             return None
         
@@ -304,31 +1805,20 @@ class ExcelDatabase:
         Args:
             recipe_id: 菜谱ID
             update_data: 要更新的数据字典
-            
+        
         Returns:
             dict: 更新后的菜谱信息，未找到返回None
         """
-        recipes_df = self.read_table('recipes')
-        if recipes_df.empty:
-            return None
-        
-        # 查找菜谱
-        recipe_idx = recipes_df[recipes_df['id'] == recipe_id].index
-        if len(recipe_idx) == 0:
-            return None
-        
         # 更新时间戳
         update_data['updated_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         
-        # 更新菜谱数据
-        for key, value in update_data.items():
-            recipes_df.loc[recipe_idx[0], key] = value
-        
-        # 保存到Excel
-        self.write_table('recipes', recipes_df)
+        # 只更新该菜谱所在的行
+        updated = self.update_rows('recipes', {'id': recipe_id}, update_data, limit=1)
+        if updated is None or updated.empty:
+            return None
         
         # 返回更新后的菜谱信息
-        return recipes_df.loc[recipe_idx[0]].to_dict()
+        return updated.iloc[0].to_dict()
     
     def delete_recipe(self, recipe_id):
         """
@@ -336,32 +1826,17 @@ class ExcelDatabase:
         
         Args:
             recipe_id: 菜谱ID
-            
+        
         Returns:
             bool: 是否成功
         """
-        recipes_df = self.read_table('recipes')
-        if recipes_df.empty:
-            return False
-        
-        # 查找菜谱
-        recipe_idx = recipes_df[recipes_df['id'] == recipe_id].index
-        if len(recipe_idx) == 0:
-            return False
-        
-        # 删除菜谱
-        recipes_df = recipes_df.drop(recipe_idx)
-        
-        # 保存到Excel
-        self.write_table('recipes', recipes_df)
-        
-        return True
+        # 删除菜谱，没有找到时返回False
+        return bool(self.delete_rows('recipes', {'id': recipe_id}))
     
     def init_sample_recipes(self):
         """初始化示例菜谱数据"""
-        # 检查是否已有菜谱数据
-        recipes_df = self.read_table('recipes')
-        if not recipes_df.empty:
+        # 检查是否已有菜谱数据，只取一行
+        if not self.select('recipes', columns=['id'], limit=1).empty:
             return  # 已有数据，不再初始化
         
         # 准备示例菜谱数据
@@ -390,12 +1865,11 @@ class ExcelDatabase:
             }
         ]
         
-        # 添加示例菜谱
-        for recipe in sample_recipes:
-            self.create_recipe(recipe)
+        # 一次写入所有示例菜谱
+        self.bulk_create_recipes(sample_recipes)
         
         print("示例菜谱数据初始化完成")
-
+    
     def ensure_table_exists(self, table_name, columns):
         """
         确保指定的表存在
@@ -403,46 +1877,17 @@ class ExcelDatabase:
         Args:
             table_name: 表名
             columns: 列名列表
-            
+        
         Returns:
             bool: 是否成功
         """
         try:
-            # 检查表是否存在
-            if not os.path.exists(self.excel_path):
-                # 如果文件不存在，创建文件和表
-                df = pd.DataFrame(columns=columns)
-                with pd.ExcelWriter(self.excel_path, engine='openpyxl') as writer:
-                    df.to_excel(writer, sheet_name=table_name, index=False)
-                return True
-            
-            # 读取所有sheet
-            try:
-                xls = pd.ExcelFile(self.excel_path, engine='openpyxl')
-                sheet_names = xls.sheet_names
-                
-                if table_name not in sheet_names:
-                    # 表不存在，创建新表
-                    df = pd.DataFrame(columns=columns)
-                    
-                    # 读取所有现有表
-                    all_dfs = {}
-                    for sheet in sheet_names:
-                        all_dfs[sheet] = pd.read_excel(self.excel_path, sheet_name=sheet, engine='openpyxl')
-                    
-                    # 添加新表
-                    all_dfs[table_name] = df
-                    
-                    # 写回所有表
-                    with pd.ExcelWriter(self.excel_path, engine='openpyxl') as writer:
-                        for sheet, sheet_df in all_dfs.items():
-                            sheet_df.to_excel(writer, sheet_name=sheet, index=False)
-                            
+            # 表已存在则无需写入
+            if self._has_table(table_name):
                 return True
-            except Exception as e:
-                print(f"检查表 {table_name} 是否存在失败: {str(e)}")
-                return False
             
+            # 表不存在，只追加新的空sheet(文件不存在时会一并创建)
+            return self.write_table(table_name, pd.DataFrame(columns=columns))
         except Exception as e:
             print(f"确保表 {table_name} 存在失败: {str(e)}")
             return False
@@ -454,22 +1899,109 @@ class ExcelDatabase:
         Args:
             table_name: 表名
             row_data: 行数据（字典）
-            
+        
         Returns:
             bool: 是否成功
         """
         try:
-            # 读取表数据
-            df = self.read_table(table_name)
+            if not self._has_table(table_name):
+                # 表不存在，以该行创建新表
+                return self.write_table(table_name, pd.DataFrame([row_data]))
             
-            # 添加新行
-            new_row = pd.DataFrame([row_data])
-            df = pd.concat([df, new_row], ignore_index=True)
+            # 只提交一条插入操作，不需要调用方读取和写回整张表
+            row = {str(key): to_storage_value(value) for key, value in row_data.items()}
+            self._commit_ops(table_name, lambda old_df: [{'op': 'insert', 'row': row}], where=False)
+            return True
+        except Exception as e:
+            print(f"向表 {table_name} 添加行失败: {str(e)}")
+            return False 
+    
+    def add_rows(self, table_name, rows):
+        """
+        向表中批量添加多行数据，所有行在一次提交中写入
+        
+        Args:
+            table_name: 表名
+            rows: 行数据（字典）列表
+        
+        Returns:
+            bool: 是否成功，任一行无效时不写入任何数据
+        """
+        try:
+            rows = list(rows)
+            for row_data in rows:
+                if not isinstance(row_data, dict):
+                    raise TypeError(f"行数据必须是字典: {row_data!r}")
+            if not rows:
+                return True
             
-            # 写回表
-            self.write_table(table_name, df)
+            if not self._has_table(table_name):
+                # 表不存在，以这些行创建新表
+                return self.write_table(table_name, pd.DataFrame(rows))
             
+            ops = [{
+                'op': 'insert',
+                'row': {str(key): to_storage_value(value) for key, value in row_data.items()}
+            } for row_data in rows]
+            self._commit_ops(table_name, lambda old_df: ops, where=False)
             return True
         except Exception as e:
-            print(f"向表 {table_name} 添加行失败: {str(e)}")
-            return False 
\ No newline at end of file
+            print(f"向表 {table_name} 批量添加行失败: {str(e)}")
+            return False
+    
+    def add_rows_stream(self, table_name, rows, chunk_size=1000):
+        """
+        从迭代器中流式读取行并分批写入，适合导入大量数据
+        
+        每chunk_size行提交一次，不需要把所有行同时放在内存中
+        
+        Args:
+            table_name: 表名
+            rows: 产生行数据（字典）的可迭代对象
+            chunk_size: 每次提交的行数
+        
+        Returns:
+            int: 写入的行数，失败时返回None(之前已提交的批次不会回滚)
+        """
+        written = 0
+        chunk = []
+        for row_data in rows:
+            chunk.append(row_data)
+            if len(chunk) >= chunk_size:
+                if not self.add_rows(table_name, chunk):
+                    print(f"表 {table_name} 流式写入中断，已写入 {written} 行")
+                    return None
+                written += len(chunk)
+                chunk = []
+        if chunk:
+            if not self.add_rows(table_name, chunk):
+                print(f"表 {table_name} 流式写入中断，已写入 {written} 行")
+                return None
+            written += len(chunk)
+        return written
+    
+    def bulk_create_recipes(self, recipes_data):
+        """
+        批量创建菜谱，一次分配所有ID并在一次提交中写入
+        
+        Args:
+            recipes_data: 菜谱数据字典列表
+        
+        Returns:
+            list: 创建的菜谱信息列表，失败时返回None
+        """
+        recipes_data = list(recipes_data)
+        if not recipes_data:
+            return []
+        
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        for recipe_id, recipe_data in zip(self.allocate_ids('recipes', len(recipes_data)), recipes_data):
+            recipe_data['id'] = recipe_id
+            if 'created_at' not in recipe_data:
+                recipe_data['created_at'] = now
+            if 'updated_at' not in recipe_data:
+                recipe_data['updated_at'] = now
+        
+        if not self.add_rows('recipes', recipes_data):
+            return None
+        return recipes_data
@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+from datetime import datetime
+
+
+# 食材保质期状态，classify_expiry返回的状态码
+FRESH = 0
+EXPIRING = 1
+EXPIRED = 2
+
+# 距过期不超过该天数(且未过期)的食材视为临期
+DEFAULT_EXPIRING_DAYS = 3
+
+
+def days_until_expiry(expiry_dates, today=None):
+    """
+    一次计算一列过期日期距今天的天数
+    
+    Args:
+        expiry_dates: 过期日期列(Series或数组)，加载表时已转换为datetime64，空值为NaT
+        today: 今天的日期，为None时使用当前日期
+    
+    Returns:
+        tuple: (天数数组(int64，已过期为负数，没有过期日期的位置为0), 是否有过期日期的布尔数组)
+    """
+    dates = pd.to_datetime(pd.Series(expiry_dates), errors='coerce').to_numpy(dtype='datetime64[ns]')
+    has_date = ~np.isnat(dates)
+    today = np.datetime64(today or datetime.now().date(), 'D')
+    days = np.zeros(len(dates), dtype=np.int64)
+    days[has_date] = (dates[has_date].astype('datetime64[D]') - today).astype(np.int64)
+    return days, has_date
+
+
+def classify_expiry(expiry_dates, expiring_days=DEFAULT_EXPIRING_DAYS, today=None):
+    """
+    一次划分一列过期日期的保质期状态
+    
+    当天或之前过期的为EXPIRED，之后expiring_days天内过期的为EXPIRING，
+    其余和没有过期日期的为FRESH
+    
+    Args:
+        expiry_dates: 过期日期列，见days_until_expiry
+        expiring_days: 临期天数
+        today: 今天的日期，为None时使用当前日期
+    
+    Returns:
+        numpy.ndarray: 状态码数组(FRESH/EXPIRING/EXPIRED)
+    """
+    days, has_date = days_until_expiry(expiry_dates, today)
+    status = np.full(len(days), FRESH, dtype=np.int8)
+    status[has_date & (days <= expiring_days)] = EXPIRING
+    status[has_date & (days <= 0)] = EXPIRED
+    return status
@@ -0,0 +1,79 @@
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # Windows没有fcntl
+    fcntl = None
+
+
+class FileLock:
+    """
+    基于fcntl.flock的跨进程读写锁
+    
+    共享锁之间互不阻塞，排他锁与其他所有锁互斥。同一线程内可以嵌套获取:
+    持有排他锁时再获取共享锁或排他锁直接通过，持有共享锁时不能再获取排他锁。
+    不支持fcntl的平台上退化为进程内的锁，只保证同一进程内的线程安全。
+    """
+    
+    def __init__(self, lock_path):
+        """
+        初始化文件锁
+        
+        Args:
+            lock_path: 锁文件路径，不存在时自动创建
+        """
+        self.lock_path = lock_path
+        self._local = threading.local()
+        self._fallback = threading.RLock()
+    
+    def shared(self, blocking=True):
+        """
+        获取共享锁(读锁)的上下文管理器
+        
+        Args:
+            blocking: 为False时不等待，锁被其他线程或进程以排他方式持有时抛出BlockingIOError
+        """
+        return self._hold(exclusive=False, blocking=blocking)
+    
+    def exclusive(self):
+        """获取排他锁(写锁)的上下文管理器"""
+        return self._hold(exclusive=True)
+    
+    @contextmanager
+    def _hold(self, exclusive, blocking=True):
+        held = getattr(self._local, 'exclusive', None)
+        if held is not None:
+            # 当前线程已持有锁
+            if exclusive and not held:
+                raise RuntimeError(f"持有共享锁时不能获取排他锁: {self.lock_path}")
+            yield
+            return
+        
+        if fcntl is None:
+            if not self._fallback.acquire(blocking=blocking):
+                raise BlockingIOError(f"锁已被占用: {self.lock_path}")
+            try:
+                self._local.exclusive = exclusive
+                try:
+                    yield
+                finally:
+                    self._local.exclusive = None
+            finally:
+                self._fallback.release()
+            return
+        
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            # 锁被占用且不等待时flock抛出BlockingIOError
+            fcntl.flock(fd, (fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH) | (0 if blocking else fcntl.LOCK_NB))
+            self._local.exclusive = exclusive
+            try:
+                yield
+            finally:
+                self._local.exclusive = None
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
@@ -0,0 +1,101 @@
+import os
+import json
+import threading
+
+
+class IdAllocator:
+    """
+    按表分配自增ID
+    
+    每张表的下一个可用ID持久化在JSON文件中({表名: 下一个ID})。每个进程一次从文件中
+    预留block_size个ID，用完后再预留下一批，因此多个worker分配的ID不会重复，
+    但block_size大于1时不同worker之间的ID不保证按创建时间递增。
+    """
+    
+    def __init__(self, seq_path, locked, block_size=1):
+        """
+        初始化ID分配器
+        
+        Args:
+            seq_path: 序列文件路径
+            locked: 返回跨进程排他锁上下文管理器的函数(ExcelDatabase.locked)
+            block_size: 每次从序列文件预留的ID数量
+        """
+        self.seq_path = seq_path
+        self._locked = locked
+        self.block_size = max(1, int(block_size))
+        self._lock = threading.Lock()
+        # 本进程已预留、尚未分配的ID: {表名: [下一个ID, 结束ID)}
+        self._blocks = {}
+        # 本进程已用现有数据校正过序列的表
+        self._seeded = set()
+    
+    def allocate(self, table_name, count=1, seed=None):
+        """
+        为表分配一批ID
+        
+        Args:
+            table_name: 表名
+            count: 需要的ID数量
+            seed: 返回表中现有最大ID加1的函数，本进程第一次为该表预留时用于校正序列，
+                避免与绕过分配器写入的数据冲突
+        
+        Returns:
+            list: 分配的ID列表
+        """
+        with self._lock:
+            ids = self._take(table_name, count)
+            if ids is not None:
+                return ids
+        
+        # 预留的ID不够，在跨进程锁内从序列文件预留新的一批(先获取跨进程锁，避免死锁)
+        with self._locked():
+            with self._lock:
+                ids = self._take(table_name, count)
+                if ids is not None:
+                    return ids
+                
+                # 先用完本进程剩余的ID，再预留新的一批
+                block = self._blocks.get(table_name, [0, 0])
+                ids = list(range(block[0], block[1]))
+                size = max(self.block_size, count - len(ids))
+                start = self._reserve(table_name, size, seed)
+                self._blocks[table_name] = [start, start + size]
+                return ids + self._take(table_name, count - len(ids))
+    
+    def _take(self, table_name, count):
+        """从本进程预留的ID中取出count个，不够时返回None"""
+        block = self._blocks.get(table_name)
+        if block is None or block[1] - block[0] < count:
+            return None
+        ids = list(range(block[0], block[0] + count))
+        block[0] += count
+        return ids
+    
+    def _reserve(self, table_name, size, seed):
+        """在序列文件中预留size个ID，返回第一个ID，需要在持有跨进程锁时调用"""
+        sequences = self._read()
+        start = int(sequences.get(table_name, 1))
+        if table_name not in self._seeded and seed is not None:
+            start = max(start, int(seed()))
+            self._seeded.add(table_name)
+        sequences[table_name] = start + size
+        self._write(sequences)
+        return start
+    
+    def _read(self):
+        """读取序列文件，不存在或损坏时返回空字典"""
+        try:
+            with open(self.seq_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+    
+    def _write(self, sequences):
+        """原子地写入序列文件"""
+        tmp_path = f'{self.seq_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(sequences, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.seq_path)
@@ -1,30 +1,60 @@
-from flask import current_app
-from flask_jwt_extended import decode_token
+from flask import g, current_app
+from flask_jwt_extended import get_jwt, get_jwt_identity
 
-def get_user_id_from_token(token):
+
+class RequestIdentity:
+    """
+    当前请求的用户身份
+    
+    每个请求只创建一次(见get_request_identity)，由控制器直接传给服务层
+    """
+    
+    def __init__(self, jwt_user_id, claims=None):
+        """
+        Args:
+            jwt_user_id: JWT中的用户标识(sub)，对应users表中的user_id列
+            claims: JWT中的全部声明
+        """
+        self.jwt_user_id = jwt_user_id
+        self.claims = claims or {}
+        # users表中的主键id，第一次解析后保存(见UserResolver.resolve)
+        self.db_user_id = None
+    
+    def __repr__(self):
+        return f"RequestIdentity({self.jwt_user_id!r})"
+
+
+def get_request_identity():
     """
-    从JWT令牌中提取用户ID
+    获取当前请求的用户身份
+    
+    需要在@jwt_required()之后调用：令牌已由flask_jwt_extended验证并解码，这里只读取
+    解码结果，不再重复验证签名。同一请求中多次调用返回同一个对象
+    
+    Returns:
+        RequestIdentity: 用户身份，请求中没有有效令牌时返回None
+    """
+    identity = g.get('identity')
+    if identity is None:
+        jwt_user_id = get_jwt_identity()
+        if not jwt_user_id:
+            return None
+        identity = RequestIdentity(jwt_user_id, get_jwt())
+        g.identity = identity
+        current_app.logger.debug(f"当前请求的用户ID: {jwt_user_id}")
+    return identity
+
+
+def get_jwt_user_id(identity):
+    """
+    获取用户身份中的JWT用户标识
     
     Args:
-        token: JWT令牌字符串，可能是带有Bearer前缀的形式
-        
+        identity: RequestIdentity，或直接传入的JWT用户标识(脚本等请求之外的调用)
+    
     Returns:
-        str: 用户ID或None（如果提取失败）
+        str: JWT用户标识
     """
-    try:
-        # 如果令牌有Bearer前缀，去掉前缀
-        if token.startswith('Bearer '):
-            token = token[7:]
-            
-        # 解码令牌
-        decoded_token = decode_token(token)
-        
-        # 从令牌中获取身份信息（用户ID）
-        user_id = decoded_token.get('sub')
-        
-        current_app.logger.debug(f"从令牌中提取的用户ID: {user_id}")
-        return user_id
-        
-    except Exception as e:
-        current_app.logger.error(f"从令牌中提取用户ID失败: {str(e)}")
-        return None 
\ No newline at end of file
+    if isinstance(identity, RequestIdentity):
+        return identity.jwt_user_id
+    return identity
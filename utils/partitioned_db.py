@@ -0,0 +1,525 @@
+import os
+import glob
+import shutil
+import zlib
+import threading
+import numpy as np
+import pandas as pd
+from contextlib import contextmanager, ExitStack
+from utils.excel_db import ExcelDatabase, ReadPin, _parse_order_by
+from utils.value_utils import to_storage_value
+
+
+def partition_of(value, partitions):
+    """
+    计算分区键值所在的分区号
+    
+    整数值的浮点数(如1.0)与整数按同一个值计算，不同进程和重启后结果一致
+    
+    Args:
+        value: 分区键的值
+        partitions: 分区数
+    
+    Returns:
+        int: 分区号(0..partitions-1)
+    """
+    value = to_storage_value(value)
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return zlib.crc32(str(value).encode('utf-8')) % partitions
+
+
+class PartitionedDatabase:
+    """
+    按用户分区存储的数据库
+    
+    PARTITIONED_TABLES中的表按分区键的哈希值分散保存在 <数据库文件>.partitions/ 下的
+    多个文件中，每个分区是一个独立的数据库(与主库相同的存储引擎，各自的锁、日志、
+    快照和缓存)。按分区键查询和修改时只读写该用户所在的分区，其他表和方法直接交给主库。
+    
+    不带分区键的查询和修改会依次访问所有分区。ID由主库的序列统一分配。
+    """
+    
+    # 分区存储的表: {表名: (分区键, 新建分区时的列)}
+    PARTITIONED_TABLES = {
+        'user_ingredients': ('user_id', [
+            'id', 'user_id', 'ingredient_id', 'quantity', 'expiry_date', 'created_at', 'updated_at'
+        ])
+    }
+    
+    def __init__(self, db, partitions, open_partition, extension):
+        """
+        初始化分区数据库，主库中尚未分区的数据和分区数变化前的分区会自动迁移
+        
+        Args:
+            db: 主库(ExcelDatabase或SQLiteDatabase)
+            partitions: 分区数
+            open_partition: 打开分区的函数，参数为(文件路径, {表名: 列})，返回与主库同类的数据库
+            extension: 分区文件的扩展名(如'.xlsx')
+        """
+        self.db = db
+        self.partitions = max(int(partitions), 1)
+        self.partition_dir = db.excel_path + '.partitions'
+        self._open_partition = open_partition
+        self._extension = extension
+        # 已打开的分区: {(表名, 分区号): 数据库}
+        self._opened = {}
+        self._open_lock = threading.Lock()
+        # 当前线程进行中的事务: 主库和已加入的分区事务
+        self._tx_local = threading.local()
+        # 当前线程固定的读取版本: 嵌套深度和已固定的分区 {数据库: ReadPin}
+        self._pin_local = threading.local()
+        
+        os.makedirs(self.partition_dir, exist_ok=True)
+        for table_name in self.PARTITIONED_TABLES:
+            self._migrate(table_name)
+    
+    def __getattr__(self, name):
+        # 未分区的表和其他方法直接使用主库
+        if name == 'db':
+            raise AttributeError(name)
+        return getattr(self.db, name)
+    
+    def _partition_path(self, table_name, partition):
+        """分区文件路径，文件名中包含分区数，分区数变化时旧文件会被迁移"""
+        return os.path.join(self.partition_dir, f'{table_name}-{partition:03d}-of-{self.partitions:03d}{self._extension}')
+    
+    def _partition(self, table_name, partition):
+        """
+        获取分区数据库，第一次使用时打开(分区文件不存在时创建)
+        
+        在事务中时，分区在第一次使用时加入当前事务；固定了读取版本时(见pin)，分区在
+        第一次使用时固定
+        
+        Args:
+            table_name: 表名
+            partition: 分区号
+        
+        Returns:
+            ExcelDatabase: 分区数据库
+        """
+        with self._open_lock:
+            db = self._opened.get((table_name, partition))
+            if db is None:
+                columns = self.PARTITIONED_TABLES[table_name][1]
+                db = self._open_partition(self._partition_path(table_name, partition), {table_name: columns})
+                self._opened[(table_name, partition)] = db
+        
+        tx = getattr(self._tx_local, 'tx', None)
+        if tx is not None and db not in tx['joined']:
+            tx['joined'].add(db)
+            tx['stack'].enter_context(db.transaction())
+        
+        pin_state = getattr(self._pin_local, 'state', None)
+        if pin_state is not None and db not in pin_state['pins']:
+            pin_state['pins'][db] = db.pin()
+        return db
+    
+    def _partitions_of(self, table_name):
+        """所有分区数据库，按分区号排列"""
+        return [self._partition(table_name, partition) for partition in range(self.partitions)]
+    
+    def _route(self, table_name, where):
+        """
+        根据查询条件确定涉及的分区
+        
+        Returns:
+            list: 分区号列表，条件中没有分区键时返回所有分区
+        """
+        column = self.PARTITIONED_TABLES[table_name][0]
+        if not isinstance(where, dict) or column not in where:
+            return list(range(self.partitions))
+        value = where[column]
+        if isinstance(value, (list, tuple, set, frozenset)):
+            return sorted({partition_of(item, self.partitions) for item in value})
+        return [partition_of(value, self.partitions)]
+    
+    def _row_partition(self, table_name, row):
+        """新行所在的分区号，缺少分区键时抛出ValueError"""
+        column = self.PARTITIONED_TABLES[table_name][0]
+        value = row.get(column)
+        if value is None or pd.isna(value):
+            raise ValueError(f"表 {table_name} 的新行缺少分区键 {column}")
+        return partition_of(value, self.partitions)
+    
+    def _stale_paths(self, table_name):
+        """分区数与当前配置不同的旧分区文件"""
+        current = f'-of-{self.partitions:03d}{self._extension}'
+        pattern = os.path.join(self.partition_dir, f'{table_name}-*-of-*{self._extension}')
+        return sorted(path for path in glob.glob(pattern) if not path.endswith(current))
+    
+    def _migrate(self, table_name):
+        """
+        把主库中的数据和分区数不同的旧分区迁移到当前分区
+        
+        在主库的排他锁中进行，多个worker同时启动时只有第一个执行迁移
+        """
+        if not self._stale_paths(table_name) and table_name not in self.db.list_tables():
+            return
+        
+        with self.db.locked():
+            main_df = self.db.read_table(table_name) if table_name in self.db.list_tables() else pd.DataFrame()
+            frames = [main_df] if not main_df.empty else []
+            stale_paths = self._stale_paths(table_name)
+            for path in stale_paths:
+                old = self._open_partition(path, {})
+                frames.append(old.read_table(table_name))
+                old.close()
+            
+            # 缺少分区键的旧数据也一并迁移，按空值计算分区
+            column = self.PARTITIONED_TABLES[table_name][0]
+            grouped = {}
+            for df in frames:
+                for row in df.to_dict('records'):
+                    grouped.setdefault(partition_of(row.get(column), self.partitions), []).append(row)
+            for partition, rows in sorted(grouped.items()):
+                if not self._partition(table_name, partition).add_rows(table_name, rows):
+                    raise RuntimeError(f"迁移表 {table_name} 到分区 {partition} 失败")
+            if grouped:
+                print(f"已把表 {table_name} 的 {sum(len(rows) for rows in grouped.values())} 行迁移到 {self.partitions} 个分区")
+            
+            # 主库中只保留表结构，旧分区删除
+            if not main_df.empty and not self.db.write_table(table_name, main_df.iloc[0:0]):
+                raise RuntimeError(f"清空主库中的表 {table_name} 失败")
+            for path in stale_paths:
+                _remove_database_files(path)
+    
+    def read_table(self, table_name):
+        """读取整张表，分区表依次读取所有分区"""
+        if table_name not in self.PARTITIONED_TABLES:
+            return self.db.read_table(table_name)
+        return _concat([db.read_table(table_name) for db in self._partitions_of(table_name)])
+    
+    def get_by(self, table_name, column, value):
+        """按列值查询，按分区键查询时只访问一个分区"""
+        if table_name not in self.PARTITIONED_TABLES:
+            return self.db.get_by(table_name, column, value)
+        if column == self.PARTITIONED_TABLES[table_name][0]:
+            return self._partition(table_name, partition_of(value, self.partitions)).get_by(table_name, column, value)
+        return _concat([db.get_by(table_name, column, value) for db in self._partitions_of(table_name)])
+    
+    def select(self, table_name, where=None, columns=None, order_by=None, limit=None):
+        """按条件查询，参数见ExcelDatabase.select；条件中有分区键时只访问对应的分区"""
+        if table_name not in self.PARTITIONED_TABLES:
+            return self.db.select(table_name, where, columns, order_by, limit)
+        
+        partitions = self._route(table_name, where)
+        if len(partitions) == 1:
+            return self._partition(table_name, partitions[0]).select(table_name, where, columns, order_by, limit)
+        
+        # 排序列可能不在返回的列中，先带上排序列，合并排序后再去掉
+        sort_columns = _parse_order_by(order_by)[0] if order_by else []
+        fetch_columns = None if columns is None else \
+            list(columns) + [column for column in sort_columns if column not in columns]
+        df = _concat([self._partition(table_name, partition).select(table_name, where, fetch_columns, order_by, limit)
+                      for partition in partitions])
+        if order_by and not df.empty:
+            sort_columns, ascending = _parse_order_by(order_by)
+            df = df.sort_values(sort_columns, ascending=ascending, kind='mergesort',
+                                na_position='last').reset_index(drop=True)
+        if limit is not None:
+            df = df.iloc[:max(int(limit), 0)]
+        if columns is not None and not df.empty:
+            df = df[list(columns)]
+        return df
+    
+    def iter_table(self, table_name, chunksize=1000):
+        """分块读取表，分区表依次读取各分区，行索引连续编号"""
+        if table_name not in self.PARTITIONED_TABLES:
+            yield from self.db.iter_table(table_name, chunksize)
+            return
+        offset = 0
+        for db in self._partitions_of(table_name):
+            for chunk in db.iter_table(table_name, chunksize):
+                chunk.index = pd.RangeIndex(offset, offset + len(chunk))
+                offset += len(chunk)
+                yield chunk
+    
+    def write_table(self, table_name, df):
+        """写入整张表，分区表按分区键拆分后写入各分区"""
+        if table_name not in self.PARTITIONED_TABLES:
+            return self.db.write_table(table_name, df)
+        
+        column = self.PARTITIONED_TABLES[table_name][0]
+        if len(df) and column not in df.columns:
+            print(f"写入表 {table_name} 失败: 缺少分区键 {column}")
+            return False
+        partitions = np.array([partition_of(value, self.partitions) for value in df[column]] if len(df) else [],
+                              dtype=int)
+        success = True
+        for partition, db in enumerate(self._partitions_of(table_name)):
+            success = db.write_table(table_name, df[partitions == partition]) and success
+        return success
+    
+    def update_rows(self, table_name, key, values, limit=None):
+        """更新满足条件的行，参数见ExcelDatabase.update_rows"""
+        if table_name not in self.PARTITIONED_TABLES:
+            return self.db.update_rows(table_name, key, values, limit)
+        
+        results = []
+        for partition in self._route(table_name, key):
+            if limit is not None and limit <= 0:
+                break
+            updated = self._partition(table_name, partition).update_rows(table_name, key, values, limit)
+            if updated is None:
+                return None
+            results.append(updated)
+            if limit is not None:
+                limit -= len(updated)
+        return _concat(results)
+    
+    def delete_rows(self, table_name, predicate, limit=None):
+        """删除满足条件的行，参数见ExcelDatabase.delete_rows"""
+        if table_name not in self.PARTITIONED_TABLES:
+            return self.db.delete_rows(table_name, predicate, limit)
+        
+        deleted = 0
+        for partition in self._route(table_name, predicate):
+            if limit is not None and deleted >= limit:
+                break
+            count = self._partition(table_name, partition).delete_rows(
+                table_name, predicate, None if limit is None else limit - deleted)
+            if count is None:
+                return None
+            deleted += count
+        return deleted
+    
+    def upsert(self, table_name, key, row):
+        """满足条件的行存在时更新，否则插入新行，分区表的key或row中需要包含分区键"""
+        if table_name not in self.PARTITIONED_TABLES:
+            return self.db.upsert(table_name, key, row)
+        try:
+            partition = self._row_partition(table_name, {**key, **row})
+        except ValueError as e:
+            print(f"更新或插入表 {table_name} 失败: {str(e)}")
+            return None
+        return self._partition(table_name, partition).upsert(table_name, key, row)
+    
+    def add_row(self, table_name, row_data):
+        """添加一行，分区表的行中需要包含分区键"""
+        if table_name not in self.PARTITIONED_TABLES:
+            return self.db.add_row(table_name, row_data)
+        try:
+            partition = self._row_partition(table_name, row_data)
+        except ValueError as e:
+            print(f"向表 {table_name} 添加行失败: {str(e)}")
+            return False
+        return self._partition(table_name, partition).add_row(table_name, row_data)
+    
+    def add_rows(self, table_name, rows):
+        """批量添加多行，分区表按分区分组后写入，每个分区一次提交"""
+        if table_name not in self.PARTITIONED_TABLES:
+            return self.db.add_rows(table_name, rows)
+        
+        grouped = {}
+        try:
+            for row_data in rows:
+                if not isinstance(row_data, dict):
+                    raise TypeError(f"行数据必须是字典: {row_data!r}")
+                grouped.setdefault(self._row_partition(table_name, row_data), []).append(row_data)
+        except (TypeError, ValueError) as e:
+            print(f"向表 {table_name} 批量添加行失败: {str(e)}")
+            return False
+        
+        success = True
+        for partition, partition_rows in sorted(grouped.items()):
+            success = self._partition(table_name, partition).add_rows(table_name, partition_rows) and success
+        return success
+    
+    def add_rows_stream(self, table_name, rows, chunk_size=1000):
+        """流式分批写入，参数见ExcelDatabase.add_rows_stream"""
+        return ExcelDatabase.add_rows_stream(self, table_name, rows, chunk_size)
+    
+    def next_id(self, table_name):
+        """分配一个新ID，分区表的ID由主库的序列统一分配"""
+        return self.allocate_ids(table_name, 1)[0]
+    
+    def allocate_ids(self, table_name, count):
+        """分配一批新ID，分区表的ID由主库的序列统一分配"""
+        if table_name not in self.PARTITIONED_TABLES:
+            return self.db.allocate_ids(table_name, count)
+        return self.db.id_allocator.allocate(table_name, count, seed=lambda: self._seed_id(table_name))
+    
+    def _seed_id(self, table_name):
+        """所有分区中现有最大ID加1"""
+        return max(db._seed_id(table_name) for db in self._partitions_of(table_name))
+    
+    def declare_index(self, table_name, column, unique=False):
+        """声明二级索引，分区表在每个分区上声明(唯一索引只在分区内检查)"""
+        if table_name not in self.PARTITIONED_TABLES:
+            return self.db.declare_index(table_name, column, unique)
+        for db in self._partitions_of(table_name):
+            db.declare_index(table_name, column, unique)
+    
+    def invalidate_cache(self, table_name=None):
+        """使表缓存失效"""
+        if table_name is None or table_name not in self.PARTITIONED_TABLES:
+            self.db.invalidate_cache(table_name)
+        for (partitioned_table, _), db in list(self._opened.items()):
+            if table_name is None or table_name == partitioned_table:
+                db.invalidate_cache(table_name)
+    
+    def subscribe(self, callback, tables=None):
+        """订阅表修改事件，分区表的事件来自各分区(version为分区内的版本号)"""
+        unsubscribes = [self.db.subscribe(callback, tables)]
+        for table_name in self.PARTITIONED_TABLES:
+            if tables is None or table_name in ([tables] if isinstance(tables, str) else tables):
+                unsubscribes.extend(db.subscribe(callback, table_name) for db in self._partitions_of(table_name))
+        
+        def unsubscribe():
+            for unsubscribe_one in unsubscribes:
+                unsubscribe_one()
+        
+        return unsubscribe
+    
+    def list_tables(self):
+        """获取所有表名，包括分区表"""
+        tables = self.db.list_tables()
+        return tables + [table_name for table_name in self.PARTITIONED_TABLES if table_name not in tables]
+    
+    def ensure_table_exists(self, table_name, columns):
+        """确保表存在，分区表在打开分区时创建"""
+        if table_name not in self.PARTITIONED_TABLES:
+            return self.db.ensure_table_exists(table_name, columns)
+        return True
+    
+    def pin(self):
+        """
+        固定当前线程读取的表版本，参数和行为见ExcelDatabase.pin
+        
+        主库立即固定，分区在请求第一次读写它时才固定，按用户的请求只固定所在的分区；
+        分区表的各分区之间不保证来自同一时刻
+        """
+        state = getattr(self._pin_local, 'state', None)
+        if state is None:
+            state = {'depth': 0, 'pins': {self.db: self.db.pin()}}
+            self._pin_local.state = state
+        state['depth'] += 1
+        return ReadPin(self._release_pin)
+    
+    def _release_pin(self):
+        state = self._pin_local.state
+        state['depth'] -= 1
+        if not state['depth']:
+            self._pin_local.state = None
+            for pin in state['pins'].values():
+                pin.close()
+    
+    @contextmanager
+    def unpinned(self):
+        """
+        在with块中忽略主库和各分区中当前线程固定的版本，见ExcelDatabase.unpinned
+        
+        with块中第一次使用的分区不会被固定
+        """
+        state = getattr(self._pin_local, 'state', None)
+        self._pin_local.state = None
+        try:
+            with ExitStack() as stack:
+                stack.enter_context(self.db.unpinned())
+                for db in (state['pins'] if state is not None else ()):
+                    if db is not self.db:
+                        stack.enter_context(db.unpinned())
+                yield
+        finally:
+            self._pin_local.state = state
+    
+    def refresh(self, table_name):
+        """确保表的缓存是最新的，分区表检查所有分区，见ExcelDatabase.refresh"""
+        if table_name not in self.PARTITIONED_TABLES:
+            return self.db.refresh(table_name)
+        for db in self._partitions_of(table_name):
+            db.refresh(table_name)
+    
+    def table_version(self, table_name, user_id=None):
+        """
+        表内容的版本，见ExcelDatabase.table_version
+        
+        分区表传入user_id(分区键的值)时只检查该值所在的分区，返回(分区号, 分区内的版本)，
+        其他分区的修改不会改变它；不传时为各分区版本组成的元组，需要检查所有分区
+        
+        Args:
+            table_name: 表名
+            user_id: 分区键的值，只对分区表有效
+        """
+        if table_name not in self.PARTITIONED_TABLES:
+            return self.db.table_version(table_name)
+        if user_id is not None:
+            partition = partition_of(user_id, self.partitions)
+            return (partition, self._partition(table_name, partition).table_version(table_name))
+        return tuple(db.table_version(table_name) for db in self._partitions_of(table_name))
+    
+    def snapshot(self):
+        """
+        获取所有表在同一时刻的数据，参数和返回值见ExcelDatabase.snapshot
+        
+        同时持有主库和所有分区的共享锁，分区表合并为一张表
+        """
+        dbs = [self.db] + [db for table_name in self.PARTITIONED_TABLES for db in self._partitions_of(table_name)]
+        with ExitStack() as stack:
+            for db in dbs:
+                stack.enter_context(db._file_lock.shared())
+            version, tables = self.db.snapshot()
+            for table_name in self.PARTITIONED_TABLES:
+                tables[table_name] = _concat(db.snapshot()[1].get(table_name) for db in self._partitions_of(table_name))
+        return version, tables
+    
+    @contextmanager
+    def transaction(self):
+        """
+        多表事务，参数和行为见ExcelDatabase.transaction
+        
+        事务中用到的分区在第一次使用时加入，离开with块时各分区先于主库提交。
+        主库和各分区是不同的文件，提交本身不是跨文件原子的：某个分区提交失败时
+        主库和尚未提交的分区回滚，已提交的分区保留
+        """
+        if getattr(self._tx_local, 'tx', None) is not None:
+            # 嵌套调用加入外层事务
+            yield
+            return
+        
+        with ExitStack() as stack:
+            stack.enter_context(self.db.transaction())
+            self._tx_local.tx = {'stack': stack, 'joined': set()}
+            try:
+                yield
+            finally:
+                self._tx_local.tx = None
+    
+    def publish_shared_tables(self):
+        """发布主库共享表的Arrow快照"""
+        return self.db.publish_shared_tables()
+    
+    def compact_journal(self):
+        """合并主库和已打开分区的操作日志"""
+        success = self.db.compact_journal()
+        for db in list(self._opened.values()):
+            success = db.compact_journal() and success
+        return success
+    
+    def close(self):
+        """关闭主库和已打开的分区"""
+        for db in list(self._opened.values()):
+            db.close()
+        self.db.close()
+
+
+def _concat(frames):
+    """合并各分区的查询结果，行号重新编为0..n-1"""
+    frames = [df for df in frames if df is not None and len(df.columns)]
+    if not frames:
+        return pd.DataFrame()
+    non_empty = [df for df in frames if not df.empty]
+    if len(non_empty) == 1:
+        return non_empty[0].reset_index(drop=True)
+    return pd.concat(non_empty or frames[:1], ignore_index=True)
+
+
+def _remove_database_files(path):
+    """删除数据库文件及其锁、版本号、日志、快照等附属文件"""
+    for suffix in ('', '.lock', '.version', '.journal', '.seq.json', '-wal', '-shm'):
+        try:
+            os.remove(path + suffix)
+        except OSError:
+            pass
+    shutil.rmtree(path + '.snapshots', ignore_errors=True)
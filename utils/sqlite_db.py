@@ -0,0 +1,523 @@
+import os
+import sqlite3
+import argparse
+import threading
+import pandas as pd
+from utils.excel_db import ExcelDatabase, _parse_order_by
+from utils.table_schema import apply_schema
+from utils.table_journal import apply_table_ops
+from utils.value_utils import to_storage_value
+
+
+def _quote(name):
+    """给SQLite标识符(表名、列名)加引号"""
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def _where_clause(where):
+    """
+    把{列名: 值}条件转换为WHERE子句，值为list/tuple/set时匹配其中任意一个
+    
+    Returns:
+        tuple: (以空格开头的WHERE子句，没有条件时为空字符串, 参数列表)
+    """
+    params = []
+    conditions = []
+    for column, value in (where or {}).items():
+        if isinstance(value, (list, tuple, set, frozenset)):
+            values = [to_storage_value(item) for item in value]
+            if not values:
+                conditions.append('0')
+                continue
+            conditions.append(f'{_quote(column)} IN ({", ".join(["?"] * len(values))})')
+            params.extend(values)
+        else:
+            conditions.append(f'{_quote(column)} = ?')
+            params.append(to_storage_value(value))
+    if not conditions:
+        return '', params
+    return ' WHERE ' + ' AND '.join(conditions), params
+
+
+class SQLiteDatabase(ExcelDatabase):
+    """
+    SQLite存储引擎
+    
+    对外接口与ExcelDatabase一致(read_table/write_table/add_row等)，
+    数据保存在SQLite中，写入在事务中完成，并为常用查询列建立索引。
+    为兼容基类，excel_path属性在该引擎下指向SQLite数据库文件。
+    """
+    
+    # 需要建立的索引: {表名: [(列名, 是否唯一), ...]}
+    # recipe_ingredients和user_ingredients的id在现有数据中并不唯一，只建普通索引
+    INDEXES = {
+        'users': [('id', True), ('openid', True), ('user_id', True)],
+        'recipes': [('id', True)],
+        'ingredients': [('id', True)],
+        'recipe_ingredients': [('id', False), ('recipe_id', False), ('ingredient_id', False)],
+        'user_ingredients': [('id', False), ('user_id', False), ('ingredient_id', False)]
+    }
+    
+    def __init__(self, sqlite_path, id_block_size=1, default_tables=None, coalesce_window=None):
+        """
+        初始化SQLite数据库
+        
+        Args:
+            sqlite_path: SQLite数据库文件路径
+            id_block_size: 每个进程一次预留的自增ID数量
+            default_tables: 新建数据库时创建的表及其列，为None时使用DEFAULT_TABLES
+            coalesce_window: 写入合并的时间窗口(秒)，见ExcelDatabase
+        """
+        self.sqlite_path = sqlite_path
+        # 每个线程使用各自的连接
+        self._local = threading.local()
+        super().__init__(sqlite_path, id_block_size=id_block_size, snapshots=False, default_tables=default_tables,
+                         coalesce_window=coalesce_window)
+    
+    def _connect(self):
+        """获取当前线程的数据库连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.sqlite_path, timeout=30)
+            # WAL模式下读写互不阻塞
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+    
+    def _file_stamp(self):
+        """
+        获取数据库文件的戳，WAL模式下提交首先写入-wal文件，因此一并纳入
+        
+        Returns:
+            tuple: 数据库文件和-wal文件的(mtime_ns, size)及版本号，数据库不存在时返回None
+        """
+        try:
+            stat = os.stat(self.sqlite_path)
+        except OSError:
+            return None
+        try:
+            wal_stat = os.stat(self.sqlite_path + '-wal')
+            wal = (wal_stat.st_mtime_ns, wal_stat.st_size)
+        except OSError:
+            wal = None
+        return (stat.st_mtime_ns, stat.st_size, wal, self._read_version())
+    
+    def ensure_db_exists(self):
+        """确保数据库文件和默认表存在"""
+        db_dir = os.path.dirname(self.sqlite_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        for table_name, columns in self.default_tables.items():
+            self.ensure_table_exists(table_name, columns)
+        
+        # 旧版本创建的数据库只有普通索引，没有重复值时升级为唯一索引
+        conn = self._connect()
+        with conn:
+            for table_name in self.INDEXES:
+                columns = self._table_columns(conn, table_name)
+                if columns is not None:
+                    self._create_indexes(conn, table_name, columns)
+    
+    def list_tables(self):
+        """
+        获取数据库中所有表名
+        
+        Returns:
+            list: 表名列表
+        """
+        rows = self._connect().execute(
+            "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%' ORDER BY rowid"
+        ).fetchall()
+        return [row[0] for row in rows]
+    
+    def _table_columns(self, conn, table_name):
+        """获取表的列名列表，表不存在时返回None"""
+        rows = conn.execute(f'PRAGMA table_info({_quote(table_name)})').fetchall()
+        if not rows:
+            return None
+        return [row[1] for row in rows]
+    
+    def _create_table(self, conn, table_name, columns):
+        """创建表及其索引，列不声明类型以保留写入值的原始类型"""
+        column_defs = ', '.join(_quote(column) for column in columns)
+        conn.execute(f'CREATE TABLE {_quote(table_name)} ({column_defs})')
+        self._create_indexes(conn, table_name, columns)
+    
+    def _create_indexes(self, conn, table_name, columns):
+        """
+        建立表上缺少的索引
+        
+        已有的普通索引应为唯一索引时，先检查重复值：没有重复时重建为唯一索引，
+        有重复时保留普通索引并输出重复的值
+        """
+        existing = {row[1]: bool(row[2]) for row in conn.execute(f'PRAGMA index_list({_quote(table_name)})')}
+        for column, unique in self.INDEXES.get(table_name, []):
+            if column not in columns:
+                continue
+            index_name = f'idx_{table_name}_{column}'
+            if index_name in existing and (existing[index_name] or not unique):
+                continue
+            if unique:
+                duplicates = _duplicate_values(conn, table_name, column)
+                if duplicates:
+                    print(f"表 {table_name} 的列 {column} 存在重复值 {duplicates}，只建立普通索引")
+                    unique = False
+            if index_name in existing:
+                if not unique:
+                    continue
+                conn.execute(f'DROP INDEX {_quote(index_name)}')
+            unique_sql = 'UNIQUE ' if unique else ''
+            conn.execute(f'CREATE {unique_sql}INDEX {_quote(index_name)} ON {_quote(table_name)} ({_quote(column)})')
+    
+    def _add_missing_columns(self, conn, table_name, existing_columns, columns):
+        """为表补充缺少的列"""
+        for column in columns:
+            if column not in existing_columns:
+                conn.execute(f'ALTER TABLE {_quote(table_name)} ADD COLUMN {_quote(column)}')
+                existing_columns.append(column)
+    
+    def _insert_rows(self, conn, table_name, columns, rows):
+        """批量插入行，rows为与columns对应的值序列"""
+        placeholders = ', '.join(['?'] * len(columns))
+        column_sql = ', '.join(_quote(column) for column in columns)
+        conn.executemany(
+            f'INSERT INTO {_quote(table_name)} ({column_sql}) VALUES ({placeholders})',
+            ([to_storage_value(value) for value in row] for row in rows)
+        )
+    
+    def select(self, table_name, where=None, columns=None, order_by=None, limit=None):
+        """
+        按条件查询表，参数见ExcelDatabase.select
+        
+        表已在缓存中或被本线程固定时直接查询内存中的表；否则把条件、排序、列和行数转换为SQL，
+        只从数据库中读出需要的数据，不加载整张表
+        """
+        stamp = self._file_stamp()
+        pinned = self._pinned_tables()
+        if (callable(where) or stamp is None or self._cached_table(table_name, stamp) is not None
+                or (pinned is not None and table_name in pinned)):
+            return super().select(table_name, where, columns, order_by, limit)
+        
+        try:
+            conn = self._connect()
+            table_columns = self._table_columns(conn, table_name)
+            sort_columns, ascending = _parse_order_by(order_by) if order_by else ([], [])
+            used_columns = list(where or {}) + sort_columns + list(columns or [])
+            if table_columns is None or any(column not in table_columns for column in used_columns):
+                # 交给基类处理不存在的表和列
+                return super().select(table_name, where, columns, order_by, limit)
+            
+            column_sql = '*' if columns is None else ', '.join(_quote(column) for column in columns)
+            sql = f'SELECT {column_sql} FROM {_quote(table_name)}'
+            where_sql, params = _where_clause(where)
+            sql += where_sql
+            
+            # 空值排在最后，与基类一致；排序相同的行保持表中的顺序
+            order_sql = [f'{_quote(column)} IS NULL, {_quote(column)}{"" if asc else " DESC"}'
+                         for column, asc in zip(sort_columns, ascending)]
+            sql += ' ORDER BY ' + ', '.join(order_sql + ['rowid'])
+            if limit is not None:
+                sql += ' LIMIT ?'
+                params.append(max(int(limit), 0))
+            
+            return apply_schema(table_name, pd.read_sql_query(sql, conn, params=params))
+        except Exception as e:
+            print(f"查询表 {table_name} 失败: {str(e)}")
+            return pd.DataFrame()
+    
+    def _load_table(self, table_name, blocking=True):
+        """从SQLite中加载一张表，WAL模式下读取不会等待写入，忽略blocking"""
+        return pd.read_sql_query(f'SELECT * FROM {_quote(table_name)} ORDER BY rowid', self._connect())
+    
+    def _stream_table(self, table_name, chunksize):
+        """按rowid顺序分块读取一张表，整个查询读取同一个数据库快照"""
+        return pd.read_sql_query(f'SELECT * FROM {_quote(table_name)} ORDER BY rowid', self._connect(),
+                                 chunksize=chunksize)
+    
+    def _save_table(self, table_name, df):
+        """
+        在一个事务中用DataFrame替换整张表
+        
+        列与现有表一致时只替换数据，保留表结构和索引；否则重建表
+        
+        Returns:
+            bool: 其他表是否原样保留(SQLite只改动目标表，始终为True)
+        """
+        conn = self._connect()
+        with conn:
+            self._replace_rows(conn, table_name, df)
+        return True
+    
+    def _replace_rows(self, conn, table_name, df):
+        """在调用方的事务中用DataFrame替换整张表"""
+        columns = [str(column) for column in df.columns]
+        existing_columns = self._table_columns(conn, table_name)
+        if existing_columns == columns:
+            conn.execute(f'DELETE FROM {_quote(table_name)}')
+        else:
+            if existing_columns is not None:
+                conn.execute(f'DROP TABLE {_quote(table_name)}')
+            self._create_table(conn, table_name, columns)
+        self._insert_rows(conn, table_name, columns, df.itertuples(index=False, name=None))
+    
+    def ensure_table_exists(self, table_name, columns):
+        """
+        确保指定的表存在
+        
+        Args:
+            table_name: 表名
+            columns: 列名列表
+        
+        Returns:
+            bool: 是否成功
+        """
+        try:
+            conn = self._connect()
+            with conn:
+                if self._table_columns(conn, table_name) is None:
+                    self._create_table(conn, table_name, list(columns))
+            return True
+        except Exception as e:
+            print(f"确保表 {table_name} 存在失败: {str(e)}")
+            return False
+    
+    def _write_transaction(self, steps):
+        """
+        在一个SQLite事务中执行一次提交的所有修改，只改动涉及的行
+        
+        Args:
+            steps: [(表名, 操作列表, 操作后的表)]，按执行顺序排列
+        
+        Returns:
+            bool: 其他表是否原样保留(始终为True)
+        """
+        conn = self._connect()
+        with conn:
+            # 显式开始事务，使其中的建表、加列语句也一起提交或回滚
+            if not conn.in_transaction:
+                conn.execute('BEGIN')
+            for table_name, ops, new_df in steps:
+                if any(op['op'] == 'replace' for op in ops) or self._table_columns(conn, table_name) is None:
+                    # 整表替换，或事务中新建的表
+                    self._replace_rows(conn, table_name, new_df)
+                    continue
+                rowids = None
+                if any(op['op'] in ('update', 'delete') for op in ops):
+                    # 操作中的行号对应按rowid排序后的位置，只有更新和删除需要换算为rowid
+                    rowids = [row[0] for row in conn.execute(f'SELECT rowid FROM {_quote(table_name)} ORDER BY rowid')]
+                self._execute_ops(conn, table_name, ops, rowids)
+        return True
+    
+    def _commit_ops(self, table_name, make_ops, where=None):
+        """
+        提交行级操作，参数见ExcelDatabase._commit_ops
+        
+        不在事务中、也不交给写入线程时，make_ops只用到满足where条件的行的写入(按{列名: 值}更新、
+        删除和插入)只从数据库中读出这些行(行号为rowid)，操作直接转换为按rowid的UPDATE/DELETE和INSERT，
+        不加载整张表。返回的表只包含这些行和插入的行
+        """
+        if (where is None or self._transaction_state() is not None or self._queue_writes()
+                or (where is not False and not isinstance(where, dict))):
+            return super()._commit_ops(table_name, make_ops, where)
+        
+        with self.locked():
+            conn = self._connect()
+            stamp_before = self._file_stamp()
+            old_df = self._read_rows(conn, table_name, where)
+            if old_df is not None:
+                ops = make_ops(old_df)
+                if not ops:
+                    return old_df
+                
+                for op in ops:
+                    op['table'] = table_name
+                new_df = apply_table_ops(old_df, ops, table_name)
+                with conn:
+                    if not conn.in_transaction:
+                        conn.execute('BEGIN')
+                    self._check_unique_rows(conn, table_name, old_df, new_df)
+                    self._execute_ops(conn, table_name, ops)
+                    # 保留的行沿用rowid，插入的行得到连续的新rowid
+                    deleted = [op['pos'] for op in ops if op['op'] == 'delete']
+                    kept = old_df.index.drop(deleted)
+                    inserted = len(new_df) - len(kept)
+                    last_rowid = conn.execute(f'SELECT max(rowid) FROM {_quote(table_name)}').fetchone()[0] or 0
+                    new_df.index = kept.append(pd.RangeIndex(last_rowid - inserted + 1, last_rowid + 1))
+                versions = self._after_write_tables({table_name: None}, stamp_before)
+        
+        if old_df is None:
+            # 表或条件中的列不存在，交给基类处理
+            return super()._commit_ops(table_name, make_ops, where)
+        self._unpin([table_name])
+        self._after_commit(ops, versions)
+        return new_df
+    
+    def _read_rows(self, conn, table_name, where):
+        """
+        读出满足条件的行，行号为rowid
+        
+        Args:
+            conn: 数据库连接
+            table_name: 表名
+            where: {列名: 值}，为False时不读取任何行
+        
+        Returns:
+            DataFrame: 满足条件的行(包含所有列)，表或条件中的列不存在时返回None
+        """
+        table_columns = self._table_columns(conn, table_name)
+        if table_columns is None or (where is not False and any(column not in table_columns for column in where)):
+            return None
+        if where is False:
+            where_sql, params = ' WHERE 0', []
+        else:
+            where_sql, params = _where_clause(where)
+        df = pd.read_sql_query(f'SELECT rowid AS "rowid", * FROM {_quote(table_name)}{where_sql} ORDER BY rowid',
+                               conn, params=params, index_col='rowid')
+        df.index.name = None
+        return apply_schema(table_name, df)
+    
+    def _check_unique_rows(self, conn, table_name, old_df, new_df):
+        """
+        检查按条件写入的行是否违反唯一索引: 新写入的值之间不能重复，也不能与表中其他行的值重复
+        
+        Args:
+            conn: 数据库连接
+            table_name: 表名
+            old_df: 写入前读出的行(行号为rowid)
+            new_df: 这些行写入后的结果(包含插入的行)
+        
+        Raises:
+            ValueError: 存在重复值
+        """
+        for column, unique in self._index_specs.get(table_name, {}).items():
+            if not unique or column not in new_df.columns:
+                continue
+            values = new_df[column].dropna()
+            if values.duplicated().any():
+                raise ValueError(f"唯一索引 {table_name}.{column} 存在重复值: {values[values.duplicated()].iloc[0]}")
+            # 读出的行以外的行中是否有相同的值
+            values = [to_storage_value(value) for value in values.unique()]
+            if not values or column not in self._table_columns(conn, table_name):
+                continue
+            rowids = [int(rowid) for rowid in old_df.index]
+            row = conn.execute(
+                f'SELECT {_quote(column)} FROM {_quote(table_name)} '
+                f'WHERE {_quote(column)} IN ({", ".join(["?"] * len(values))}) '
+                f'AND rowid NOT IN ({", ".join(["?"] * len(rowids))}) LIMIT 1',
+                values + rowids
+            ).fetchone()
+            if row is not None:
+                raise ValueError(f"唯一索引 {table_name}.{column} 存在重复值: {row[0]}")
+    
+    def _execute_ops(self, conn, table_name, ops, rowids=None):
+        """
+        在调用方的事务中把行级操作转换为UPDATE/DELETE/INSERT
+        
+        Args:
+            conn: 数据库连接
+            table_name: 表名
+            ops: 操作列表
+            rowids: 按rowid排序的所有rowid，操作中的行号为其中的位置；为None时行号就是rowid
+        """
+        table_sql = _quote(table_name)
+        existing_columns = self._table_columns(conn, table_name)
+        # 插入的行按列分组，每组用一次executemany写入
+        inserts = {}
+        for op in ops:
+            if op['op'] == 'update':
+                columns = list(op['values'].keys())
+                self._add_missing_columns(conn, table_name, existing_columns, columns)
+                assignments = ', '.join(f'{_quote(column)} = ?' for column in columns)
+                conn.execute(
+                    f'UPDATE {table_sql} SET {assignments} WHERE rowid = ?',
+                    [to_storage_value(op['values'][column]) for column in columns] + [_rowid(op, rowids)]
+                )
+            elif op['op'] == 'delete':
+                conn.execute(f'DELETE FROM {table_sql} WHERE rowid = ?', (_rowid(op, rowids),))
+            elif op['op'] == 'insert':
+                inserts.setdefault(tuple(op['row'].keys()), []).append(list(op['row'].values()))
+        
+        for columns, rows in inserts.items():
+            self._add_missing_columns(conn, table_name, existing_columns, list(columns))
+            self._insert_rows(conn, table_name, list(columns), rows)
+
+
+def _duplicate_values(conn, table_name, column, limit=5):
+    """表中某列重复出现的值(不包括空值)，最多返回limit个"""
+    rows = conn.execute(
+        f'SELECT {_quote(column)} FROM {_quote(table_name)} WHERE {_quote(column)} IS NOT NULL '
+        f'GROUP BY {_quote(column)} HAVING COUNT(*) > 1 LIMIT ?', (limit,)
+    ).fetchall()
+    return [row[0] for row in rows]
+
+
+def _rowid(op, rowids):
+    """更新或删除操作对应的rowid"""
+    return int(op['pos']) if rowids is None else rowids[op['pos']]
+
+
+def migrate_excel_to_sqlite(excel_path, sqlite_path, overwrite=False):
+    """
+    把Excel数据库中的所有sheet一次性迁移到SQLite数据库
+    
+    Args:
+        excel_path: 源Excel文件路径
+        sqlite_path: 目标SQLite数据库文件路径
+        overwrite: 目标中已存在同名表时是否覆盖
+    
+    Returns:
+        dict: {表名: 迁移的行数}
+    
+    Raises:
+        ValueError: 需要唯一索引的列(users的id、openid、user_id等)中存在重复值
+    """
+    if not os.path.exists(excel_path):
+        raise FileNotFoundError(f"Excel文件不存在: {excel_path}")
+    
+    # 通过ExcelDatabase读取，未合并的操作日志也会一并迁移
+    source = ExcelDatabase(excel_path, journal=os.path.exists(excel_path + '.journal'), compact_interval=None)
+    sheets = {table_name: source.read_table(table_name) for table_name in source.list_tables()}
+    
+    # 唯一索引的列中有重复值时无法写入，迁移前全部检查并输出，不迁移任何表
+    duplicated = False
+    for table_name, df in sheets.items():
+        for column, unique in SQLiteDatabase.INDEXES.get(table_name, []):
+            if not unique or column not in df.columns:
+                continue
+            values = df[column].dropna()
+            duplicates = values[values.duplicated()].unique().tolist()
+            if duplicates:
+                duplicated = True
+                print(f"表 {table_name} 的列 {column} 存在重复值: {duplicates[:5]}")
+    if duplicated:
+        raise ValueError("唯一列中存在重复值，请先处理后再迁移")
+    
+    db = SQLiteDatabase(sqlite_path)
+    existing_tables = set(db.list_tables())
+    
+    migrated = {}
+    for table_name, df in sheets.items():
+        if table_name in existing_tables and not overwrite:
+            # 默认表在初始化时已创建，只有为空时才允许直接覆盖
+            if not db.read_table(table_name).empty:
+                print(f"表 {table_name} 已存在且有数据，跳过(使用--overwrite覆盖)")
+                continue
+        if not db.write_table(table_name, df):
+            raise RuntimeError(f"迁移表 {table_name} 失败")
+        migrated[table_name] = len(df)
+        print(f"已迁移表 {table_name}: {len(df)} 行")
+    
+    return migrated
+
+
+if __name__ == '__main__':
+    from config import Config
+    
+    parser = argparse.ArgumentParser(description='把Excel数据库迁移到SQLite')
+    parser.add_argument('--excel', default=Config.EXCEL_DB_PATH, help='源Excel文件路径')
+    parser.add_argument('--sqlite', default=Config.SQLITE_DB_PATH, help='目标SQLite数据库路径')
+    parser.add_argument('--overwrite', action='store_true', help='覆盖目标中已有数据的表')
+    args = parser.parse_args()
+    
+    migrate_excel_to_sqlite(args.excel, args.sqlite, overwrite=args.overwrite)
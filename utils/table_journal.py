@@ -0,0 +1,338 @@
+import os
+import json
+import itertools
+import threading
+import warnings
+import numpy as np
+import pandas as pd
+from utils.table_schema import apply_schema
+from utils.value_utils import to_storage_value
+
+
+class TableJournal:
+    """
+    追加写的表操作日志(JSON-lines)
+    
+    每次提交写入一行: {"seq": 序号, "ops": [操作, ...]}，写入后立即fsync。
+    多进程共用同一日志时，调用方需要用文件锁串行化append和truncate。
+    单行写入保证一次提交中的所有操作要么全部生效，要么(行不完整时)全部忽略。
+    
+    操作格式:
+        {"table": 表名, "op": "insert", "row": {...}}
+        {"table": 表名, "op": "update", "pos": 行号, "key": id, "values": {...}}
+        {"table": 表名, "op": "delete", "pos": 行号, "key": id}
+        {"table": 表名, "op": "replace", "columns": [...], "rows": [[...], ...]}
+    其中pos是操作前表中的行号(从0开始)，key是该行的id，仅用于阅读和排查。
+    事务提交的操作还带有group字段，同一张表的各组操作按顺序依次应用。
+    """
+    
+    def __init__(self, journal_path):
+        """
+        初始化日志
+        
+        Args:
+            journal_path: 日志文件路径
+        """
+        self.journal_path = journal_path
+        self._lock = threading.Lock()
+        self.last_seq = 0
+        # 本进程最后一次看到的日志大小，不一致说明其他进程追加或截断过日志
+        self._known_size = None
+        self._refresh()
+    
+    def _refresh(self):
+        """根据日志文件重新确定最大序号"""
+        for batch in self.read_batches():
+            self.last_seq = max(self.last_seq, batch['seq'])
+        self._known_size = self.size()
+    
+    def read_batches(self, after_seq=0):
+        """
+        读取日志中的提交记录
+        
+        Args:
+            after_seq: 只返回序号大于该值的提交
+        
+        Returns:
+            list: 提交记录列表，按写入顺序排列
+        """
+        if not os.path.exists(self.journal_path):
+            return []
+        
+        batches = []
+        with open(self.journal_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    batch = json.loads(line)
+                except ValueError:
+                    # 写入中途崩溃留下的不完整行，忽略
+                    print(f"忽略日志中不完整的记录: {self.journal_path}")
+                    continue
+                if batch.get('seq', 0) > after_seq:
+                    batches.append(batch)
+        return batches
+    
+    def append(self, ops):
+        """
+        把一次提交的操作追加到日志并落盘
+        
+        Args:
+            ops: 操作列表
+        
+        Returns:
+            int: 本次提交的序号
+        """
+        with self._lock:
+            if self.size() != self._known_size:
+                self._refresh()
+            seq = self.last_seq + 1
+            line = json.dumps({'seq': seq, 'ops': ops}, ensure_ascii=False, default=str)
+            with open(self.journal_path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            self.last_seq = seq
+            self._known_size = self.size()
+            return seq
+    
+    def size(self):
+        """日志文件大小(字节)"""
+        try:
+            return os.path.getsize(self.journal_path)
+        except OSError:
+            return 0
+    
+    def truncate(self, upto_seq):
+        """
+        删除序号不大于upto_seq的提交(已合并到快照中的部分)
+        
+        Args:
+            upto_seq: 已合并的最大序号
+        """
+        with self._lock:
+            remaining = self.read_batches(after_seq=upto_seq)
+            tmp_path = self.journal_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for batch in remaining:
+                    f.write(json.dumps(batch, ensure_ascii=False, default=str) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.journal_path)
+            self._known_size = self.size()
+
+
+def _row_values(df, label, columns):
+    """获取一行中指定列的可持久化值"""
+    return {str(column): to_storage_value(df.at[label, column]) for column in columns}
+
+
+def diff_table_ops(old_df, new_df):
+    """
+    比较表的新旧两个版本，生成把旧版本变为新版本的操作列表
+    
+    旧版本必须是从数据库读出的表(行号为0..n-1)，新版本通常是调用方在其副本上
+    修改后的结果: 保留的行沿用原来的行号，新增的行使用新的行号。
+    列被删除、顺序改变或行号重复等无法按行描述的变化会生成一个replace操作；旧版本没有列时
+    (例如事务中新建的表)同样整表替换，新表没有行时也能保留列。
+    
+    Args:
+        old_df: 旧版本DataFrame
+        new_df: 新版本DataFrame
+    
+    Returns:
+        list: 操作列表(不含table字段)
+    """
+    columns = list(new_df.columns)
+    old_columns = list(old_df.columns)
+    index = new_df.index
+    # 新增行只能追加在末尾，且原有行和列的顺序不能改变，否则按行描述的操作无法还原新版本
+    if ((columns and not old_columns)
+            or not index.is_unique
+            or not pd.api.types.is_integer_dtype(index.dtype)
+            or not index.is_monotonic_increasing
+            or (len(index) and index[~index.isin(old_df.index)].min() < len(old_df))
+            or columns[:len(old_columns)] != old_columns
+            or len(set(str(column) for column in columns)) != len(columns)):
+        return [{
+            'op': 'replace',
+            'columns': [str(column) for column in columns],
+            'rows': [[to_storage_value(value) for value in row] for row in new_df.itertuples(index=False, name=None)]
+        }]
+    
+    ops = []
+    
+    # 更新: 新旧版本都存在的行中发生变化的列
+    common = new_df.index[new_df.index.isin(old_df.index)]
+    if len(common):
+        old_values = old_df.reindex(columns=columns).loc[common].to_numpy(dtype=object)
+        new_values = new_df.loc[common, columns].to_numpy(dtype=object)
+        old_na = pd.isna(old_values)
+        new_na = pd.isna(new_values)
+        try:
+            with warnings.catch_warnings():
+                # Timestamp与date比较时的FutureWarning，结果按不相等处理即可
+                warnings.simplefilter('ignore', FutureWarning)
+                equal = np.asarray(old_values == new_values, dtype=bool)
+        except (TypeError, ValueError):
+            # 单元格中有无法直接比较的值时逐个比较
+            equal = np.zeros(old_values.shape, dtype=bool)
+            for i, j in zip(*np.nonzero(~old_na & ~new_na)):
+                try:
+                    equal[i, j] = bool(old_values[i, j] == new_values[i, j])
+                except (TypeError, ValueError):
+                    equal[i, j] = False
+        same = (old_na & new_na) | (equal & ~old_na & ~new_na)
+        for i, label in enumerate(common):
+            changed = [columns[j] for j in range(len(columns)) if not same[i, j]]
+            if changed:
+                ops.append({
+                    'op': 'update',
+                    'pos': int(label),
+                    'key': to_storage_value(old_df.at[label, 'id']) if 'id' in old_df.columns else None,
+                    'values': _row_values(new_df, label, changed)
+                })
+    
+    # 删除: 只在旧版本中存在的行
+    for label in old_df.index[~old_df.index.isin(new_df.index)]:
+        ops.append({
+            'op': 'delete',
+            'pos': int(label),
+            'key': to_storage_value(old_df.at[label, 'id']) if 'id' in old_df.columns else None
+        })
+    
+    # 插入: 只在新版本中存在的行
+    for label in new_df.index[~new_df.index.isin(old_df.index)]:
+        ops.append({'op': 'insert', 'row': _row_values(new_df, label, columns)})
+    
+    return ops
+
+
+def apply_table_ops(df, ops, table_name=None):
+    """
+    把一次提交中属于同一张表的操作应用到表上
+    
+    update和delete中的行号都指向操作前的表，insert的行追加在末尾。
+    事务中的多次修改以group编号区分，按编号依次应用，每组的行号指向上一组应用后的表
+    
+    不修改传入的表，也不复制整张表：结果是它的浅拷贝，只复制被更新的列后按位置写入，
+    删除的行通过drop去掉，插入的行追加在末尾，未涉及的列与原表共用数据
+    
+    Args:
+        df: 操作前的DataFrame(行号为0..n-1；按条件读出的部分行时为存储中的行号)
+        ops: 操作列表
+        table_name: 传入时按表结构(见table_schema.apply_schema)转换插入的行和被更新的列，
+            整表替换时转换整张表；其他列在原表中已经转换过，不再检查
+    
+    Returns:
+        DataFrame: 操作后的新DataFrame(行号重新编为0..n-1)
+    """
+    groups = [list(group) for _, group in itertools.groupby(ops, key=lambda op: op.get('group'))]
+    if len(groups) > 1:
+        for group in groups:
+            df = apply_table_ops(df, group, table_name)
+        return df
+    
+    result = df.copy(deep=False)
+    replaced = False
+    # {列名: {行号: 值}}，同一单元格的多次更新以最后一次为准
+    updates = {}
+    deleted = []
+    inserted = []
+    
+    for op in ops:
+        kind = op['op']
+        if kind == 'replace':
+            result = pd.DataFrame(op['rows'], columns=op['columns'])
+            replaced = True
+            updates = {}
+            deleted = []
+            inserted = []
+        elif kind == 'update':
+            for column, value in op['values'].items():
+                updates.setdefault(column, {})[op['pos']] = value
+        elif kind == 'delete':
+            deleted.append(op['pos'])
+        elif kind == 'insert':
+            inserted.append(op['row'])
+    
+    for column, cells in updates.items():
+        result[column] = _updated_column(result, column, cells)
+    if table_name is not None and (replaced or updates):
+        result = _apply_schema(table_name, result, None if replaced else list(updates))
+    
+    if deleted:
+        result = result.drop(index=deleted)
+    if inserted:
+        inserted_df = pd.DataFrame(inserted)
+        if table_name is not None:
+            inserted_df = _apply_schema(table_name, inserted_df)
+        # 日志中的日期等值以字符串保存，尽量转换回表中对应列的类型
+        for column in inserted_df.columns:
+            if column not in result.columns or inserted_df[column].dtype == result[column].dtype:
+                continue
+            if isinstance(result[column].dtype, pd.CategoricalDtype):
+                # 分类列先加入新的类别，合并后仍为分类列
+                values = inserted_df[column].astype(object)
+                new_categories = values[values.notna() & ~values.isin(result[column].cat.categories)].unique()
+                if len(new_categories):
+                    result[column] = result[column].cat.add_categories(list(new_categories))
+                inserted_df[column] = values.astype(result[column].dtype)
+            elif not isinstance(result[column].dtype, pd.StringDtype):
+                # 字符串列转换时会把None变为pd.NA，保持原值，合并后为对象列
+                try:
+                    inserted_df[column] = inserted_df[column].astype(result[column].dtype)
+                except (TypeError, ValueError):
+                    pass
+        return pd.concat([result, inserted_df], ignore_index=True)
+    
+    if not isinstance(result.index, pd.RangeIndex) or result.index.start != 0 or result.index.step != 1:
+        # 只替换行号，不复制数据
+        result.index = pd.RangeIndex(len(result))
+    return result
+
+
+def _updated_column(df, column, cells):
+    """
+    复制一列并按位置写入更新的值
+    
+    Args:
+        df: 表
+        column: 列名，不存在时新建(其他行为空值)
+        cells: {行号: 值}
+    
+    Returns:
+        Series: 更新后的列，不修改df中的原列
+    """
+    if column not in df.columns:
+        series = pd.Series([None] * len(df), index=df.index, dtype=object)
+    elif isinstance(df[column].dtype, pd.StringDtype):
+        # 共享快照中的字符串列只能写入字符串，转换为普通的对象列
+        series = df[column].astype(object)
+    else:
+        series = df[column].copy()
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            # 分类列只能写入已有的类别
+            new_categories = [value for value in dict.fromkeys(cells.values())
+                              if not pd.isna(value) and value not in series.cat.categories]
+            if new_categories:
+                series = series.cat.add_categories(new_categories)
+    
+    positions = df.index.get_indexer(list(cells))
+    if (positions < 0).any():
+        raise KeyError(f"更新的行不存在: {[row for row, position in zip(cells, positions) if position < 0]}")
+    for position, value in zip(positions, cells.values()):
+        series.iloc[position] = value
+    return series
+
+
+def _apply_schema(table_name, df, columns=None):
+    """按表结构转换df(调用方自己的浅拷贝)中的列，columns为None时转换所有列"""
+    if columns is None:
+        return apply_schema(table_name, df)
+    converted = apply_schema(table_name, df[columns])
+    for column in columns:
+        df[column] = converted[column]
+    return df
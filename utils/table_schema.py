@@ -0,0 +1,108 @@
+import pandas as pd
+
+
+# 各表的列类型，对应 数据库设计/数据库表名和字段.md
+#   int: 整数(ID等)，有空值时保持为浮点数
+#   number: 数值
+#   date: 日期时间，空值为NaT
+#   category: 取值较少的文本，以pandas分类类型保存以节省内存
+# created_at/updated_at等时间字段在部分表中以字符串保存并原样返回给前端，不做转换
+TABLE_SCHEMAS = {
+    'ingredients': {
+        'id': 'int',
+        'unit': 'category',
+        'category': 'category'
+    },
+    'recipes': {
+        'id': 'int',
+        'cook_time': 'number',
+        'calories': 'number',
+        'difficulty': 'category'
+    },
+    'recipe_ingredients': {
+        'id': 'int',
+        'recipe_id': 'int',
+        'ingredient_id': 'int',
+        'quantity': 'number',
+        'unit': 'category'
+    },
+    'users': {
+        'id': 'int'
+    },
+    'user_ingredients': {
+        'id': 'int',
+        'user_id': 'int',
+        'ingredient_id': 'int',
+        'quantity': 'number',
+        'expiry_date': 'date'
+    }
+}
+
+
+def apply_schema(table_name, df):
+    """
+    按表结构转换列的类型
+    
+    类型已经正确的列不做转换(不复制数据)。数值列中有无法转换的值(如"20分钟")、
+    日期列中有无法解析的值时保持原类型，避免写回时丢失数据；读取这样的列时需要
+    逐个转换(见value_utils.to_number)。
+    
+    Args:
+        table_name: 表名
+        df: 从存储中读出的表
+    
+    Returns:
+        DataFrame: 转换后的表，没有需要转换的列时返回原DataFrame
+    """
+    schema = TABLE_SCHEMAS.get(table_name)
+    if not schema:
+        return df
+    
+    converted = {}
+    for column, kind in schema.items():
+        if column not in df.columns or not isinstance(df[column], pd.Series):
+            continue
+        series = _coerce(table_name, df[column], kind)
+        if series is not None:
+            converted[column] = series
+    
+    if not converted:
+        return df
+    
+    df = df.copy(deep=False)
+    for column, series in converted.items():
+        df[column] = series
+    return df
+
+
+def _coerce(table_name, series, kind):
+    """转换一列的类型，不需要或不能转换时返回None"""
+    dtype = series.dtype
+    
+    if kind == 'category':
+        if dtype == object:
+            return series.astype('category')
+        return None
+    
+    if kind == 'date':
+        if pd.api.types.is_datetime64_dtype(dtype):
+            return None
+        parsed = pd.to_datetime(series, errors='coerce')
+        # 空白字符串本来就表示没有日期，不算丢失
+        blank = series.astype(str).str.strip() == ''
+        if (parsed.isna() & series.notna() & ~blank).any():
+            return None
+        return parsed
+    
+    if pd.api.types.is_bool_dtype(dtype) or not pd.api.types.is_numeric_dtype(dtype):
+        numeric = pd.to_numeric(series, errors='coerce')
+        if (numeric.isna() & series.notna()).any():
+            return None
+    elif kind == 'int' and not pd.api.types.is_integer_dtype(dtype):
+        numeric = series
+    else:
+        return None
+    
+    if kind == 'int' and numeric.notna().all() and (numeric % 1 == 0).all():
+        return numeric.astype('int64')
+    return numeric if numeric.dtype != dtype else None
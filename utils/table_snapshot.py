@@ -0,0 +1,265 @@
+import os
+import json
+import shutil
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+except ImportError:
+    # 没有安装pyarrow时不能共享表，所有表都用pickle快照
+    pa = None
+
+
+class SnapshotStore:
+    """
+    Excel工作簿各sheet的二进制(pickle)快照
+    
+    每个快照文件名中带有生成时工作簿文件的戳: <表名>@<mtime_ns>-<size>-<inode>.pkl，
+    只有戳与当前工作簿一致时才会被使用，因此人工编辑Excel文件后快照自动失效。
+    工作簿保存时未修改的表的快照改名为新的戳继续使用，被修改的表的快照删除，
+    在下一次读取时重新生成。
+    
+    shared_tables中的表保存为Arrow IPC格式(<表名>@<戳>.arrow目录，需要pyarrow): 数值、日期列
+    和没有空值的字符串列写入data.arrow，加载时通过pyarrow.memory_map只读映射，不复制数据，
+    多个gunicorn worker共享操作系统页缓存中的同一份数据。字符串列加载为pyarrow支持的
+    string[pyarrow]类型；有空值或混合类型的对象列不能共享，仍然用pickle保存在objects.pkl中，
+    每个worker各有一份。快照目录先在临时目录中写好再整体改名，其他worker只会看到完整的新版本。
+    """
+    
+    def __init__(self, directory, shared_tables=()):
+        """
+        初始化快照目录
+        
+        Args:
+            directory: 快照文件所在目录，不存在时在第一次保存快照时创建
+            shared_tables: 以内存映射格式保存、在worker之间共享的表名
+        """
+        self.directory = directory
+        self.shared_tables = frozenset(shared_tables or ())
+        if self.shared_tables and pa is None:
+            print("没有安装pyarrow，共享表(EXCEL_DB_SHARED_TABLES)改为普通快照")
+            self.shared_tables = frozenset()
+    
+    def _path(self, name, stamp, ext):
+        return os.path.join(self.directory, f'{name}@{stamp[0]}-{stamp[1]}-{stamp[2]}.{ext}')
+    
+    def _files(self):
+        """列出快照目录中的快照文件(不含写入中的临时文件): [(名称, 文件名, 扩展名)]"""
+        try:
+            filenames = os.listdir(self.directory)
+        except OSError:
+            return []
+        files = []
+        for filename in filenames:
+            ext = filename.rsplit('.', 1)[-1]
+            # mmap为旧版本的共享表格式，只用于清理
+            if '@' in filename and ext in ('pkl', 'json', 'arrow', 'mmap'):
+                files.append((filename.rsplit('@', 1)[0], filename, ext))
+        return files
+    
+    def _write_atomic(self, path, write):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        try:
+            write(tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    
+    def _remove(self, name, keep=None):
+        """删除某张表的快照文件，keep为需要保留的文件名"""
+        for file_name, filename, _ in self._files():
+            if file_name == name and filename != keep:
+                try:
+                    _remove_path(os.path.join(self.directory, filename))
+                except OSError:
+                    pass
+    
+    def load(self, table_name, stamp):
+        """
+        加载与工作簿戳一致的快照
+        
+        Args:
+            table_name: 表名
+            stamp: 工作簿文件的戳
+        
+        Returns:
+            DataFrame: 快照数据，没有可用快照时返回None
+        """
+        path = self._path(table_name, stamp, 'pkl')
+        if table_name in self.shared_tables:
+            mapped_path = self._path(table_name, stamp, 'arrow')
+            if os.path.isdir(mapped_path):
+                path = mapped_path
+        if not os.path.exists(path):
+            return None
+        try:
+            if path.endswith('.arrow'):
+                return _attach_arrow(path)
+            return pd.read_pickle(path)
+        except Exception as e:
+            print(f"读取快照失败，改为读取Excel: {path}: {str(e)}")
+            return None
+    
+    def save(self, table_name, stamp, df):
+        """
+        保存表的快照，并删除该表其他戳的旧快照
+        
+        Args:
+            table_name: 表名
+            stamp: 工作簿文件的戳
+            df: 从该工作簿中读出的表数据
+        """
+        path = self._path(table_name, stamp, 'pkl')
+        try:
+            if table_name in self.shared_tables and _can_share(df):
+                path = self._path(table_name, stamp, 'arrow')
+                self._publish_mapped(path, df)
+            else:
+                self._write_atomic(path, df.to_pickle)
+            self._remove(table_name, keep=os.path.basename(path))
+        except Exception as e:
+            print(f"保存快照失败: {path}: {str(e)}")
+    
+    def _publish_mapped(self, path, df):
+        """在临时目录中写好共享格式的快照后整体改名发布，已有相同版本时保留已有的"""
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        try:
+            _remove_path(tmp_path)
+            os.makedirs(tmp_path)
+            _write_arrow(tmp_path, df)
+            try:
+                os.rename(tmp_path, path)
+            except OSError:
+                # 其他worker已经发布了同一版本
+                if not os.path.isdir(path):
+                    raise
+        finally:
+            _remove_path(tmp_path)
+    
+    def load_meta(self, stamp):
+        """加载与工作簿戳一致的元数据(如已合并的日志序号)，没有时返回None"""
+        path = self._path('_meta', stamp, 'json')
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+    
+    def save_meta(self, stamp, meta):
+        """保存工作簿的元数据"""
+        path = self._path('_meta', stamp, 'json')
+        
+        def write(tmp_path):
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(meta, f, ensure_ascii=False)
+        
+        try:
+            self._write_atomic(path, write)
+            self._remove('_meta', keep=os.path.basename(path))
+        except Exception as e:
+            print(f"保存快照元数据失败: {path}: {str(e)}")
+    
+    def commit(self, stamp_before, stamp_after, changed):
+        """
+        工作簿保存后更新快照，需要在持有排他锁时调用
+        
+        Args:
+            stamp_before: 保存前工作簿的戳，为None时删除所有快照
+            stamp_after: 保存后工作簿的戳
+            changed: 被修改的表名(包括'_meta')
+        """
+        for name, filename, ext in self._files():
+            path = os.path.join(self.directory, filename)
+            try:
+                if stamp_before is None or name in changed:
+                    _remove_path(path)
+                elif path == self._path(name, stamp_before, ext):
+                    # 内容未变，沿用为新工作簿的快照
+                    os.replace(path, self._path(name, stamp_after, ext))
+            except OSError:
+                pass
+
+
+def _remove_path(path):
+    """删除快照文件或内存映射格式的快照目录，不存在时忽略"""
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def _arrow_type(series):
+    """
+    列在Arrow中的类型，不能共享的列返回None
+    
+    数值、布尔和不带时区的日期时间列直接映射numpy数组；没有空值、全部为str的对象列
+    保存为Arrow字符串。有空值的字符串列加载后会出现pd.NA，与其他表的行为不一致，不共享
+    """
+    dtype = series.dtype
+    if isinstance(dtype, np.dtype) and dtype.kind in 'biufmM':
+        return pa.from_numpy_dtype(dtype)
+    if dtype == object and len(series) and all(type(value) is str for value in series.tolist()):
+        return pa.string()
+    return None
+
+
+def _can_share(df):
+    """
+    判断表能否使用共享格式: 非空、默认行索引、列名为不重复的字符串，且至少有一列可以共享
+    """
+    if len(df) == 0 or not isinstance(df.index, pd.RangeIndex) or df.index.start != 0 or df.index.step != 1:
+        return False
+    if not df.columns.is_unique or not all(isinstance(column, str) for column in df.columns):
+        return False
+    return any(_arrow_type(df[column]) is not None for column in df.columns)
+
+
+def _write_arrow(directory, df):
+    """
+    把表写成共享格式
+    
+    可以共享的列写入Arrow IPC文件data.arrow(不压缩，加载时可以直接映射)，
+    其余的列作为DataFrame保存在objects.pkl中，列的顺序记录在Arrow的元数据中
+    """
+    arrays, names, others = [], [], []
+    for column in df.columns:
+        arrow_type = _arrow_type(df[column])
+        if arrow_type is None:
+            others.append(column)
+            continue
+        # 直接从numpy数组转换，浮点数列中的NaN、日期列中的NaT(按整数保存)都作为普通的值，
+        # 加载时不需要填充空值，可以直接映射
+        values = df[column].to_numpy()
+        if values.dtype.kind in 'mM':
+            values = values.view('int64')
+        arrays.append(pa.array(values, type=arrow_type))
+        names.append(column)
+    
+    table = pa.Table.from_arrays(arrays, names=names)
+    table = table.replace_schema_metadata({'columns': json.dumps(list(df.columns), ensure_ascii=False)})
+    with pa.OSFile(os.path.join(directory, 'data.arrow'), 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    if others:
+        df[others].to_pickle(os.path.join(directory, 'objects.pkl'))
+
+
+def _attach_arrow(directory):
+    """以只读内存映射的方式加载共享格式的快照，数值、日期和字符串列不复制数据"""
+    source = pa.memory_map(os.path.join(directory, 'data.arrow'))
+    table = pa.ipc.open_file(source).read_all()
+    columns = json.loads(table.schema.metadata[b'columns'])
+    # split_blocks使每列单独作为一个数据块，不合并(复制)同类型的列；字符串列保留为Arrow数组
+    df = table.to_pandas(split_blocks=True, types_mapper={pa.string(): pd.StringDtype('pyarrow')}.get)
+    
+    objects_path = os.path.join(directory, 'objects.pkl')
+    if os.path.exists(objects_path):
+        objects = pd.read_pickle(objects_path)
+        for position, column in enumerate(columns):
+            if column in objects.columns:
+                df.insert(position, column, objects[column].to_numpy())
+    return df
@@ -0,0 +1,57 @@
+import json
+import numpy as np
+import pandas as pd
+from datetime import datetime, date
+
+
+def to_number(value):
+    """
+    把单元格值转换为数值
+    
+    表结构中的数值列有无法转换的值(如"15分钟")时整列保持原类型(见table_schema.apply_schema)，
+    其中可以转换的字符串(如"300")在这里转换
+    
+    Args:
+        value: 单元格值
+    
+    Returns:
+        数值，空值或无法转换时返回None
+    """
+    if isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    if isinstance(value, bool) or not pd.api.types.is_number(value) or pd.isna(value):
+        return None
+    return value
+
+
+def to_storage_value(value):
+    """
+    把DataFrame中的单元格值转换为可持久化的Python原生值
+    
+    空值(NaN/NaT)转为None，时间转为字符串(零点的时间只保留日期)，
+    numpy标量转为Python标量，列表和字典转为JSON字符串
+    
+    Args:
+        value: 单元格值
+    
+    Returns:
+        转换后的值
+    """
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, ensure_ascii=False)
+    if value is None or pd.isna(value):
+        return None
+    if isinstance(value, np.datetime64):
+        value = pd.Timestamp(value)
+    if isinstance(value, datetime):
+        if (value.hour, value.minute, value.second, value.microsecond) == (0, 0, 0, 0):
+            return value.strftime('%Y-%m-%d')
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(value, date):
+        return value.strftime('%Y-%m-%d')
+    if isinstance(value, np.generic):
+        return value.item()
+    return value